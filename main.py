@@ -14,7 +14,9 @@ from src.postprocess import postprocess_data, get_data_paths_iterative, \
 
 from src.linking import execute_linking
 from src.evaluation import execute_evaluation
+from src.preprocessing.prep_store import save_prep_year
 from utility.utils import parse_arguments, check_gpu, save_data_intermediate
+from utility.sharding import apply_shard
 
 
 def setup_logging():
@@ -42,7 +44,9 @@ def finish_data(conf: dict, tasks: list) -> None:
 
     magazines = get_data_paths_iterative(conf)
     # post
-    postprocessed_data = execute_postprocessing(magazines, conf["BATCH_SIZE"])
+    postprocessed_data = execute_postprocessing(
+        magazines, conf["BATCH_SIZE"], conf.get("PATH_TO_STRUCTURE_CACHE")
+    )
     # agg
     aggregated_data = execute_aggregation(postprocessed_data)
     # link
@@ -82,12 +86,40 @@ def main():
                     all the magazines we have ground-truth data for."
             )
 
+    if args.shard:
+        # every node runs on its own share of the years and writes into its
+        # own output subtree, see utility.sharding
+        apply_shard(conf, *args.shard)
+        logging.info("Running shard %s of %s with %s years.", args.shard[0],
+                     args.shard[1], len(conf["SHARD_YEARS"]))
+
+    preprocessed_data = None
     if "prep" in tasks:
-        preprocessed_data = execute_preprocessing(conf)
+        binary_output = conf.get("PREP_OUTPUT_FORMAT", "json") == "binary"
+        # Streaming only pays off if the sentences go straight to the tagger,
+        # columnar pages also if they are saved in the binary format.
+        # The pipelined preprocessing streams the sentences from a pool of
+        # workers, which runs concurrently with the tagger.
+        conf["PIPELINE_PREPROCESSING"] = (
+            conf.get("PIPELINE_PREPROCESSING", False) and "tag" in tasks
+        )
+        conf["STREAM_PREPROCESSING"] = (
+            conf.get("STREAM_PREPROCESSING", False)
+            or conf["PIPELINE_PREPROCESSING"]
+        ) and "tag" in tasks
+        conf["COLUMNAR_PAGES"] = conf.get("COLUMNAR_PAGES", False) and (
+            "tag" in tasks or binary_output
+        )
+        preprocessed_data = execute_preprocessing(
+            conf, conf["STREAM_PREPROCESSING"]
+        )
         # If we are not going to tag, we save the preprocessed data
         if "tag" not in tasks:
             for year, files in preprocessed_data:
-                save_data_intermediate(year, files, conf, "prep")
+                if binary_output:
+                    save_prep_year(year, files, conf)
+                else:
+                    save_data_intermediate(year, files, conf, "prep")
 
     if "tag" in tasks:
         from src.tag_flair import execute_tagging
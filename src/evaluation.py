@@ -2,6 +2,7 @@ import os
 import logging
 from datetime import datetime
 from utility.evaluation_utils import Paths, Scores, evaluate_person
+from utility.sharding import in_shard
 
 
 def execute_evaluation(conf: dict, eval_level: str, fuzziness: bool) -> None:
@@ -17,6 +18,7 @@ def execute_evaluation(conf: dict, eval_level: str, fuzziness: bool) -> None:
     evaluations straightforward to compare. If you would like to evaluate only\
     one magazine, you need to create a new directory with only that magazine's\
     ground-truth in it, change that path in the config, and then run eval.
+    With "--shard", only the years of the shard are evaluated.
 
     Args:
         conf (dict): Configuration dictionary containing various settings and\
@@ -38,10 +40,17 @@ def execute_evaluation(conf: dict, eval_level: str, fuzziness: bool) -> None:
         global_scores = Scores()
         for magazine in os.listdir(paths.get(type_="gt", key="")):
             paths.update(key="magazine", value=magazine)
+            files = [
+                file
+                for file in os.listdir(paths.get(type_="gt", key="magazine"))
+                # the .txt files are the notes
+                if not file.endswith(".txt") and in_shard(conf, magazine, file)
+            ]
+            if not files and "SHARD" in conf:
+                # none of the years of this magazine are in the shard
+                continue
             magazine_scores = Scores()
-            for file in os.listdir(paths.get(type_="gt", key="magazine")):
-                if file.endswith(".txt"):  # these are the notes
-                    continue
+            for file in files:
                 paths.update(key="file", value=file)
                 gt_file = paths.get_json(type_="gt")
                 eval_file = paths.get_json(type_="link")
@@ -13,11 +13,14 @@ article information from the xml.
 
 import json
 import glob
+from functools import partial
 from multiprocessing import Pool
 import os
 from datetime import datetime
 import logging
-from lxml import etree
+from utility.manifest import get_manifest
+from utility.sharding import in_shard
+from utility.structure_cache import get_structure_paths, load_structure
 from utility.utils import save_data_intermediate
 
 DATA2_MNT = "/mnt/data2/"
@@ -224,7 +227,8 @@ def adjust_information(entitylist: list) -> None:
                 del entity[key]
 
 
-def get_structure_info(year: tuple, custom_path=None) -> dict:
+def get_structure_info(year: tuple, custom_path=None,
+                       structure_cache=None) -> dict:
     """
     Retrieves structural information for a given year from an XML file.
 
@@ -235,6 +239,9 @@ def get_structure_info(year: tuple, custom_path=None) -> dict:
 
         custom_path (str, optional): Path to a custom XML file for debugging.\
             Defaults to None.
+        structure_cache (str, optional): Directory of the structure cache\
+            (PATH_TO_STRUCTURE_CACHE). Defaults to None, i.e.\
+            utility.structure_cache.CACHE_DIR.
 
     Returns:
         dict: A dictionary where keys are page filenames (e.g., "page1.txt")\
@@ -249,6 +256,8 @@ def get_structure_info(year: tuple, custom_path=None) -> dict:
         to the XML file based on the `year` tuple.
         - Handles cases where the XML file is missing or inaccessible by\
         returning an empty dictionary.
+        - The distilled structure is cached locally and shared with the\
+        prep (see utility.structure_cache).
         - Skips journal-level connections and focuses on article-level\
         connections.
         - Extracts the filename for each page by replacing the `.jpg`\
@@ -258,78 +267,15 @@ def get_structure_info(year: tuple, custom_path=None) -> dict:
 
     if custom_path is not None:
         # We can use this for local debugging
-        root = etree.parse(custom_path).getroot()
+        xml_paths = [custom_path]
     else:
-        if short.startswith("bse"):
-            xml_storage = os.path.join(
-                DATA2_MNT,
-                "xml.cache.prod01",
-                short,
-                f"{short.upper()}-{year}.xml"
-            )
-        else:
-            xml_storage = os.path.join(
-                DATA2_MNT,
-                "xml.cache.prod01",
-                short,
-                f"{short}_{year}.xml"
-            )
+        xml_paths = get_structure_paths(DATA2_MNT, short, year)
 
-        try:
-            root = etree.parse(xml_storage).getroot()
-        except Exception:
-            try:
-                xml_storage = xml_storage.replace("prod01", "staging01")
-                root = etree.parse(xml_storage).getroot()
-            except Exception:
-                return {}
-
-    pages_to_articles = {}
-
-    document_id = root.find("./element-list/element[@type='Agora:Document']/attr[@type='Agora:DocumentID']").text
-
-    page_elems = root.findall("./element-list/element[@type='Agora:ImageSet']/element[@type='Agora:Page']")
-
-    for page_elem in page_elems:
-        articles = []
-        idx = page_elem.get("ID")
-        pagenum = page_elem.find("./attr[@type='Agora:PhysicalNo']").text
-        links = root.findall(f"./link-list/link[@to='{idx}']")
-        for link in links:
-            article_idx = link.get("from")
-            # NOTE: Journal-level connections should usually be uninteresting,
-            # so we skip them specifically. For completeness sake, we might
-            # take them in as well though.
-            is_journal = root.find("./element-list/element[@type='Journal'][@ID='{article_idx}']")
-            if is_journal is not None:
-                continue
-            article = root.find("./element-list/element[@type='Journal']//element[@ID='{article_idx}']")
-            articles.append(article_idx)
-
-            # if the first element found was not an article
-            # we look for the first ancestor being one
-            if article.get("type") == "Article":
-                continue
-
-            article_ancestor = article.xpath(
-                "ancestor::element[@type='Article']"
-            )
-            if not article_ancestor:
-                continue
-
-            ancestor_idx = article_ancestor[0].get("ID")
-            articles.append(ancestor_idx)
-
-        resource_id = page_elem.find("./resource-id").text
-        path = root.find("./resource-list/resource[@ID='{resource_id}']/attr[@type='Agora:Path']").text
-        filename = os.path.basename(path).replace(".jpg", ".txt").lower()
-        pages_to_articles[filename] = (
-            document_id + ":" + idx,
-            articles,
-            pagenum
-        )
-
-    return pages_to_articles
+    # parsed once and shared with the prep (see utility.structure_cache)
+    structure = load_structure(xml_paths, structure_cache)
+    if structure is None or structure["pages"] is None:
+        return {}
+    return structure["pages"]
 
 
 def process_page(page: str,
@@ -456,7 +402,7 @@ def process_page(page: str,
                 placeEntitylist.append(entity)
 
 
-def get_found_names(items: tuple) -> list:
+def get_found_names(items: tuple, structure_cache=None) -> list:
     """
     Extracts and processes entity information (person and place names) from\
     tagged files.
@@ -467,6 +413,8 @@ def get_found_names(items: tuple) -> list:
             (e.g., ("abc", "2025")).\n
             - pages (dict): OrderedDict where the keys are filenames and the\
             values are lists of sentences.
+        structure_cache (str, optional): Directory of the structure cache,\
+            see get_structure_info. Defaults to None.
 
     Returns:
         tuple (list, tuple): The first entry is a list of all found entities\
@@ -503,7 +451,8 @@ def get_found_names(items: tuple) -> list:
     year, pages = items
     # get structure information per page in dictionary form (key: pagenumber,
     # value: (information about the structure, pagenumber))
-    structure_info = get_structure_info(year)
+    structure_info = get_structure_info(year,
+                                        structure_cache=structure_cache)
 
     entitylist = []
     placeEntitylist = []
@@ -544,7 +493,8 @@ def get_found_names(items: tuple) -> list:
     return entitylist, year
 
 
-def populate_year_dict(year_dict: dict, file_list: list) -> None:
+def populate_year_dict(year_dict: dict, file_list: list,
+                       manifest=None) -> None:
     """
     Populates a dictionary with year-wise data paths for processing.
 
@@ -554,6 +504,8 @@ def populate_year_dict(year_dict: dict, file_list: list) -> None:
             file paths.\n
         file_list (list): A list of file paths to be processed. The files can\
             be in `.json` or `.jsonl` format.
+        manifest (Manifest, optional): Cached directory listings used instead
+            of globbing (see utility.manifest). Defaults to None.
 
     Notes:
         - For `.json` files, the file path is directly added to the dictionary.
@@ -565,6 +517,11 @@ def populate_year_dict(year_dict: dict, file_list: list) -> None:
         filetype = "." + filename.split(".")[-1]
         if filetype == ".json":
             value = filename
+        elif filetype == ".jsonl" and manifest is not None:
+            value = manifest.glob(
+                os.path.dirname(filename),
+                os.path.basename(filename).replace(".jsonl", "*.jsonl")
+            )
         elif filetype == ".jsonl":
             value = sorted(glob.glob(filename.replace(".jsonl", "*.jsonl")))
         else:
@@ -594,7 +551,16 @@ def get_data_paths_iterative(conf: dict):
     Yields:
         dict: A dictionary where keys are tuples of (magazine shortname, year)\
             and values are file paths or lists of file paths.
+
+    Note:
+        If "PATH_TO_MANIFEST" is set in the conf, the directories are listed
+        with the cached manifest instead of globbing (see utility.manifest).
+        In a sharded run, only the years of the shard are yielded (see
+        utility.sharding).
     """
+    manifest = get_manifest(conf)
+    list_directory = manifest.glob if manifest is not None \
+        else lambda directory: glob.glob(directory + "/*")
     if "CUSTOM_PATHS" in conf:
         inputs = conf["CUSTOM_PATHS"]
     else:
@@ -615,14 +581,16 @@ def get_data_paths_iterative(conf: dict):
         ]
         inputs_magazine_year_level = []
 
-        magazine_folder = sorted(glob.glob(conf["PATH_TO_INPUT_FOLDERS"]+"/*"))
+        if manifest is not None:
+            manifest.crawl(conf["PATH_TO_INPUT_FOLDERS"])
+        magazine_folder = sorted(list_directory(conf["PATH_TO_INPUT_FOLDERS"]))
         for magazine in magazine_folder:
             if (
                 len(os.path.basename(magazine)) == LEN_MAGAZINE_SHORTNAME
                 or os.path.basename(magazine) in inconsistent_magazine_names
             ):
                 # it's a magazine directory.
-                year_directories = sorted(glob.glob(magazine + "/*"))
+                year_directories = sorted(list_directory(magazine))
                 inputs_magazine_year_level += year_directories
         inputs = inputs_magazine_year_level
 
@@ -637,21 +605,30 @@ def get_data_paths_iterative(conf: dict):
         )
     ):
         # process everything in the tag folder
-        inputs = glob.glob(inputs + "/*")
+        if manifest is not None:
+            manifest.crawl(inputs, depth=1)
+        inputs = list_directory(inputs)
 
     if inputs == []:
         raise Exception(f"No valid data paths found in {conf}")
 
     for mag_year_path in inputs:
         if os.path.isdir(mag_year_path):
-            populate_year_dict(year_dict, glob.glob(mag_year_path + "/*"))
+            populate_year_dict(year_dict, list_directory(mag_year_path),
+                               manifest)
         elif os.path.isfile(mag_year_path):
-            populate_year_dict(year_dict, [mag_year_path])
+            populate_year_dict(year_dict, [mag_year_path], manifest)
         else:
             raise Exception(f'The given input: {inputs} is neither a valid directory, nor a valid file.')
+        for key in [key for key in year_dict
+                    if not in_shard(conf, key[0], key[1])]:
+            # a sharded run only reads the years of its shard
+            del year_dict[key]
         if len(year_dict) >= conf["BATCH_SIZE"]:
             yield year_dict
             year_dict = {}
+    if manifest is not None:
+        manifest.save()
     yield year_dict
 
 
@@ -681,7 +658,9 @@ def postprocess_data(conf: dict, tasks: list) -> None:
     if "CUSTOM_PATH" not in conf:
         conf["PATH_TO_INPUT_FOLDERS"] = conf["PATH_TO_OUTFILE_FOLDER"] + "tag"
     magazines = get_data_paths_iterative(conf)
-    postprocessed_data = execute_postprocessing(magazines, conf["BATCH_SIZE"])
+    postprocessed_data = execute_postprocessing(
+        magazines, conf["BATCH_SIZE"], conf.get("PATH_TO_STRUCTURE_CACHE")
+    )
     if "agg" not in tasks:
         for year, data in postprocessed_data:
             save_data_intermediate(year, data, conf, "post")
@@ -689,13 +668,16 @@ def postprocess_data(conf: dict, tasks: list) -> None:
     return postprocessed_data
 
 
-def execute_postprocessing(magazines: dict, batch_size: int):
+def execute_postprocessing(magazines: dict, batch_size: int,
+                           structure_cache=None):
     """Postprocess the magazines given.
 
     Args:
         magazines (dict): Keys are years, values is the data after\
             tagging / aggregation.\n
         batch_size (int): Batch size for years to process together.
+        structure_cache (str, optional): Directory of the structure cache\
+            (PATH_TO_STRUCTURE_CACHE). Defaults to None.
 
     Yields:
         tuple ((year,magazine), dict): The first value of the tuple is another\
@@ -705,7 +687,10 @@ def execute_postprocessing(magazines: dict, batch_size: int):
     """
     for data in magazines:
         with Pool(batch_size) as p:
-            postprocessed_years = p.map(get_found_names, data.items())
+            postprocessed_years = p.map(
+                partial(get_found_names, structure_cache=structure_cache),
+                data.items()
+            )
         for data, year in postprocessed_years:
             logging.info("Postprocessed: %s", year)
             yield year, data
@@ -0,0 +1,176 @@
+#! /usr/bin/python3
+
+"""
+Compact columnar representation of a preprocessed page.
+
+Instead of one dictionary per token with a coordinate string like
+"366,447,672,61:main", a page is stored as one string with all tokens and a
+few NumPy arrays. This is much smaller in memory and much cheaper to pickle when
+the pages are sent from the preprocessing workers to the tagger.
+"""
+
+import re
+
+import numpy as np
+
+# Kind codes of the tokens, the index is stored in PageColumns.kinds
+KINDS = ("main", "lpunc", "rpunc")
+KIND_CODES = {kind: code for code, kind in enumerate(KINDS)}
+
+# Only coordinates that can be restored exactly from integers are accepted
+# (no signs or leading zeros).
+BOX_PATTERN = re.compile(
+    r"(0|[1-9]\d*),(0|[1-9]\d*),(0|[1-9]\d*),(0|[1-9]\d*)$"
+)
+
+
+class PageColumns:
+    """The sentences of a single page in columnar form.
+
+    Attributes:
+        text (str): All tokens of the page concatenated.
+        token_offsets (np.ndarray): int32, token i is
+         text[token_offsets[i]:token_offsets[i + 1]].
+        kinds (np.ndarray): int8 kind code per token, see KINDS.
+        boxes (np.ndarray): int32 array of shape (number of boxes, 4) with
+         the x, y, w, h of all boxes. Fused words have several boxes.
+        box_offsets (np.ndarray): int32, the boxes of token i are
+         boxes[box_offsets[i]:box_offsets[i + 1]].
+        sentence_offsets (np.ndarray): int32, the tokens of sentence j are
+         the tokens sentence_offsets[j] to sentence_offsets[j + 1] - 1.
+    """
+
+    __slots__ = ("text", "token_offsets", "kinds", "boxes", "box_offsets",
+                 "sentence_offsets")
+
+    def __init__(self, text, token_offsets, kinds, boxes, box_offsets,
+                 sentence_offsets):
+        self.text = text
+        self.token_offsets = token_offsets
+        self.kinds = kinds
+        self.boxes = boxes
+        self.box_offsets = box_offsets
+        self.sentence_offsets = sentence_offsets
+
+    def __getstate__(self):
+        return tuple(getattr(self, slot) for slot in self.__slots__)
+
+    def __setstate__(self, state):
+        for slot, value in zip(self.__slots__, state):
+            setattr(self, slot, value)
+
+    def __len__(self) -> int:
+        return len(self.sentence_offsets) - 1
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, PageColumns):
+            return NotImplemented
+        return (self.text == other.text
+                and np.array_equal(self.token_offsets, other.token_offsets)
+                and np.array_equal(self.kinds, other.kinds)
+                and np.array_equal(self.boxes, other.boxes)
+                and np.array_equal(self.box_offsets, other.box_offsets)
+                and np.array_equal(self.sentence_offsets,
+                                   other.sentence_offsets))
+
+    @classmethod
+    def from_sentences(cls, sentences: list) -> "PageColumns":
+        """Converts the output of preprocess_file into columns.
+
+        Args:
+            sentences (list): List of sentences, each a list of token
+             dictionaries with "token" and "coord" keys.
+
+        Raises:
+            ValueError: If a coordinate can't be restored exactly from the
+             columnar form.
+
+        Returns:
+            PageColumns: The columnar page.
+        """
+        tokens = []
+        token_offsets = [0]
+        length = 0
+        kinds = []
+        boxes = []
+        box_offsets = [0]
+        sentence_offsets = [0]
+        for sentence in sentences:
+            for token in sentence:
+                coord, _, kind = token["coord"].rpartition(":")
+                if kind not in KIND_CODES:
+                    raise ValueError("Unknown token kind: " + token["coord"])
+                for box in coord.split(";"):
+                    match = BOX_PATTERN.match(box)
+                    if match is None:
+                        raise ValueError("Unexpected coordinates: " + coord)
+                    boxes.append(match.groups())
+                tokens.append(token["token"])
+                length += len(token["token"])
+                token_offsets.append(length)
+                kinds.append(KIND_CODES[kind])
+                box_offsets.append(len(boxes))
+            sentence_offsets.append(len(tokens))
+        return cls(
+            "".join(tokens),
+            np.array(token_offsets, dtype=np.int32),
+            np.array(kinds, dtype=np.int8),
+            np.array(boxes, dtype=np.int32).reshape(-1, 4),
+            np.array(box_offsets, dtype=np.int32),
+            np.array(sentence_offsets, dtype=np.int32),
+        )
+
+    def iter_sentences(self):
+        """Yields the sentences in the form the tagger needs them.
+
+        Yields:
+            list: One (text, coord, token) tuple per token, where text is the
+             normalized token used for tagging.
+        """
+        # plain lists are a lot faster to index than NumPy arrays
+        boxes = [",".join(map(str, box)) for box in self.boxes.tolist()]
+        token_offsets = self.token_offsets.tolist()
+        box_offsets = self.box_offsets.tolist()
+        kinds = self.kinds.tolist()
+        sentence_offsets = self.sentence_offsets.tolist()
+        for start, end in zip(sentence_offsets[:-1], sentence_offsets[1:]):
+            sentence = []
+            for i in range(start, end):
+                token = self.text[token_offsets[i]:token_offsets[i + 1]]
+                text = token.title() if token.isupper() else token
+                coord = ";".join(boxes[box_offsets[i]:box_offsets[i + 1]])
+                sentence.append((text, coord + ":" + KINDS[kinds[i]], token))
+            yield sentence
+
+    def to_sentences(self) -> list:
+        """Converts the columns back into the output of preprocess_file.
+
+        Returns:
+            list: List of sentences, each a list of token dictionaries.
+        """
+        sentences = []
+        for sentence in self.iter_sentences():
+            new_sentence = []
+            for text, coord, token in sentence:
+                token_dict = {"token": token, "coord": coord}
+                if token.isupper():
+                    token_dict["normalized"] = text
+                new_sentence.append(token_dict)
+            sentences.append(new_sentence)
+        return sentences
+
+
+def encode_page(sentences: list):
+    """Converts the sentences of a page into PageColumns if possible.
+
+    Args:
+        sentences (list): The output of preprocess_file.
+
+    Returns:
+        PageColumns or list: The columnar page, or the unchanged sentences if
+         they can't be represented exactly.
+    """
+    try:
+        return PageColumns.from_sentences(sentences)
+    except ValueError:
+        return sentences
@@ -0,0 +1,195 @@
+#! /usr/bin/python3
+
+"""
+Access to the OCR pages, either as plain files or straight out of zip
+archives without extracting them.
+
+Pages inside an archive are addressed with the archive as a directory, e.g.
+"/input/grs.zip/1990_000/grs-001_1990_000_0001.txt" for a magazine archive
+or "/input/obl/2004_000.zip/obl-001_2004_000_0001.txt" for a year archive.
+Every process keeps one open handle per archive.
+"""
+
+from functools import lru_cache
+import glob
+import io
+import os
+import posixpath
+import zipfile
+
+ARCHIVE_SUFFIX = ".zip"
+
+# archive path -> (process id, open ZipFile), handles must not be shared
+# between the worker processes
+_ARCHIVES = {}
+
+
+@lru_cache(maxsize=None)
+def is_archive(path: str) -> bool:
+    """Whether the path is a zip archive (and not e.g. a directory whose name
+    ends in .zip)."""
+    return path.endswith(ARCHIVE_SUFFIX) and os.path.isfile(path)
+
+
+def split_archive_path(path: str) -> tuple:
+    """Splits a path into the archive and the path inside the archive.
+
+    Args:
+        path (str): Path to a page or year directory.
+
+    Returns:
+        tuple: The path to the archive and the inner path, or None and the
+         unchanged path if the path isn't inside an archive.
+    """
+    if ARCHIVE_SUFFIX not in path:
+        return None, path
+    parts = path.rstrip("/").split("/")
+    for i, part in enumerate(parts):
+        if part.endswith(ARCHIVE_SUFFIX):
+            archive = "/".join(parts[:i + 1])
+            if is_archive(archive):
+                return archive, "/".join(parts[i + 1:])
+    return None, path
+
+
+def get_archive(archive: str) -> zipfile.ZipFile:
+    """Returns the open handle of the archive for the current process.
+
+    Args:
+        archive (str): Path to the zip archive.
+
+    Returns:
+        zipfile.ZipFile: The opened archive.
+    """
+    pid, handle = _ARCHIVES.get(archive, (None, None))
+    if pid != os.getpid():
+        handle = zipfile.ZipFile(archive)
+        _ARCHIVES[archive] = (os.getpid(), handle)
+    return handle
+
+
+def get_year_name(year_directory: str) -> list:
+    """Returns the magazine and year of a year directory, e.g.
+    ["obl", "2004_000"] for "/input/obl/2004_000.zip" or
+    ["grs", "1990_000"] for "/input/grs.zip/1990_000".
+
+    Args:
+        year_directory (str): Path to the year directory or archive.
+
+    Returns:
+        list: The magazine shortname and the year.
+    """
+    return [
+        part[:-len(ARCHIVE_SUFFIX)] if part.endswith(ARCHIVE_SUFFIX)
+        else part
+        for part in os.path.normpath(year_directory).split(os.sep)[-2:]
+    ]
+
+
+def find_year_directory(input_folder: str, magazine: str, year: str) -> str:
+    """Finds a year in the input folder, either as directory or inside a
+    magazine or year archive.
+
+    Args:
+        input_folder (str): Path to the folder with the magazines.
+        magazine (str): The magazine shortname.
+        year (str): The year, e.g. "2004_000".
+
+    Returns:
+        str: Path to the year directory or archive. If the year is not
+         found, the path of a plain year directory.
+    """
+    candidates = [
+        os.path.join(input_folder, magazine, year),
+        os.path.join(input_folder, magazine, year + ARCHIVE_SUFFIX),
+        os.path.join(input_folder, magazine + ARCHIVE_SUFFIX, year),
+    ]
+    for candidate in candidates:
+        if os.path.isdir(candidate) or is_archive(candidate) or \
+                split_archive_path(candidate)[0] is not None:
+            return candidate
+    return candidates[0]
+
+
+def list_year_directories(magazine: str, manifest=None) -> list:
+    """Lists the years of a magazine directory or archive.
+
+    Args:
+        magazine (str): Path to the magazine directory or archive.
+        manifest (Manifest, optional): Cached directory listings (see
+         utility.manifest). Defaults to None.
+
+    Returns:
+        list: Sorted paths to the year directories.
+    """
+    if not is_archive(magazine):
+        if manifest is not None:
+            return manifest.glob(magazine)
+        return sorted(glob.glob(magazine + "/*"))
+    return sorted({
+        magazine + "/" + posixpath.dirname(name)
+        for name in get_archive(magazine).namelist()
+        if name.endswith(".txt") and "/" in name
+    })
+
+
+def list_year_pages(year_directory: str, manifest=None) -> list:
+    """Lists the OCR pages (.txt files) of a year.
+
+    Args:
+        year_directory (str): Path to the year directory, which can be an
+         archive itself or inside an archive.
+        manifest (Manifest, optional): Cached directory listings (see
+         utility.manifest). Defaults to None.
+
+    Returns:
+        list: Sorted paths to the pages.
+    """
+    archive, inner = split_archive_path(year_directory)
+    if archive is None:
+        if manifest is not None:
+            return manifest.glob(year_directory, "*.txt")
+        return sorted(glob.glob(year_directory + "/*.txt"))
+    pages = []
+    for name in get_archive(archive).namelist():
+        if not name.endswith(".txt"):
+            continue
+        # a year archive contains only the pages of that year
+        if inner and posixpath.dirname(name) != inner:
+            continue
+        pages.append(archive + "/" + name)
+    return sorted(pages)
+
+
+def get_page_size(infile: str, manifest=None) -> int:
+    """Returns the (uncompressed) size of a page in bytes.
+
+    Args:
+        infile (str): Path to the page.
+        manifest (Manifest, optional): Cached directory listings (see
+         utility.manifest). Defaults to None.
+
+    Returns:
+        int: The size of the page.
+    """
+    archive, inner = split_archive_path(infile)
+    if archive is None:
+        if manifest is not None:
+            return manifest.get_size(infile)
+        return os.path.getsize(infile)
+    return get_archive(archive).getinfo(inner).file_size
+
+
+def open_page(infile: str):
+    """Opens a page for reading.
+
+    Args:
+        infile (str): Path to the page.
+
+    Returns:
+        TextIO: The opened page, to be used as a context manager.
+    """
+    archive, inner = split_archive_path(infile)
+    if archive is None:
+        return open(infile, encoding="utf8")
+    return io.TextIOWrapper(get_archive(archive).open(inner), encoding="utf8")
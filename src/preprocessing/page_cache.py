@@ -0,0 +1,133 @@
+#! /usr/bin/python3
+
+"""
+Content-addressed on-disk cache for preprocessed pages.
+
+A page is stored under the hash of its content together with a fingerprint
+of the preprocessing settings (abbreviation file, PreprocessConfig values),
+so a rerun only preprocesses the pages that changed. If the abbreviations
+or settings change, all keys change and the old entries are evicted over
+time.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+# Bump this whenever the preprocessing output changes for the same input,
+# so old cache entries aren't used anymore.
+PREP_CACHE_VERSION = "1"
+DEFAULT_MAX_MB = 2048
+
+
+def page_cache_key(content: str, fingerprint: str) -> str:
+    """Returns the cache key of a page.
+
+    Args:
+        content (str): The raw content of the OCR page.
+        fingerprint (str): Fingerprint of the preprocessing settings.
+
+    Returns:
+        str: Hex digest identifying the preprocessed page.
+    """
+    sha = hashlib.sha256()
+    sha.update(PREP_CACHE_VERSION.encode("utf8"))
+    sha.update(fingerprint.encode("utf8"))
+    sha.update(content.encode("utf8"))
+    return sha.hexdigest()
+
+
+def get_cache_path(cache_dir: str, key: str) -> str:
+    """Path of the cache entry for the given key. The entries are spread
+    over 256 subdirectories to keep the directories small."""
+    return os.path.join(cache_dir, key[:2], key + ".json")
+
+
+def load_cached_page(cache_dir: str, key: str):
+    """Loads a preprocessed page from the cache.
+
+    Args:
+        cache_dir (str): Path to the cache directory.
+        key (str): Cache key of the page.
+
+    Returns:
+        list: The cached sentences, or None if the page is not cached.
+    """
+    path = get_cache_path(cache_dir, key)
+    try:
+        with open(path, encoding="utf8") as inf:
+            sentences = json.load(inf)
+    except (OSError, ValueError):
+        return None
+    try:
+        # mark the entry as recently used for the eviction
+        os.utime(path)
+    except OSError:
+        pass
+    return sentences
+
+
+def store_cached_page(cache_dir: str, key: str, sentences: list) -> None:
+    """Stores a preprocessed page in the cache. The file is written to a
+    temporary file first and then renamed, so concurrent workers never read
+    half-written entries.
+
+    Args:
+        cache_dir (str): Path to the cache directory.
+        key (str): Cache key of the page.
+        sentences (list): The preprocessed sentences of the page.
+    """
+    path = get_cache_path(cache_dir, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path),
+                                    suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode="w", encoding="utf8") as out:
+            json.dump(sentences, out)
+        os.replace(tmp_path, path)
+    except OSError:
+        logging.warning("Could not write %s to the prep cache.", key)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def evict_page_cache(cache_dir: str, max_mb: int = DEFAULT_MAX_MB) -> int:
+    """Removes the least recently used entries until the cache is smaller
+    than max_mb megabytes.
+
+    Args:
+        cache_dir (str): Path to the cache directory.
+        max_mb (int, optional): Maximum size of the cache in megabytes.
+         Defaults to DEFAULT_MAX_MB.
+
+    Returns:
+        int: The number of removed entries.
+    """
+    entries = []
+    total_size = 0
+    if not os.path.isdir(cache_dir):
+        return 0
+    for subdir in os.scandir(cache_dir):
+        if not subdir.is_dir():
+            continue
+        for entry in os.scandir(subdir.path):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total_size += stat.st_size
+
+    max_size = max_mb * 1024 * 1024
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total_size <= max_size:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total_size -= size
+        removed += 1
+    if removed:
+        logging.info("Evicted %s pages from the prep cache.", removed)
+    return removed
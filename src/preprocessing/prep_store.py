@@ -0,0 +1,226 @@
+#! /usr/bin/python3
+
+"""
+Binary, memory-mappable storage for the output of the "prep" task.
+
+A prepared year is written into a single .prep file: a small JSON header
+with a page index, followed by the concatenated arrays of all its
+PageColumns. Opening such a file only reads the header, the arrays are
+memory-mapped and a page is only materialized when it is accessed.
+
+Layout:
+    MAGIC (8 bytes) | header length (uint64, little-endian) | header (JSON)
+    | arrays, each starting at a multiple of 8 bytes
+"""
+
+from collections import OrderedDict
+from collections.abc import Mapping
+import glob
+import json
+import logging
+import os
+import struct
+
+import numpy as np
+
+from src.preprocessing.columns import PageColumns, encode_page
+from src.preprocessing.input_files import get_year_name
+from utility.sharding import in_shard
+
+MAGIC = b"CHNPREP1"
+PREP_SUFFIX = ".prep"
+ALIGNMENT = 8
+# name of the array -> dtype on disk
+ARRAY_DTYPES = OrderedDict([
+    ("text", "u1"),
+    ("token_offsets", "<i4"),
+    ("kinds", "i1"),
+    ("boxes", "<i4"),
+    ("box_offsets", "<i4"),
+    ("sentence_offsets", "<i4"),
+])
+
+
+def get_prep_path(year: tuple, conf: dict) -> str:
+    """Path of the .prep file of the given year, named like the other
+    intermediate outputs (see utility.utils.save_data_intermediate).
+
+    Args:
+        year (tuple): The magazine shortname followed by the year (parts).
+        conf (dict): A dictionary describing various paths and settings.
+
+    Returns:
+        str: Path to the .prep file.
+    """
+    return os.path.join(conf["PATH_TO_OUTFILE_FOLDER"], "prep", year[0],
+                        "".join(year[1:]) + PREP_SUFFIX)
+
+
+def write_prep_file(path: str, files: dict) -> None:
+    """Writes the preprocessed pages of a year into a .prep file.
+
+    Args:
+        path (str): Path of the file to write.
+        files (dict): Page names as keys, the values are PageColumns or the
+         sentences as returned by preprocess_file. Pages that can't be
+         stored in columnar form are kept as JSON in the header.
+    """
+    chunks = {name: [] for name in ARRAY_DTYPES}
+    sizes = {name: 0 for name in ARRAY_DTYPES}
+    pages = []
+    for name, page in files.items():
+        if not isinstance(page, PageColumns):
+            page = encode_page(page)
+        if not isinstance(page, PageColumns):
+            pages.append({"name": name, "sentences": page})
+            continue
+        arrays = {
+            "text": np.frombuffer(page.text.encode("utf8"), dtype=np.uint8),
+            "token_offsets": page.token_offsets,
+            "kinds": page.kinds,
+            "boxes": page.boxes.reshape(-1),
+            "box_offsets": page.box_offsets,
+            "sentence_offsets": page.sentence_offsets,
+        }
+        entry = {"name": name}
+        for array_name, array in arrays.items():
+            # start and end of this page within the concatenated array
+            entry[array_name] = [sizes[array_name],
+                                 sizes[array_name] + len(array)]
+            sizes[array_name] += len(array)
+            chunks[array_name].append(
+                array.astype(ARRAY_DTYPES[array_name], copy=False)
+            )
+        pages.append(entry)
+
+    array_specs = OrderedDict()
+    offset = 0
+    for array_name, dtype in ARRAY_DTYPES.items():
+        array_specs[array_name] = {"offset": offset, "length": sizes[array_name]}
+        offset += sizes[array_name] * np.dtype(dtype).itemsize
+        offset += -offset % ALIGNMENT
+    header = json.dumps({"arrays": array_specs, "pages": pages}).encode("utf8")
+    data_start = len(MAGIC) + 8 + len(header)
+    data_start += -data_start % ALIGNMENT
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, mode="wb") as out:
+        out.write(MAGIC)
+        out.write(struct.pack("<Q", len(header)))
+        out.write(header)
+        for array_name, spec in array_specs.items():
+            out.write(b"\0" * (data_start + spec["offset"] - out.tell()))
+            for chunk in chunks[array_name]:
+                out.write(chunk.tobytes())
+    os.replace(tmp_path, path)
+
+
+class PrepYearFile(Mapping):
+    """Read-only, memory-mapped view of a .prep file.
+
+    It behaves like the dictionary returned by the preprocessing, i.e. the
+    keys are the page names and the values are PageColumns (or the plain
+    sentences for pages that couldn't be stored in columnar form).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, mode="rb") as inf:
+            if inf.read(len(MAGIC)) != MAGIC:
+                raise ValueError(path + " is not a .prep file.")
+            (header_length,) = struct.unpack("<Q", inf.read(8))
+            header = json.loads(inf.read(header_length))
+        data_start = len(MAGIC) + 8 + header_length
+        data_start += -data_start % ALIGNMENT
+
+        buffer = np.memmap(path, dtype=np.uint8, mode="r")
+        self._arrays = {}
+        for array_name, dtype in ARRAY_DTYPES.items():
+            spec = header["arrays"][array_name]
+            start = data_start + spec["offset"]
+            end = start + spec["length"] * np.dtype(dtype).itemsize
+            self._arrays[array_name] = buffer[start:end].view(dtype)
+        self._pages = OrderedDict(
+            (page["name"], page) for page in header["pages"]
+        )
+
+    def __getitem__(self, name: str):
+        page = self._pages[name]
+        if "sentences" in page:
+            return page["sentences"]
+        arrays = {
+            array_name: array[page[array_name][0]:page[array_name][1]]
+            for array_name, array in self._arrays.items()
+        }
+        return PageColumns(
+            arrays["text"].tobytes().decode("utf8"),
+            arrays["token_offsets"],
+            arrays["kinds"],
+            arrays["boxes"].reshape(-1, 4),
+            arrays["box_offsets"],
+            arrays["sentence_offsets"],
+        )
+
+    def __iter__(self):
+        return iter(self._pages)
+
+    def __len__(self) -> int:
+        return len(self._pages)
+
+
+def save_prep_year(year: tuple, files: dict, conf: dict) -> None:
+    """Saves a preprocessed year as .prep file into the "prep" folder of the
+    outfile folder.
+
+    Args:
+        year (tuple): The magazine shortname followed by the year (parts).
+        files (dict): The preprocessed pages of that year.
+        conf (dict): A dictionary describing various paths and settings.
+    """
+    write_prep_file(get_prep_path(year, conf), files)
+
+
+def iter_prep_years(conf: dict):
+    """Opens the prepared years, either the ones given in "CUSTOM_PATHS"
+    (year directories of the input) or all years in the "prep" folder, of
+    the shard if the run is sharded (see utility.sharding).
+
+    Args:
+        conf (dict): A dictionary describing various paths and settings.
+
+    Raises:
+        FileNotFoundError: If there are no prepared years at all, e.g.
+         because the prep task wrote JSON files (PREP_OUTPUT_FORMAT) or ran
+         with another outfile folder.
+
+    Yields:
+        tuple: The year as (magazine, year) and its PrepYearFile.
+    """
+    prep_folder = os.path.join(conf["PATH_TO_OUTFILE_FOLDER"], "prep")
+    if "CUSTOM_PATHS" in conf:
+        prep_paths = []
+        for year_directory in conf["CUSTOM_PATHS"]:
+            magazine, year = get_year_name(year_directory)
+            base = os.path.join(prep_folder, magazine, year)
+            year_paths = glob.glob(base + PREP_SUFFIX)
+            # chunks of large years, e.g. 1980_000-00.prep
+            year_paths.extend(sorted(glob.glob(base + "-*" + PREP_SUFFIX)))
+            if not year_paths:
+                logging.error("No prepared year for %s in %s.",
+                              year_directory, prep_folder)
+            prep_paths.extend(year_paths)
+    else:
+        prep_paths = sorted(glob.glob(
+            os.path.join(prep_folder, "*", "*" + PREP_SUFFIX)
+        ))
+    if not prep_paths:
+        raise FileNotFoundError(
+            f"No prepared years found in {prep_folder}. Run the prep task "
+            "with the binary PREP_OUTPUT_FORMAT first."
+        )
+    for path in prep_paths:
+        magazine = os.path.basename(os.path.dirname(path))
+        year = os.path.basename(path)[:-len(PREP_SUFFIX)]
+        if in_shard(conf, magazine, year):
+            yield (magazine, year), PrepYearFile(path)
@@ -11,6 +11,7 @@ TODO:
     - XVII und so
 """
 
+import hashlib
 import json
 import os
 import pprint as pp
@@ -19,14 +20,41 @@ import string
 import sys
 import logging
 import glob
+import queue
+import threading
 from datetime import datetime
 
-from collections import defaultdict, OrderedDict
+from collections import defaultdict, deque, OrderedDict
 from dataclasses import dataclass, field
 from pathlib import Path
 from typing import List
 from multiprocessing import Pool
 from utility import split_year
+from utility.manifest import get_manifest
+from utility.sharding import in_shard
+from src.preprocessing.columns import PageColumns, encode_page
+from src.preprocessing.input_files import (
+    get_page_size,
+    get_year_name,
+    list_year_directories,
+    list_year_pages,
+    open_page,
+)
+from src.preprocessing.page_cache import (
+    DEFAULT_MAX_MB,
+    evict_page_cache,
+    load_cached_page,
+    page_cache_key,
+    store_cached_page,
+)
+from src.preprocessing.token_index import index_preprocessed_years
+
+# Years with more pages are split (if no memory budget is set)
+MAX_INFILES_SIZE = 1000
+# Measured on the test data: an OCR line ("word x,y,w,h") has about 22 bytes
+# and every token takes about 320 bytes in memory once preprocessed
+INPUT_BYTES_PER_TOKEN = 22
+MEMORY_BYTES_PER_TOKEN = 320
 
 
 @dataclass
@@ -45,6 +73,30 @@ class PreprocessConfig:
     PUNC: str = re.escape(string.punctuation + "«»„—¦¬")
     IN_WORD_SPLITTERS: str = re.escape("/")
     SENTENCE_ENDING: list = field(default_factory=lambda: [".", "!", "?"])
+    ABBREVIATION_MATCHER: "AbbreviationMatcher" = None
+    # Compiled from the settings above in __post_init__, so tokenize doesn't
+    # have to build the patterns for every word.
+    PUNC_PATTERN: re.Pattern = field(init=False, repr=False, compare=False)
+    IN_WORD_SPLIT_PATTERN: re.Pattern = field(
+        init=False, repr=False, compare=False)
+    PERIOD_SPLIT_PATTERN: re.Pattern = field(
+        init=False, repr=False, compare=False)
+    NUMBERING_PATTERN: re.Pattern = field(
+        init=False, repr=False, compare=False)
+    FINGERPRINT: str = field(init=False, repr=False, compare=False,
+                             default=None)
+
+    def __post_init__(self):
+        self.PUNC_PATTERN = re.compile(
+            r"([{}]*)(.+?\.?)([{}]*)$".format(
+                self.PUNC, self.PUNC.replace("-", "")
+            )
+        )
+        self.IN_WORD_SPLIT_PATTERN = re.compile(
+            r"([{}])".format(self.IN_WORD_SPLITTERS)
+        )
+        self.PERIOD_SPLIT_PATTERN = re.compile(r"(\.)[{}]*".format(self.PUNC))
+        self.NUMBERING_PATTERN = re.compile(r"\d{1,2}\.")
 
     def load_abbrevs(self) -> defaultdict:
         """
@@ -86,18 +138,7 @@ class PreprocessConfig:
         """
         with open(self.ABBREVIATION_FILE, encoding="utf8") as inf:
             for line in inf:
-                line = line.rstrip().lower()
-                line = line.split()
-                words_in_abbrev = []
-                for word in line:
-                    word = re.sub(
-                        r"([{}])".format(self.IN_WORD_SPLITTERS), r" \1 ", word
-                    )
-                    word = re.sub(r"(\.)[{}]*".format(self.PUNC), r"\1 ", word)
-                    word = word.rstrip()
-                    for w in word.split(" "):
-                        words_in_abbrev.append(w)
-
+                words_in_abbrev = self.split_abbrev(line)
                 for pos, word in enumerate(words_in_abbrev):
                     self.ABBREVIATION_LIST[word].append(
                         {
@@ -105,6 +146,147 @@ class PreprocessConfig:
                             "after": words_in_abbrev[pos + 1:],
                         }
                     )
+        self.compile_abbrevs()
+
+    def split_abbrev(self, line: str) -> list:
+        """Split a line of the abbreviation file into lowercased words, the
+        same way tokenize splits the words of a page.
+
+        Args:
+            line (str): One abbreviation, e.g. "a. d. O.".
+
+        Returns:
+            list: The words of the abbreviation, e.g. ["a.", "d.", "o."].
+        """
+        words_in_abbrev = []
+        for word in line.rstrip().lower().split():
+            word = self.IN_WORD_SPLIT_PATTERN.sub(r" \1 ", word)
+            word = self.PERIOD_SPLIT_PATTERN.sub(r"\1 ", word)
+            word = word.rstrip()
+            for w in word.split(" "):
+                words_in_abbrev.append(w)
+        return words_in_abbrev
+
+    def compile_abbrevs(self) -> "AbbreviationMatcher":
+        """Compile the loaded abbreviations into an AbbreviationMatcher.
+
+        Every option in ABBREVIATION_LIST describes the full abbreviation as
+        before + [word] + after, so the complete token sequences can be
+        recovered from it and put into a single trie.
+
+        Returns:
+            AbbreviationMatcher: The compiled matcher, which is also stored
+             in ABBREVIATION_MATCHER.
+        """
+        sequences = set()
+        for word, options in self.ABBREVIATION_LIST.items():
+            for option in options:
+                sequences.add(
+                    tuple(option["before"] + [word] + option["after"])
+                )
+        self.ABBREVIATION_MATCHER = AbbreviationMatcher(sequences)
+        return self.ABBREVIATION_MATCHER
+
+    def fingerprint(self) -> str:
+        """Fingerprint of everything that influences the preprocessing
+        output besides the page itself: the content of the abbreviation file
+        and the settings. Used to key the prep cache.
+
+        Returns:
+            str: Hex digest of the abbreviation file and the settings.
+        """
+        if self.FINGERPRINT is None:
+            sha = hashlib.sha256()
+            with open(self.ABBREVIATION_FILE, mode="rb") as inf:
+                sha.update(inf.read())
+            sha.update(json.dumps([
+                self.KONJ,
+                self.PUNC,
+                self.IN_WORD_SPLITTERS,
+                self.SENTENCE_ENDING
+            ]).encode("utf8"))
+            self.FINGERPRINT = sha.hexdigest()
+        return self.FINGERPRINT
+
+
+class AbbreviationMatcher:
+    """Token trie over all (possibly multi-token) abbreviations.
+
+    Instead of checking the before/after context of every option of every
+    token (see check_for_abbrev), the text is scanned once from left to right
+    and every token covered by a complete abbreviation is marked.
+    """
+
+    _END = None  # tokens are always strings, so None can mark a leaf
+
+    def __init__(self, sequences):
+        self.trie = {}
+        for sequence in sequences:
+            node = self.trie
+            for token in sequence:
+                node = node.setdefault(token, {})
+            node[self._END] = True
+
+    def match(self, words: list) -> list:
+        """Mark all words that are part of an abbreviation.
+
+        Args:
+            words (list): The words of the text in order.
+
+        Returns:
+            list: A list of booleans of the same length as words, True if the
+             word at that position is part of an abbreviation. This equals
+             calling check_for_abbrev for every position.
+        """
+        lowered = [word.lower() for word in words]
+        is_abbrev = [False] * len(lowered)
+        for start in range(len(lowered)):
+            node = self.trie
+            pos = start
+            while pos < len(lowered):
+                node = node.get(lowered[pos])
+                if node is None:
+                    break
+                pos += 1
+                if self._END in node:
+                    for covered in range(start, pos):
+                        is_abbrev[covered] = True
+        return is_abbrev
+
+
+# Abbreviation file path -> PreprocessConfig with compiled abbreviations.
+# Filled once per process, either lazily or by the pool initializer.
+_PREPROCESS_CONFIGS = {}
+
+
+def get_preprocess_config(abbreviation_file: str) -> PreprocessConfig:
+    """Returns the PreprocessConfig for the given abbreviation file, loading
+    and compiling the abbreviations only the first time they are requested
+    in this process.
+
+    Args:
+        abbreviation_file (str): Path to the abbreviation file.
+
+    Returns:
+        PreprocessConfig: Config with loaded and compiled abbreviations.
+    """
+    if abbreviation_file not in _PREPROCESS_CONFIGS:
+        preprocess_data = PreprocessConfig(
+            ABBREVIATION_FILE=abbreviation_file
+        )
+        preprocess_data.load_abbrevs()
+        _PREPROCESS_CONFIGS[abbreviation_file] = preprocess_data
+    return _PREPROCESS_CONFIGS[abbreviation_file]
+
+
+def init_preprocess_worker(preprocess_data: PreprocessConfig) -> None:
+    """Pool initializer that registers an already compiled PreprocessConfig,
+    so workers don't have to reload the abbreviation file themselves.
+
+    Args:
+        preprocess_data (PreprocessConfig): Config with loaded abbreviations.
+    """
+    _PREPROCESS_CONFIGS[preprocess_data.ABBREVIATION_FILE] = preprocess_data
 
 
 def fuse_hyphens(content: str, preprocess_data: PreprocessConfig) -> list:
@@ -132,12 +314,25 @@ def fuse_hyphens(content: str, preprocess_data: PreprocessConfig) -> list:
            following token may be fused, preserving coordinate metadata.
         3. Returns the fully assembled words and their combined coordinates.
     """
-    output = []
+    return list(iter_fuse_hyphens(content.split("\n"), preprocess_data))
+
+
+def iter_fuse_hyphens(lines, preprocess_data: PreprocessConfig):
+    """Generator version of fuse_hyphens, which works on any iterable of
+    lines (e.g. an open file) and yields the fused words one by one.
+
+    Args:
+        lines (iterable): Lines of an OCR page, "word coordinates" each.
+        preprocess_data (PreprocessConfig): The preprocessing settings.
+
+    Yields:
+        dict: A "word" (str) and "coord" (list) dictionary per fused word.
+    """
     lastword = None  # There might be multiple ones possible
     maybe_lastword = None
     lastcoord = []
     KONJ = preprocess_data.KONJ
-    for line in content.split("\n"):
+    for line in lines:
         line = line.split()
         if len(line) < 2:
             continue
@@ -158,8 +353,7 @@ def fuse_hyphens(content: str, preprocess_data: PreprocessConfig) -> list:
                 word = maybe_lastword + "-" + word
                 coord = lastcoord + coord
             else:
-                output.append({"word": maybe_lastword + "-",
-                               "coord": lastcoord})
+                yield {"word": maybe_lastword + "-", "coord": lastcoord}
             maybe_lastword = None
             lastcoord = []
         if word[-1] == "¬":
@@ -169,12 +363,11 @@ def fuse_hyphens(content: str, preprocess_data: PreprocessConfig) -> list:
             maybe_lastword = word[:-1]
             lastcoord = coord
         else:
-            output.append({"word": word, "coord": coord})
+            yield {"word": word, "coord": coord}
     if lastword is not None:
-        output.append({"word": lastword, "coord": lastcoord})
+        yield {"word": lastword, "coord": lastcoord}
     elif maybe_lastword is not None:
-        output.append({"word": maybe_lastword, "coord": lastcoord})
-    return output
+        yield {"word": maybe_lastword, "coord": lastcoord}
 
 
 def check_for_abbrev(pos: int,
@@ -315,79 +508,79 @@ def tokenize(content: list, preprocess_data: PreprocessConfig) -> list:
     - Not really tokenizing, but add a modified word element to do this:
     "HANS" => "Hans" (TODO: Test if this actually improves accuracy)
     """
-    output = []
-    temp_word_list = []
-    PUNC = preprocess_data.PUNC
-    IN_WORD_SPLITTERS = preprocess_data.IN_WORD_SPLITTERS
-    for element in content:
-        word = element["word"]
-        coord = element["coord"]
-        rp = re.match(
-            r"([{}]*)(.+?\.?)([{}]*)$".format(
-                PUNC, PUNC.replace("-", "")
-            ), word
-        )
-        lpunc = ""
-        if len(rp.group(1)) > 0:
-            lpunc = rp.group(1)
-        rpunc = ""
-        if len(rp.group(3)) > 0:
-            rpunc = rpunc + rp.group(3)
-        word = rp.group(2)
-
-        # splits = re.split(r"({}+)".format(PUNC.replace(".", "")), word)
-        # if len(splits) > 1:
-        #     pp.pprint(splits)
-        #     word = " ".join([x for x in splits if len(x) > 0])
-        word = re.sub(r"([{}])".format(IN_WORD_SPLITTERS), r" \1 ", word)
-        word = re.sub(r"(\.)[{}]*".format(PUNC), r"\1 ", word)
-
-        word = word.rstrip()
-        words = word.split(" ")
-        words = [x for x in words if x]
-        for i, word in enumerate(words):
-            if i == 0 and i + 1 == len(words):
-                temp_word_list.append((word, coord, rpunc, lpunc))
-            elif i == 0:
-                temp_word_list.append((word, coord, "", lpunc))
-            elif i + 1 == len(words):
-                temp_word_list.append((word, coord, rpunc, ""))
-            else:
-                temp_word_list.append((word, coord, "", ""))
+    return list(iter_tokenize(content, preprocess_data))
+
+
+def iter_tokenize(content, preprocess_data: PreprocessConfig):
+    """Generator version of tokenize.
+
+    The words are consumed lazily, but abbreviations can span several words,
+    so the words of one page are collected before the first token is
+    yielded. Memory is therefore bounded by a single page.
 
-    for pos, (word, coord, rpunc, lpunc) in enumerate(temp_word_list):
-        if lpunc:
-            output.append({"token": lpunc, "coord": ";".join(coord)+":lpunc"})
+    Args:
+        content (iterable): Dictionaries with "word" and "coord" keys, e.g.
+         the output of iter_fuse_hyphens.
+        preprocess_data (PreprocessConfig): The preprocessing settings.
+
+    Yields:
+        dict: The tokens as described in tokenize.
+    """
+    punc_match = preprocess_data.PUNC_PATTERN.match
+    in_word_split = preprocess_data.IN_WORD_SPLIT_PATTERN.sub
+    period_split = preprocess_data.PERIOD_SPLIT_PATTERN.sub
+    numbering_match = preprocess_data.NUMBERING_PATTERN.match
+
+    # Split every word once into its parts. The coordinate string is joined
+    # once per word and shared by all of its tokens.
+    words = []
+    coords = []
+    lpuncs = []
+    rpuncs = []
+    for element in content:
+        lpunc, word, rpunc = punc_match(element["word"]).groups()
+        coord = ";".join(element["coord"])
+        word = period_split(r"\1 ", in_word_split(r" \1 ", word))
+        parts = [x for x in word.split(" ") if x]
+        for i, part in enumerate(parts):
+            words.append(part)
+            coords.append(coord)
+            lpuncs.append(lpunc if i == 0 else "")
+            rpuncs.append(rpunc if i + 1 == len(parts) else "")
+
+    # Abbreviations can span several words, so they need the whole page.
+    matcher = preprocess_data.ABBREVIATION_MATCHER
+    if matcher is None:
+        matcher = preprocess_data.compile_abbrevs()
+    is_abbrev = matcher.match(words)
+
+    for pos, word in enumerate(words):
+        coord = coords[pos]
+        if lpuncs[pos]:
+            yield {"token": lpuncs[pos], "coord": coord + ":lpunc"}
         # word is abbreviated
         if (
-            check_for_abbrev(pos, temp_word_list, preprocess_data)
-            or check_roman_numeral(word.lower())
+            is_abbrev[pos]
+            or check_roman_numeral(word)
             or (len(word) < 5 and word.istitle() and word[-1] == ".")
-            or re.match(r"\d{1,2}\.", word)
+            or numbering_match(word)
         ):
-            word_dict = {"token": word, "coord": ";".join(coord) + ":main"}
-            if word.isupper():
-                word_dict["normalized"] = word.title()
-            output.append(word_dict)
+            period = False
         # word is not abbreviated, but had period
         elif word[-1] == ".":
             word = word[:-1]
-            word_dict = {"token": word, "coord": ";".join(coord) + ":main"}
-            if word.isupper():
-                word_dict["normalized"] = word.title()
-            output.append(word_dict)
-            output.append({"token": ".", "coord": ";".join(coord) + ":rpunc"})
+            period = True
         # no period
         else:
-            word_dict = {"token": word, "coord": ";".join(coord) + ":main"}
-            if word.isupper():
-                word_dict["normalized"] = word.title()
-            output.append(word_dict)
-
-        if len(rpunc) > 0:
-            output.append({"token": rpunc, "coord": ";".join(coord)+":rpunc"})
-
-    return output
+            period = False
+        word_dict = {"token": word, "coord": coord + ":main"}
+        if word.isupper():
+            word_dict["normalized"] = word.title()
+        yield word_dict
+        if period:
+            yield {"token": ".", "coord": coord + ":rpunc"}
+        if rpuncs[pos]:
+            yield {"token": rpuncs[pos], "coord": coord + ":rpunc"}
 
 
 def split_sentences(content: list, preprocess_data: PreprocessConfig) -> list:
@@ -405,21 +598,30 @@ def split_sentences(content: list, preprocess_data: PreprocessConfig) -> list:
         list: A list of lists, where each inner list contains tokens that form
             a sentence.
     """
-    sentences = []
+    return list(iter_split_sentences(content, preprocess_data))
+
+
+def iter_split_sentences(content, preprocess_data: PreprocessConfig):
+    """Generator version of split_sentences, which yields every sentence as
+    soon as its sentence-ending token was read.
+
+    Args:
+        content (iterable): Tokens, e.g. the output of iter_tokenize.
+        preprocess_data (PreprocessConfig): The preprocessing settings.
+
+    Yields:
+        list: The tokens of one sentence.
+    """
     sentence = []
     SENTENCE_ENDING = preprocess_data.SENTENCE_ENDING
     for token in content:
+        sentence.append(token)
         if token["coord"].endswith("rpunc") and \
                 token["token"][-1] in SENTENCE_ENDING:
-            sentence.append(token)
-            sentences.append(sentence)
+            yield sentence
             sentence = []
-        else:
-            sentence.append(token)
     if sentence:
-        sentences.append(sentence)
-
-    return sentences
+        yield sentence
 
 
 def preprocess_file(infile: str, conf: dict) -> list:
@@ -443,45 +645,145 @@ def preprocess_file(infile: str, conf: dict) -> list:
     Example:
         conf = {"PATH_TO_ABBREVIATION_FILE": "/path/to/abbreviation/file"}\n
         sentences = preprocess_file("/path/to/input/file", conf)
+
+    Note:
+        If "PATH_TO_PREP_CACHE" is set in the conf, pages that were already
+        preprocessed with the same abbreviations and settings are read from
+        that cache instead.
     """
-    preprocess_data = PreprocessConfig(
-        ABBREVIATION_FILE=conf["PATH_TO_ABBREVIATION_FILE"]
-    )
-    preprocess_data.load_abbrevs()
-    with open(infile, encoding="utf8") as inf:
+    preprocess_data = get_preprocess_config(conf["PATH_TO_ABBREVIATION_FILE"])
+    with open_page(infile) as inf:
         content = inf.read()
+
+    cache_dir = conf.get("PATH_TO_PREP_CACHE")
+    if cache_dir:
+        key = page_cache_key(content, preprocess_data.fingerprint())
+        sentences = load_cached_page(cache_dir, key)
+        if sentences is not None:
+            return sentences
+
     content = fuse_hyphens(content, preprocess_data)
     content = tokenize(content, preprocess_data)
     sentences = split_sentences(content, preprocess_data)
 
+    if cache_dir:
+        store_cached_page(cache_dir, key, sentences)
+
     return sentences
 
 
-def get_year_chunk_paths(year: str) -> list:
+def iter_preprocess_file(infile: str, conf: dict):
+    """Streaming version of preprocess_file. The file is read line by line
+    and every stage is a generator, so the sentences are yielded one after
+    the other.
+
+    Args:
+        infile (str): Path to the input file to be preprocessed.
+        conf (dict): Configuration dictionary containing the path to the\
+            abbreviation file.
+
+    Yields:
+        list: One sentence, i.e. a list of token dictionaries.
+    """
+    if conf.get("PATH_TO_PREP_CACHE"):
+        # the cache works on whole pages anyway
+        yield from preprocess_file(infile, conf)
+        return
+    preprocess_data = get_preprocess_config(conf["PATH_TO_ABBREVIATION_FILE"])
+    with open_page(infile) as inf:
+        content = iter_fuse_hyphens(inf, preprocess_data)
+        content = iter_tokenize(content, preprocess_data)
+        yield from iter_split_sentences(content, preprocess_data)
+
+
+def cut_by_size(infiles: list, sizes: list, max_size: int) -> list:
+    """Cuts the pages into as few consecutive chunks as possible, none of
+    them larger than max_size (unless a single page is larger), and balances
+    their sizes.
+
+    Args:
+        infiles (list): Paths to the pages in their order.
+        sizes (list): Size of every page.
+        max_size (int): Maximum size of a chunk.
+
+    Returns:
+        list: The chunks as lists of page paths.
+    """
+    def cut(limit: int) -> list:
+        # greedily fill every chunk up to the limit
+        chunks = []
+        chunk = []
+        chunk_size = 0
+        for infile, size in zip(infiles, sizes):
+            if chunk and chunk_size + size > limit:
+                chunks.append(chunk)
+                chunk = []
+                chunk_size = 0
+            chunk.append(infile)
+            chunk_size += size
+        chunks.append(chunk)
+        return chunks
+
+    chunk_count = len(cut(max_size))
+    # the smallest limit that still needs no more chunks balances them best
+    low, high = 1, max_size
+    while low < high:
+        middle = (low + high) // 2
+        if len(cut(middle)) <= chunk_count:
+            high = middle
+        else:
+            low = middle + 1
+    return cut(low)
+
+
+def get_year_chunk_paths(year: str,
+                         memory_budget_mb: int = 0,
+                         manifest=None,
+                         structure_cache=None) -> list:
     """Chunks the pages of the given year path.
 
+    Without a memory budget, years with more than 1000 pages are split by
+    split_year.split_directory. With a budget, a year is split into
+    consecutive chunks balanced by the size of the pages, so that the
+    estimated memory of the preprocessed sentences of a chunk stays below
+    the budget.
+
     Args:
-        year (str): Path to the year folder.
+        year (str): Path to the year folder. It can also be a zip archive or
+         a folder inside one (see src.preprocessing.input_files).
+        memory_budget_mb (int, optional): Memory budget per chunk in
+         megabytes. Defaults to 0, i.e. no budget.
+        manifest (Manifest, optional): Cached directory listings (see
+         utility.manifest). Defaults to None, i.e. the year is listed.
+        structure_cache (str, optional): Directory of the structure cache
+         (PATH_TO_STRUCTURE_CACHE), see split_year.split_directory.
+         Defaults to None.
 
     Returns:
         list: Chunked files per year as list of lists.
     """
-    infiles = sorted(glob.glob(year + "/*.txt"))
-    MAX_INFILES_SIZE = 1000
-    if len(infiles) > MAX_INFILES_SIZE:
-        chunk_list = split_year.split_directory(year)
-        return [
-            (
-                tuple(
-                    os.path.normpath(year).split(os.sep)[-2:]
-                    + ["-", str(chunk_name).zfill(2)]
-                ),
-                pagepaths,
-            )
-            for chunk_name, pagepaths in chunk_list
-        ]
+    infiles = list_year_pages(year, manifest)
+    year_name = get_year_name(year)
+    if memory_budget_mb:
+        sizes = [get_page_size(infile, manifest) for infile in infiles]
+        max_size = (memory_budget_mb * 1024 * 1024 // MEMORY_BYTES_PER_TOKEN
+                    * INPUT_BYTES_PER_TOKEN)
+        if sum(sizes) <= max_size:
+            return [(tuple(year_name), infiles)]
+        chunk_list = enumerate(cut_by_size(infiles, sizes, max_size))
+    elif len(infiles) > MAX_INFILES_SIZE:
+        chunk_list = split_year.split_directory(
+            year, structure_cache=structure_cache
+        )
     else:
-        return [(tuple(os.path.normpath(year).split(os.sep)[-2:]), infiles)]
+        return [(tuple(year_name), infiles)]
+    return [
+        (
+            tuple(year_name + ["-", str(chunk_name).zfill(2)]),
+            pagepaths,
+        )
+        for chunk_name, pagepaths in chunk_list
+    ]
 
 
 def prep_year_data_for_tagging(data: tuple) -> tuple:
@@ -496,76 +798,320 @@ def prep_year_data_for_tagging(data: tuple) -> tuple:
     Returns:
         tuple: The first entry is a dictionary where the keys are years and
          the values is prepared data for tagging. The second entry is the year.
+         If "COLUMNAR_PAGES" is set in the conf, the pages are PageColumns
+         instead of lists of sentences (see src.preprocessing.columns).
     """
     year, infiles, conf = data
     logging.info("Prepping %s", year)
+    columnar = conf.get("COLUMNAR_PAGES", False)
     od = OrderedDict()
     for infile in infiles:
-        od[os.path.basename(infile)] = preprocess_file(infile, conf)
+        sentences = preprocess_file(infile, conf)
+        if columnar:
+            sentences = encode_page(sentences)
+        od[os.path.basename(infile)] = sentences
     return od, year
 
 
+def iter_page_tasks(year_directories,
+                    pages_per_task: int,
+                    memory_budget_mb: int = 0,
+                    manifest=None,
+                    structure_cache=None):
+    """Chunks the given years and cuts every chunk into page ranges.
+
+    Args:
+        year_directories (iterable): Paths to year directories.
+        pages_per_task (int): Maximum number of pages per range.
+        memory_budget_mb (int, optional): Memory budget per chunk, see
+         get_year_chunk_paths. Defaults to 0.
+        manifest (Manifest, optional): Cached directory listings. Defaults
+         to None.
+        structure_cache (str, optional): Directory of the structure cache,
+         see get_year_chunk_paths. Defaults to None.
+
+    Yields:
+        tuple: The year (chunk), a list of page paths (None if the year has
+         no pages) and whether this is the last range of that year.
+    """
+    for year_directory in year_directories:
+        logging.info("Chunking %s", year_directory)
+        for year, infiles in get_year_chunk_paths(year_directory,
+                                                  memory_budget_mb,
+                                                  manifest,
+                                                  structure_cache):
+            if not infiles:
+                yield year, None, True
+            for i in range(0, len(infiles), pages_per_task):
+                yield (year,
+                       infiles[i: i + pages_per_task],
+                       i + pages_per_task >= len(infiles))
+
+
 def start_preprocessing(year_directories: List[str], conf: dict):
-    """Preprocess the files in the year directories in chunks.
-    TODO this is the third function that just "starts" the preprocessing.
-    Surely we can do better.
+    """Preprocess the files in the year directories with one pool of
+    BATCH_SIZE workers for the whole run.
+
+    Every year (chunk) is cut into ranges of PAGES_PER_TASK pages, which are
+    handed to whichever worker is free, so a single large year doesn't keep
+    the other workers idle. The results are put back together in order, and
+    only a limited number of ranges is in flight at once to bound the
+    memory.
 
     Args:
-        year_directories (List[str]): List of years.
+        year_directories (List[str]): List (or any iterable) of years.
         conf (dict): Dictionary with various paths and settings.
 
     Yields:
         tuple: The first entry is the year (from list of years),
          the second entry is the dictionary of preprocessed data.
     """
-    chunked_years = []
     BATCH_SIZE = conf["BATCH_SIZE"]
-    for year in year_directories:
-        logging.info("Chunking %s", year)
-        chunked_years.extend(get_year_chunk_paths(year))
-
-    for i in range(0, len(chunked_years), BATCH_SIZE):
-        year_chunk = chunked_years[i: i + BATCH_SIZE]
-        packaged = [(y[0], y[1], conf) for y in year_chunk]
-        with Pool(BATCH_SIZE) as p:
-            # removing imap can improve ram requirements again
-            for files, year in p.imap(prep_year_data_for_tagging, packaged):
+    PAGES_PER_TASK = conf.get("PAGES_PER_TASK", 20)
+    # enough ranges in flight to keep all workers busy, but not so many that
+    # finished results pile up while the consumer (e.g. tagging) is busy
+    MAX_PENDING_TASKS = 4 * BATCH_SIZE
+
+    tasks = iter_page_tasks(year_directories, PAGES_PER_TASK,
+                            conf.get("CHUNK_MEMORY_BUDGET_MB", 0),
+                            get_manifest(conf),
+                            conf.get("PATH_TO_STRUCTURE_CACHE"))
+    pending = deque()
+    pool = None
+
+    def submit_next_task() -> bool:
+        nonlocal pool
+        task = next(tasks, None)
+        if task is None:
+            return False
+        year, infiles, is_last = task
+        result = None
+        if infiles:
+            if pool is None:
+                # Load the abbreviations once and hand them to every worker,
+                # instead of reloading them for every page.
+                pool = Pool(
+                    BATCH_SIZE,
+                    init_preprocess_worker,
+                    (get_preprocess_config(conf["PATH_TO_ABBREVIATION_FILE"]),)
+                )
+            result = pool.apply_async(prep_year_data_for_tagging,
+                                      ((year, infiles, conf),))
+        pending.append((year, result, is_last))
+        return True
+
+    try:
+        for _ in range(MAX_PENDING_TASKS):
+            if not submit_next_task():
+                break
+        files = OrderedDict()
+        while pending:
+            year, result, is_last = pending.popleft()
+            submit_next_task()
+            if result is not None:
+                pages, _ = result.get()
+                files.update(pages)
+            if is_last:
                 yield year, files
+                files = OrderedDict()
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+
+def stream_preprocessing(year_directories: List[str], conf: dict):
+    """Preprocess the files in the year directories lazily, one page after
+    the other in the current process. Nothing is collected per year, so the
+    memory needed is bounded by a single page.
+
+    NOTE: Years without any pages don't yield anything in this mode.
+
+    Args:
+        year_directories (List[str]): List of years.
+        conf (dict): Dictionary with various paths and settings.
+
+    Yields:
+        tuple: The year (chunk), the page name and one sentence of that page.
+    """
+    for year_directory in year_directories:
+        logging.info("Chunking %s", year_directory)
+        for year, infiles in get_year_chunk_paths(
+            year_directory, conf.get("CHUNK_MEMORY_BUDGET_MB", 0),
+            get_manifest(conf), conf.get("PATH_TO_STRUCTURE_CACHE")
+        ):
+            logging.info("Prepping %s", year)
+            for infile in infiles:
+                page = os.path.basename(infile)
+                for sentence in iter_preprocess_file(infile, conf):
+                    yield year, page, sentence
+
+
+def pipeline_preprocessing(year_directories: List[str], conf: dict):
+    """Preprocess the files in the year directories with a pool of
+    BATCH_SIZE workers, concurrently with the consumer (e.g. tagging).
+
+    A feeder thread hands ranges of PAGES_PER_TASK pages to the workers and
+    puts the preprocessed ranges, in order, into a queue of at most
+    PIPELINE_QUEUE_SIZE ranges, from which the sentences are yielded. Unlike
+    start_preprocessing, the workers keep going while the consumer is busy,
+    until the queue is full, and the consumer gets the first sentences of a
+    year before the whole year is preprocessed. The memory is bounded by the
+    ranges in the queue and in flight.
+
+    NOTE: Years without any pages don't yield anything in this mode.
 
+    Args:
+        year_directories (List[str]): List (or any iterable) of years.
+        conf (dict): Dictionary with various paths and settings.
 
-def execute_preprocessing(conf: dict):
+    Yields:
+        tuple: The year (chunk), the page name and one sentence of that page.
+            With COLUMNAR_PAGES, the sentence is a list of (text, coord,
+            token) tuples (see PageColumns.iter_sentences).
+    """
+    BATCH_SIZE = conf["BATCH_SIZE"]
+    PAGES_PER_TASK = conf.get("PAGES_PER_TASK", 20)
+    # enough ranges in flight to keep all workers busy
+    MAX_PENDING_TASKS = 2 * BATCH_SIZE
+    ranges = queue.Queue(
+        maxsize=conf.get("PIPELINE_QUEUE_SIZE", 4 * BATCH_SIZE)
+    )
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        # don't block forever if the consumer stopped
+        while not stop.is_set():
+            try:
+                ranges.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def feed(pool) -> None:
+        pending = deque()
+        try:
+            tasks = iter_page_tasks(year_directories, PAGES_PER_TASK,
+                                    conf.get("CHUNK_MEMORY_BUDGET_MB", 0),
+                                    get_manifest(conf),
+                                    conf.get("PATH_TO_STRUCTURE_CACHE"))
+            for year, infiles, _ in tasks:
+                if not infiles:
+                    continue
+                pending.append(pool.apply_async(prep_year_data_for_tagging,
+                                                ((year, infiles, conf),)))
+                if len(pending) >= MAX_PENDING_TASKS:
+                    pages, year = pending.popleft().get()
+                    if not put((year, pages)):
+                        return
+            while pending:
+                pages, year = pending.popleft().get()
+                if not put((year, pages)):
+                    return
+            put(None)
+        except Exception as error:
+            put(error)
+
+    # the pool is started from the calling thread, forking from a thread
+    # next to a running one is prone to deadlocks
+    pool = Pool(
+        BATCH_SIZE,
+        init_preprocess_worker,
+        (get_preprocess_config(conf["PATH_TO_ABBREVIATION_FILE"]),)
+    )
+    feeder = threading.Thread(target=feed, args=(pool,), daemon=True)
+    feeder.start()
+    try:
+        while True:
+            item = ranges.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            year, pages = item
+            for page, sentences in pages.items():
+                if isinstance(sentences, PageColumns):
+                    # the tagger takes these tuples as they are
+                    sentences = sentences.iter_sentences()
+                for sentence in sentences:
+                    yield year, page, sentence
+    finally:
+        stop.set()
+        feeder.join()
+        pool.terminate()
+
+
+def execute_preprocessing(conf: dict, stream: bool = False):
     """
     Executes the preprocessing on the files given in the conf dict.
 
     Args:
         conf (dict): Dictionary containing various paths and settings.
+        stream (bool, optional): If True, the pages are preprocessed lazily
+         and every sentence is yielded on its own (see
+         stream_preprocessing). If "PIPELINE_PREPROCESSING" is set in the
+         conf as well, they are preprocessed by a pool of workers in the
+         background (see pipeline_preprocessing). Defaults to False.
 
     Yields:
         tuple: The first entry is the year, the second entry is the dictionary\
-            of preprocessed data.
-    
-    Example:
-        bliblablub
-
-    Explanation:
-        bliblablub
+            of preprocessed data. In streaming mode, the tuples are
+            (year, page name, sentence) instead.
+
+    Note:
+        If "WRITE_TOKEN_INDEX" is set in the conf, the inverted token index
+        of every year is saved as well (see src.preprocessing.token_index).
+        If "PATH_TO_MANIFEST" is set, the directories are listed with the
+        cached manifest (see utility.manifest).
     """
+    if stream and conf.get("PIPELINE_PREPROCESSING", False):
+        start = pipeline_preprocessing
+    elif stream:
+        start = stream_preprocessing
+    else:
+        start = start_preprocessing
+    manifest = get_manifest(conf)
     if "CUSTOM_PATHS" in conf:
         # If custom paths are set (this is default pipeline behavior), we get
         # year directories, not magazine directories
         year_directories = conf["CUSTOM_PATHS"]
-        for year, files in start_preprocessing(year_directories, conf):
-            yield year, files
+    elif manifest is not None:
+        # only the directories that changed since the last run are listed
+        manifest.crawl(conf["PATH_TO_INPUT_FOLDERS"])
+        manifest.save()
+        year_directories = (
+            year
+            for magazine in manifest.glob(conf["PATH_TO_INPUT_FOLDERS"])
+            for year in list_year_directories(magazine, manifest)
+        )
     else:
         magazine_folder = sorted(
             glob.glob(conf["PATH_TO_INPUT_FOLDERS"] + "/*"))
-        for magazine in magazine_folder:
-            # If RAM is still not enough, consider cutting this further down,
-            # e.g. processing chunks of 20 year at the same time
-            year_directories = sorted(glob.glob(magazine + "/*"))
-            # put all year_folder in a worker pool
-            for year, files in start_preprocessing(year_directories, conf):
-                yield year, files
+        # the years of all magazines are listed lazily and go into one pool
+        year_directories = (
+            year
+            for magazine in magazine_folder
+            for year in list_year_directories(magazine)
+        )
+    if "SHARD_YEARS" in conf:
+        year_directories = (
+            year for year in year_directories
+            if in_shard(conf, *get_year_name(year))
+        )
+    cache_dir = conf.get("PATH_TO_PREP_CACHE")
+    if cache_dir:
+        evict_page_cache(cache_dir,
+                         conf.get("PREP_CACHE_MAX_MB", DEFAULT_MAX_MB))
+    preprocessed_data = start(year_directories, conf)
+    if conf.get("WRITE_TOKEN_INDEX", False):
+        preprocessed_data = index_preprocessed_years(preprocessed_data, conf,
+                                                     stream)
+    yield from preprocessed_data
+    if manifest is not None:
+        manifest.save()
+    if cache_dir:
+        evict_page_cache(cache_dir,
+                         conf.get("PREP_CACHE_MAX_MB", DEFAULT_MAX_MB))
 
 
 def timed_execute_preprocessing(conf: dict) -> dict:
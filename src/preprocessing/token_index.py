@@ -0,0 +1,198 @@
+#! /usr/bin/python3
+
+"""
+Per-year inverted token index, written during the preprocessing.
+
+For every year (chunk) it stores which pages contain which word, so when the
+abbreviations change only the pages containing the words of the changed
+abbreviations have to be preprocessed and tagged again (see
+utility.reprocess_abbrevs).
+
+The index is saved as JSON in the "index" folder of the outfile folder:
+    {"pages": [page names], "tokens": {key: [positions in pages]}}
+"""
+
+import json
+import os
+
+from src.preprocessing.columns import KIND_CODES, PageColumns
+
+INDEX_FOLDER = "index"
+
+
+def index_key(word: str) -> str:
+    """Key of a word in the index. Whether the period of a word is split
+    off depends on the abbreviations, so periods at the end are ignored and
+    the key is the same for the old and new abbreviations.
+
+    Args:
+        word (str): A word or a main token of a page.
+
+    Returns:
+        str: The lowercased word without periods at the end.
+    """
+    return word.lower().rstrip(".")
+
+
+def iter_page_words(page):
+    """Yields the main tokens (no punctuation) of a preprocessed page.
+
+    Args:
+        page (list or PageColumns): The sentences of a page, with tokens as
+            dictionaries or as (text, coord, token) tuples (see
+            PageColumns.iter_sentences).
+
+    Yields:
+        str: The main tokens.
+    """
+    if isinstance(page, PageColumns):
+        offsets = page.token_offsets.tolist()
+        for i, kind in enumerate(page.kinds.tolist()):
+            if kind == KIND_CODES["main"]:
+                yield page.text[offsets[i]:offsets[i + 1]]
+    else:
+        for sentence in page:
+            for token in sentence:
+                if isinstance(token, tuple):
+                    _, coord, word = token
+                else:
+                    coord, word = token["coord"], token["token"]
+                if coord.endswith(":main"):
+                    yield word
+
+
+def build_token_index(pages) -> dict:
+    """Builds the inverted index of the given pages.
+
+    Args:
+        pages (iterable): (page name, words of that page) tuples.
+
+    Returns:
+        dict: The index with "pages" and "tokens" keys, see module docstring.
+    """
+    index = {"pages": [], "tokens": {}}
+    for name, words in pages:
+        add_page_to_index(index, name, set(map(index_key, words)))
+    return index
+
+
+def add_page_to_index(index: dict, name: str, keys: set) -> None:
+    """Adds the postings of a page to the index. If the page is already
+    the last page of the index, its new keys are added to it.
+
+    Args:
+        index (dict): The index, see build_token_index.
+        name (str): The page name.
+        keys (set): The index keys of the words of the page.
+    """
+    if not index["pages"] or index["pages"][-1] != name:
+        index["pages"].append(name)
+    position = len(index["pages"]) - 1
+    for key in keys:
+        postings = index["tokens"].setdefault(key, [])
+        if not postings or postings[-1] != position:
+            postings.append(position)
+
+
+def replace_index_pages(index: dict, pages: dict) -> None:
+    """Replaces the postings of pages that were preprocessed again. The
+    pages keep their positions, new pages are appended.
+
+    Args:
+        index (dict): The index, see build_token_index. It is updated in
+            place.
+        pages (dict): Page name -> the new words of the page. A page
+            without words has no postings anymore.
+    """
+    positions = {name: i for i, name in enumerate(index["pages"])}
+    replaced = {positions[name] for name in pages if name in positions}
+    for key in list(index["tokens"]):
+        postings = [position for position in index["tokens"][key]
+                    if position not in replaced]
+        if postings:
+            index["tokens"][key] = postings
+        else:
+            del index["tokens"][key]
+    for name, words in pages.items():
+        if name not in positions:
+            positions[name] = len(index["pages"])
+            index["pages"].append(name)
+        for key in set(map(index_key, words)):
+            postings = index["tokens"].setdefault(key, [])
+            postings.append(positions[name])
+            postings.sort()
+
+
+def get_index_path(year: tuple, conf: dict) -> str:
+    """Path of the index of the given year.
+
+    Args:
+        year (tuple): The magazine shortname followed by the year (parts).
+        conf (dict): A dictionary describing various paths and settings.
+
+    Returns:
+        str: Path to the index file.
+    """
+    return os.path.join(conf["PATH_TO_OUTFILE_FOLDER"], INDEX_FOLDER,
+                        year[0], "".join(year[1:]) + ".json")
+
+
+def save_token_index(year: tuple, index: dict, conf: dict) -> None:
+    """Saves the index of a year into the "index" folder.
+
+    Args:
+        year (tuple): The magazine shortname followed by the year (parts).
+        index (dict): The index as returned by build_token_index.
+        conf (dict): A dictionary describing various paths and settings.
+    """
+    path = get_index_path(year, conf)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", mode="w", encoding="utf8") as out:
+        json.dump(index, out)
+    os.replace(path + ".tmp", path)
+
+
+def index_preprocessed_years(preprocessed_data, conf: dict,
+                             stream: bool = False):
+    """Passes the output of execute_preprocessing through and saves the
+    index of every year on the way.
+
+    Args:
+        preprocessed_data (iterable): (year, pages) tuples, or
+         (year, page name, sentence) tuples if stream is True.
+        conf (dict): A dictionary describing various paths and settings.
+        stream (bool, optional): Whether the output is streamed sentence by
+         sentence. Defaults to False.
+
+    Yields:
+        tuple: The unchanged output of execute_preprocessing.
+    """
+    if not stream:
+        for year, files in preprocessed_data:
+            save_token_index(year, build_token_index(
+                (name, iter_page_words(page)) for name, page in files.items()
+            ), conf)
+            yield year, files
+        return
+
+    # only the keys of the current page are collected, every finished page
+    # is folded into the postings of its year
+    current_year = None
+    current_page = None
+    index = None
+    keys = set()
+    for year, name, sentence in preprocessed_data:
+        if (year, name) != (current_year, current_page):
+            if current_year is not None:
+                add_page_to_index(index, current_page, keys)
+            if year != current_year:
+                if current_year is not None:
+                    save_token_index(current_year, index, conf)
+                index = {"pages": [], "tokens": {}}
+            current_year, current_page = year, name
+            keys = set()
+        keys.update(map(index_key, iter_page_words([sentence])))
+        yield year, name, sentence
+    if current_year is not None:
+        add_page_to_index(index, current_page, keys)
+        save_token_index(current_year, index, conf)
@@ -0,0 +1,185 @@
+#! /usr/bin/python3
+
+"""
+On-disk cache for the labels of tagged sentences.
+
+A sentence is stored under the fingerprint of the two NER models together
+with the hash of its normalized tokens, so re-tagging a magazine after a
+change that doesn't touch the models or the preprocessing (e.g. a fix in
+the aggregation or linking) only runs the tagger on new sentences. If a
+model changes, all keys change and the old entries are evicted over time.
+
+Unlike the prep cache, which stores one file per page, the entries are
+rows of a single SQLite database, since a year has far too many sentences
+for a file each.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+
+# Bump this whenever the stored labels change for the same models and
+# tokens, so old cache entries aren't used anymore.
+TAG_CACHE_VERSION = "1"
+DEFAULT_MAX_MB = 2048
+CACHE_FILENAME = "tag_cache.sqlite"
+# approximate size of an entry in bytes, as an SQL expression
+ENTRY_SIZE = "LENGTH(model) + LENGTH(sentence) + LENGTH(labels) + 16"
+
+
+def model_fingerprint(model_paths: list) -> str:
+    """Hashes the contents of the model files.
+
+    Args:
+        model_paths (list): Paths to the NER models.
+
+    Returns:
+        str: Hex digest identifying the models.
+    """
+    sha = hashlib.sha256()
+    sha.update(TAG_CACHE_VERSION.encode("utf8"))
+    for path in model_paths:
+        with open(path, mode="rb") as inf:
+            for block in iter(lambda: inf.read(1 << 20), b""):
+                sha.update(block)
+    return sha.hexdigest()
+
+
+def sentence_key(tokens: tuple) -> str:
+    """Returns the cache key of a sentence.
+
+    Args:
+        tokens (tuple): The normalized tokens of the sentence.
+
+    Returns:
+        str: Hex digest of the token sequence.
+    """
+    sha = hashlib.sha256()
+    for token in tokens:
+        sha.update(token.encode("utf8"))
+        # a separator, so ("ab", "c") and ("a", "bc") differ
+        sha.update(b"\0")
+    return sha.hexdigest()
+
+
+class TagResultCache:
+    """The labels of the sentences tagged with one pair of models.
+
+    Args:
+        cache_dir (str): Path to the cache directory.
+        fingerprint (str): Fingerprint of the models (see
+            model_fingerprint).
+        max_mb (int, optional): Maximum size of the cache in megabytes.
+            Defaults to DEFAULT_MAX_MB.
+    """
+
+    def __init__(self, cache_dir: str, fingerprint: str,
+                 max_mb: int = DEFAULT_MAX_MB):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.fingerprint = fingerprint
+        self.max_mb = max_mb
+        self.hits = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(
+            os.path.join(cache_dir, CACHE_FILENAME), timeout=60
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS labels ("
+            "model TEXT, sentence TEXT, labels TEXT, used REAL, "
+            "PRIMARY KEY (model, sentence))"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS labels_used ON labels (used)"
+        )
+        self.connection.commit()
+
+    def get_many(self, keys: list) -> dict:
+        """Loads the labels of the cached sentences and marks them as
+        recently used for the eviction.
+
+        Args:
+            keys (list): The normalized tokens of the sentences.
+
+        Returns:
+            dict: Normalized tokens -> token labels (see
+                get_token_labels in src.tag_flair), for the sentences that
+                are cached.
+        """
+        hashes = {sentence_key(key): key for key in keys}
+        found = {}
+        hash_list = list(hashes)
+        # stay below the number of variables sqlite allows in a query
+        for start in range(0, len(hash_list), 500):
+            chunk = hash_list[start:start + 500]
+            rows = self.connection.execute(
+                "SELECT sentence, labels FROM labels WHERE model = ? AND "
+                f"sentence IN ({','.join('?' * len(chunk))})",
+                [self.fingerprint] + chunk
+            )
+            for sentence, labels in rows:
+                found[hashes[sentence]] = json.loads(labels)
+        if found:
+            now = time.time()
+            self.connection.executemany(
+                "UPDATE labels SET used = ? WHERE model = ? AND sentence = ?",
+                [(now, self.fingerprint, sentence_key(key)) for key in found]
+            )
+            self.connection.commit()
+        self.hits += len(found)
+        self.misses += len(hashes) - len(found)
+        return found
+
+    def put_many(self, labels: dict) -> None:
+        """Stores the labels of tagged sentences.
+
+        Args:
+            labels (dict): Normalized tokens -> token labels.
+        """
+        now = time.time()
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO labels VALUES (?, ?, ?, ?)",
+            [(self.fingerprint, sentence_key(key), json.dumps(value), now)
+             for key, value in labels.items()]
+        )
+        self.connection.commit()
+
+    def get_size(self) -> int:
+        """The size of the stored entries in bytes."""
+        size, = self.connection.execute(
+            f"SELECT COALESCE(SUM({ENTRY_SIZE}), 0) FROM labels"
+        ).fetchone()
+        return size
+
+    def evict(self) -> int:
+        """Removes the least recently used entries, of any models, until
+        the entries are smaller than max_mb megabytes. The database file
+        doesn't shrink, but new entries reuse the free space.
+
+        Returns:
+            int: The number of removed entries.
+        """
+        excess = self.get_size() - self.max_mb * 1024 * 1024
+        if excess <= 0:
+            return 0
+        rowids = []
+        rows = self.connection.execute(
+            f"SELECT rowid, {ENTRY_SIZE} FROM labels ORDER BY used"
+        )
+        for rowid, size in rows:
+            if excess <= 0:
+                break
+            rowids.append((rowid,))
+            excess -= size
+        rows.close()
+        self.connection.executemany("DELETE FROM labels WHERE rowid = ?",
+                                    rowids)
+        self.connection.commit()
+        logging.info("Evicted %s sentences from the tag cache.", len(rowids))
+        return len(rowids)
+
+    def close(self) -> None:
+        """Closes the database."""
+        self.connection.close()
@@ -9,17 +9,52 @@ save files.
 """
 
 import json
-from collections import defaultdict
+from collections import Counter, OrderedDict, defaultdict
+from collections.abc import Mapping
 from datetime import datetime
+import hashlib
+from itertools import chain, groupby, islice
 import logging
 import os
+import platform
+import tempfile
+import time
 
 import flair
 from flair.data import Sentence, Token, Label
+from flair.embeddings import StackedEmbeddings
 from flair.models import MultitaskModel
 from flair.nn import Classifier
 import torch
 
+from src.preprocessing.columns import PageColumns
+from src.preprocessing.prep_store import iter_prep_years
+from src.tag_cache import (
+    DEFAULT_MAX_MB,
+    TagResultCache,
+    model_fingerprint,
+)
+
+# sentences per batch of the tagger, if no token budget is set
+MINI_BATCH_SIZE = 4
+
+CALIBRATION_FILE = "./data/tag_calibration.json"
+CALIBRATION_MINI_BATCH_SIZES = (4, 8, 16, 32, 64)
+CALIBRATION_TOKEN_BUDGETS = (512, 1024, 2048, 4096)
+DEFAULT_TAGGING_SETTINGS = {
+    "mini_batch_size": MINI_BATCH_SIZE,
+    "token_budget": 0,
+    "num_threads": None,
+    "interop_threads": None,
+}
+# config keys that override the calibrated settings
+TAGGING_SETTING_KEYS = {
+    "mini_batch_size": "TAG_MINI_BATCH_SIZE",
+    "token_budget": "BATCH_TOKEN_BUDGET",
+    "num_threads": "TAG_NUM_THREADS",
+    "interop_threads": "TAG_INTEROP_THREADS",
+}
+
 
 class CustomToken(Token):
     def __init__(self, text, coords, orig):
@@ -34,6 +69,141 @@ class CustomSentence(Sentence):
         self.filename = filename if filename is not None else ""
 
 
+class SentenceTagCache:
+    """LRU cache of the token labels of tagged sentences, keyed by their
+    normalized tokens. Repeated lines like running headers, page footers or
+    "Fortsetzung folgt" are tagged once per run, and their duplicates get
+    a copy of the labels, while keeping their own coordinates.
+
+    A duplicate only gets the labels it would get from the tagger if the
+    models don't use the neighbouring sentences as context, so
+    setup_flair_tagger turns the cache off for models that do (see
+    model_uses_context).
+
+    Args:
+        max_size (int): Maximum number of cached sentences.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.labels = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple):
+        """The cached token labels of the sentence, or None."""
+        labels = self.labels.get(key)
+        if labels is not None:
+            self.labels.move_to_end(key)
+        return labels
+
+    def put(self, key: tuple, labels: tuple) -> None:
+        """Caches the token labels and evicts the least recently used
+        sentence if the cache is full."""
+        self.labels[key] = labels
+        self.labels.move_to_end(key)
+        if len(self.labels) > self.max_size:
+            self.labels.popitem(last=False)
+
+    def hit_rate(self) -> float:
+        """The share of the sentences that didn't need to be tagged."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+def get_token_labels(sentence: Sentence) -> tuple:
+    """The labels of every token of a tagged sentence.
+
+    Args:
+        sentence (Sentence): The tagged sentence.
+
+    Returns:
+        tuple: For every token a tuple of (label type, value, score).
+    """
+    return tuple(
+        tuple(
+            (typename, label.value, label.score)
+            for typename, labels in token.annotation_layers.items()
+            for label in labels
+        )
+        for token in sentence
+    )
+
+
+def set_token_labels(sentence: Sentence, token_labels: tuple) -> None:
+    """Adds the labels of get_token_labels to the tokens of a sentence.
+
+    Args:
+        sentence (Sentence): A sentence with the same tokens.
+        token_labels (tuple): The labels of every token.
+    """
+    for token, labels in zip(sentence, token_labels):
+        for typename, value, score in labels:
+            token.add_label(typename, value, score)
+
+
+def embeddings_identical(embeddings_1, embeddings_2) -> bool:
+    """Whether two embedding stacks compute the same embeddings, i.e. they
+    are of the same type, store their embeddings under the same names and
+    have the same parameters and buffers.
+
+    Args:
+        embeddings_1 (TokenEmbeddings): The embeddings of the first model.
+        embeddings_2 (TokenEmbeddings): The embeddings of the second model.
+
+    Returns:
+        bool: True if the embeddings of one can be used for the other.
+    """
+    if (
+        type(embeddings_1) is not type(embeddings_2)
+        or embeddings_1.get_names() != embeddings_2.get_names()
+        or embeddings_1.embedding_length != embeddings_2.embedding_length
+    ):
+        return False
+    state_1 = embeddings_1.state_dict()
+    state_2 = embeddings_2.state_dict()
+    return state_1.keys() == state_2.keys() and all(
+        torch.equal(state_1[key], state_2[key]) for key in state_1
+    )
+
+
+class SharedEmbeddingTagger(MultitaskModel):
+    """A MultitaskModel for taggers with identical embeddings (see
+    embeddings_identical). Every batch is embedded once, the embeddings are
+    kept on the tokens while all taggers predict the batch and are cleared
+    afterwards. The plain MultitaskModel lets every tagger embed all
+    sentences again.
+
+    Set share_embeddings to False to predict like the MultitaskModel.
+    """
+    share_embeddings = True
+
+    def predict(self, sentences, mini_batch_size: int = 32, **predictargs):
+        if not self.share_embeddings:
+            return super().predict(sentences, mini_batch_size=mini_batch_size,
+                                   **predictargs)
+        if isinstance(sentences, Sentence):
+            sentences = [sentences]
+        predictargs.pop("embedding_storage_mode", None)
+        storage_mode = "cpu" if flair.device.type == "cpu" else "gpu"
+        # the same context and batches as the taggers would use
+        Sentence.set_context_for_sentences(sentences)
+        sentences = sorted(
+            (sentence for sentence in sentences if len(sentence) > 0),
+            key=len, reverse=True
+        )
+        for start in range(0, len(sentences), mini_batch_size):
+            batch = sentences[start:start + mini_batch_size]
+            for task in self.tasks.values():
+                # the first tagger embeds the batch, the others find the
+                # embeddings on the tokens
+                task.predict(batch, mini_batch_size=len(batch),
+                             embedding_storage_mode=storage_mode,
+                             **predictargs)
+            for sentence in batch:
+                sentence.clear_embeddings()
+
+
 def decide_tag_no_tag_lower_prio(labels: list) -> Label:
     """Combining the tags of the two tagging models.
     If there is disagreement between the two models, "O" always loses.
@@ -150,81 +320,355 @@ def write_sentences_to_outfile(outfile, data: dict) -> None:
     data.clear()
 
 
+def iter_collection_sentences(collection):
+    """Iterates over the sentences of a year together with their filename.
+
+    Args:
+        collection (dict or iterable): Either a dictionary where the keys are
+            the filenames and the values are the sentences in said file
+            (lists of token dictionaries or PageColumns), or an iterable of
+            (filename, sentence) tuples as produced by the streaming
+            preprocessing.
+
+    Yields:
+        tuple: The filename and one sentence of that file, where the sentence
+            is a list of (text, coord, token) tuples and text is the
+            normalized token.
+    """
+    if isinstance(collection, Mapping):
+        collection = (
+            (filename, sentence)
+            for filename, sentences in collection.items()
+            for sentence in (
+                sentences.iter_sentences()
+                if isinstance(sentences, PageColumns)
+                else sentences
+            )
+        )
+    for filename, sentence in collection:
+        if sentence and isinstance(sentence[0], dict):
+            sentence = [
+                (
+                    token["normalized"]
+                    if "normalized" in token
+                    else token["token"],
+                    token["coord"],
+                    token["token"],
+                )
+                for token in sentence
+            ]
+        yield filename, sentence
+
+
+def group_streamed_years(preprocessed_data):
+    """Groups the (year, page, sentence) stream of the streaming
+    preprocessing by year, without collecting any of the sentences.
+
+    Args:
+        preprocessed_data (iterable): Tuples of year, page name and sentence.
+
+    Yields:
+        dict: A dictionary with a single year as key and a lazy iterable of
+            (page name, sentence) tuples as value. It must be consumed before
+            the next dictionary is requested.
+    """
+    for year, group in groupby(preprocessed_data, key=lambda x: x[0]):
+        yield {year: ((page, sentence) for _, page, sentence in group)}
+
+
+def make_token_batches(lengths: list, token_budget: int) -> list:
+    """Sorts the sentences of a window into length buckets (1, 2-3, 4-7,
+    8-15, ... tokens) and packs every bucket into batches whose padded size
+    (number of sentences times the longest sentence) stays within the token
+    budget. Short sentences thus end up in large batches and long ones in
+    small batches, and no sentence is padded to more than twice its length.
+
+    Args:
+        lengths (list): The number of tokens of every sentence in the window.
+        token_budget (int): Maximum number of padded tokens per batch. A
+            sentence longer than the budget gets a batch of its own.
+
+    Returns:
+        list: Batches of indices into lengths, longest sentences first.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: -lengths[i])
+    batches = []
+    batch = []
+    for index in order:
+        # sorted in descending order, the first sentence is the longest
+        longest = lengths[batch[0]] if batch else 0
+        if batch and (
+            (len(batch) + 1) * longest > token_budget
+            or lengths[index].bit_length() < longest.bit_length()
+        ):
+            batches.append(batch)
+            batch = []
+        batch.append(index)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def count_padded_tokens(lengths: list, batches: list) -> int:
+    """Counts the tokens of the batches including the padding, i.e. every
+    sentence counts as long as the longest sentence of its batch.
+
+    Args:
+        lengths (list): The number of tokens of every sentence.
+        batches (list): Batches of indices into lengths.
+
+    Returns:
+        int: The padded number of tokens.
+    """
+    return sum(
+        len(batch) * max(lengths[index] for index in batch)
+        for batch in batches
+    )
+
+
+def predict_sentences(tagger: MultitaskModel,
+                      sentences: list,
+                      token_budget: int = 0,
+                      padding: Counter = None,
+                      mini_batch_size: int = MINI_BATCH_SIZE) -> None:
+    """Tags a window of sentences. The labels are added to the sentence
+    objects, so the order of the sentences list is not changed.
+
+    Without a token budget the whole window is passed to the tagger with
+    mini_batch_size. Flair sorts the window by length itself, but cuts it
+    into batches of a fixed number of sentences. With a token budget the
+    window is batched by make_token_batches and every batch is predicted
+    separately.
+
+    Args:
+        tagger (MultitaskModel): The MultitaskModel containing both
+            tagging models (ner-det and ner-bio).
+        sentences (list): The sentences of the window in file order.
+        token_budget (int, optional): Maximum number of padded tokens per
+            batch, 0 disables the length batching. Defaults to 0.
+        padding (Counter, optional): Collects the number of tokens and the
+            padded number of tokens of both batchings ("tokens", "default",
+            "bucketed"). Defaults to None.
+        mini_batch_size (int, optional): Number of sentences per batch
+            without a token budget. Defaults to MINI_BATCH_SIZE.
+    """
+    if not token_budget:
+        tagger.predict(
+            sentences,
+            verbose=False,
+            mini_batch_size=mini_batch_size,
+            force_token_predictions=True
+        )
+        return
+    # link the sentences in file order, as the tagger would do for the
+    # whole window, so models with context see the same neighbours
+    Sentence.set_context_for_sentences(sentences)
+    # flair skips empty sentences as well
+    sentences = [sentence for sentence in sentences if len(sentence) > 0]
+    lengths = [len(sentence) for sentence in sentences]
+    batches = make_token_batches(lengths, token_budget)
+    if padding is not None:
+        # the fixed size batches flair builds from the sorted window
+        order = sorted(range(len(lengths)), key=lambda i: -lengths[i])
+        default = [order[i:i + mini_batch_size]
+                   for i in range(0, len(order), mini_batch_size)]
+        padding["tokens"] += sum(lengths)
+        padding["default"] += count_padded_tokens(lengths, default)
+        padding["bucketed"] += count_padded_tokens(lengths, batches)
+    for batch in batches:
+        tagger.predict(
+            [sentences[index] for index in batch],
+            verbose=False,
+            mini_batch_size=len(batch),
+            force_token_predictions=True
+        )
+
+
+def predict_uncached_sentences(tagger: MultitaskModel,
+                               sentences: list,
+                               cache: SentenceTagCache = None,
+                               token_budget: int = 0,
+                               padding: Counter = None,
+                               mini_batch_size: int = MINI_BATCH_SIZE,
+                               result_cache: TagResultCache = None) -> None:
+    """Tags a window of sentences like predict_sentences, but only the
+    first occurrence of every sentence that is neither in the cache of the
+    run nor in the on-disk cache. The other sentences get a copy of the
+    labels.
+
+    Args:
+        tagger (MultitaskModel): The MultitaskModel containing both
+            tagging models (ner-det and ner-bio).
+        sentences (list): The sentences of the window in file order.
+        cache (SentenceTagCache, optional): The cache of the run. Defaults
+            to None.
+        token_budget (int, optional): See predict_sentences. Defaults to 0.
+        padding (Counter, optional): See predict_sentences. Defaults to
+            None.
+        mini_batch_size (int, optional): See predict_sentences. Defaults
+            to MINI_BATCH_SIZE.
+        result_cache (TagResultCache, optional): The on-disk cache, which
+            is looked up before tagging and stores the newly tagged
+            sentences. Defaults to None.
+    """
+    uncached = {}
+    duplicates = []
+    for sentence in sentences:
+        key = tuple(token.text for token in sentence)
+        labels = cache.get(key) if cache is not None else None
+        if labels is not None:
+            set_token_labels(sentence, labels)
+        elif key in uncached:
+            duplicates.append((key, sentence))
+        else:
+            uncached[key] = sentence
+        if cache is not None:
+            if uncached.get(key) is sentence:
+                cache.misses += 1
+            else:
+                cache.hits += 1
+    token_labels = {}
+    if result_cache is not None and uncached:
+        token_labels = result_cache.get_many(list(uncached))
+        for key, labels in token_labels.items():
+            set_token_labels(uncached.pop(key), labels)
+    if uncached:
+        predict_sentences(tagger, list(uncached.values()), token_budget,
+                          padding, mini_batch_size)
+        tagged = {key: get_token_labels(sentence)
+                  for key, sentence in uncached.items()}
+        if result_cache is not None:
+            result_cache.put_many(tagged)
+        token_labels.update(tagged)
+    if cache is not None:
+        for key, labels in token_labels.items():
+            cache.put(key, labels)
+    for key, sentence in duplicates:
+        set_token_labels(sentence, token_labels[key])
+
+
+def get_padding_ratio(padding: Counter, key: str) -> float:
+    """The share of padding in the padded tokens of a batching.
+
+    Args:
+        padding (Counter): The counts collected by predict_sentences.
+        key (str): Either "default" or "bucketed".
+
+    Returns:
+        float: The padding ratio between 0 and 1.
+    """
+    if not padding[key]:
+        return 0.0
+    return 1 - padding["tokens"] / padding[key]
+
+
 def tag_year_data_and_save(collection: dict,
                            tagger: MultitaskModel,
                            outfile_path: str,
-                           sentence_batch_size: int) -> None:
+                           sentence_batch_size: int,
+                           token_budget: int = 0,
+                           mini_batch_size: int = MINI_BATCH_SIZE,
+                           cache: SentenceTagCache = None,
+                           result_cache: TagResultCache = None) -> None:
     """Runs tagging on the collection and saves the result
     into the outfile_path.
 
     Args:
         collection (dict): A dictionary where the keys are the filenames and
-            the values are the sentences in said file.
+            the values are the sentences in said file. Alternatively an
+            iterable of (filename, sentence) tuples
+            (see iter_collection_sentences).
         tagger (MultitaskModel): The MultitaskModel containing both
             tagging models (ner-det and ner-bio).
         outfile (str): String of the outfile path where the tagged file
             will be saved.
         sentence_batch_size (int): Number of sentences, after which we start
-            writing the intermediate results into the outfile.
+            writing the intermediate results into the outfile. It is also
+            the window in which the sentences are sorted by length.
+        token_budget (int, optional): Maximum number of padded tokens per
+            batch (see predict_sentences), 0 disables the length batching.
+            Defaults to 0.
+        mini_batch_size (int, optional): Number of sentences per batch
+            without a token budget. Defaults to MINI_BATCH_SIZE.
+        cache (SentenceTagCache, optional): If given, repeated sentences
+            are only tagged once (see predict_uncached_sentences). Defaults
+            to None.
+        result_cache (TagResultCache, optional): If given, sentences tagged
+            by an earlier run are not tagged again. Defaults to None.
     """
+    if cache is None and result_cache is None:
+        predict = predict_sentences
+    else:
+        def predict(tagger, sentences, *args):
+            predict_uncached_sentences(tagger, sentences, cache, *args,
+                                       result_cache=result_cache)
 
     # open outfile
     outfile = open(outfile_path, mode="w", encoding="utf8")
 
     new_data = defaultdict(list)
+    padding = Counter()
     # all_collected_sentences = []
     collected_sentences = []
-    # TODO: instead of reading from a dictionary,
-    # just iterate the given year directly
-    for filename, sentences in collection.items():
-        for sentence in sentences:
-            new_sentence = CustomSentence(filename, "")
-            for i, token in enumerate(sentence):
-                new_sentence._add_token(
-                    CustomToken(
-                        (
-                            token["normalized"]
-                            if "normalized" in token
-                            else token["token"]
-                        ),
-                        token["coord"],
-                        token["token"],
-                    )
-                )
-                if i + 1 % 250 == 0:
-                    collected_sentences.append(new_sentence)
-                    new_sentence = CustomSentence(filename, "")
-            collected_sentences.append(new_sentence)
-            if len(collected_sentences) == sentence_batch_size:
-                tagger.predict(
-                    collected_sentences,
-                    verbose=False,
-                    mini_batch_size=4,
-                    force_token_predictions=True
-                )
-                add_sentences(new_data, collected_sentences)
-                # all_collected_sentences.extend(collected_sentences)
-                collected_sentences = []
+    for filename, sentence in iter_collection_sentences(collection):
+        new_sentence = CustomSentence(filename, "")
+        for i, (text, coord, orig) in enumerate(sentence):
+            new_sentence._add_token(CustomToken(text, coord, orig))
+            if i + 1 % 250 == 0:
+                collected_sentences.append(new_sentence)
+                new_sentence = CustomSentence(filename, "")
+        collected_sentences.append(new_sentence)
+        if len(collected_sentences) == sentence_batch_size:
+            predict(tagger, collected_sentences, token_budget, padding,
+                    mini_batch_size)
+            add_sentences(new_data, collected_sentences)
+            # all_collected_sentences.extend(collected_sentences)
+            collected_sentences = []
 
-                # TODO: whenever a file has been processed, write all
-                # information for that file to the output-file in json-coding
-                # If this doesnt improve performance enough, it might be
-                # necessary to write a sentence per line.
-                write_sentences_to_outfile(outfile, new_data)
+            # TODO: whenever a file has been processed, write all
+            # information for that file to the output-file in json-coding
+            # If this doesnt improve performance enough, it might be
+            # necessary to write a sentence per line.
+            write_sentences_to_outfile(outfile, new_data)
 
     if collected_sentences:
-        tagger.predict(
-            collected_sentences,
-            verbose=False,
-            mini_batch_size=4,
-            force_token_predictions=True
-        )
+        predict(tagger, collected_sentences, token_budget, padding,
+                mini_batch_size)
         add_sentences(new_data, collected_sentences)
         # all_collected_sentences.extend(collected_sentences)
 
         write_sentences_to_outfile(outfile, new_data)
 
     outfile.close()
+    if padding["tokens"]:
+        logging.info(
+            "Padding ratio for %s: %.1f%% with batches of %d sentences, "
+            "%.1f%% with a budget of %d tokens per batch.",
+            outfile_path, 100 * get_padding_ratio(padding, "default"),
+            mini_batch_size, 100 * get_padding_ratio(padding, "bucketed"),
+            token_budget
+        )
+
+
+def model_uses_context(model) -> bool:
+    """Whether the embeddings of a model look at the neighbouring sentences
+    (e.g. transformer embeddings with use_context). The labels of such a
+    model depend on the sentences around a sentence, not only on its
+    tokens.
+
+    Args:
+        model (Classifier): A loaded NER model.
+
+    Returns:
+        bool: True if any of its embeddings has a context length.
+    """
+    embeddings = getattr(model, "embeddings", None)
+    if isinstance(embeddings, StackedEmbeddings):
+        embeddings = embeddings.embeddings
+    else:
+        embeddings = [embeddings]
+    return any(getattr(embedding, "context_length", 0) > 0
+               for embedding in embeddings)
 
 
 def setup_flair_tagger(conf: dict,
@@ -237,20 +681,371 @@ def setup_flair_tagger(conf: dict,
             Expected keys:
                 - "PATH_TO_NER_MODEL_1": Path to the first NER model.
                 - "PATH_TO_NER_MODEL_2": Path to the second NER model.
+            If "SHARED_EMBEDDINGS" is set and both models use identical
+            embeddings, they are computed once for both models.
+            If a model uses the neighbouring sentences as context,
+            "TAG_CACHE_SIZE" and "PATH_TO_TAG_RESULT_CACHE" are turned off
+            in the conf, since a cached sentence would keep the labels of
+            its first context.
         gpu_num (int): GPU number to use. If set to "0", the CPU will be used.
 
     Returns:
         flair.models.MultitaskModel: An instance of Flair's MultitaskModel
-        loaded with the specified NER models.
+        loaded with the specified NER models, or a SharedEmbeddingTagger.
     """
     flair.device = torch.device(int(gpu_num) if gpu_num != 0 else "cpu")
 
     ner_tagger_1 = Classifier.load(conf["PATH_TO_NER_MODEL_1"])
     ner_tagger_2 = Classifier.load(conf["PATH_TO_NER_MODEL_2"])
+    caches = [key for key in ("TAG_CACHE_SIZE", "PATH_TO_TAG_RESULT_CACHE")
+              if conf.get(key)]
+    if caches and (model_uses_context(ner_tagger_1)
+                   or model_uses_context(ner_tagger_2)):
+        logging.warning("The NER models use the neighbouring sentences as "
+                        "context, turning off %s.", ", ".join(caches))
+        conf["TAG_CACHE_SIZE"] = 0
+        conf["PATH_TO_TAG_RESULT_CACHE"] = ""
+    if conf.get("SHARED_EMBEDDINGS", False):
+        if embeddings_identical(ner_tagger_1.embeddings,
+                                ner_tagger_2.embeddings):
+            logging.info("The NER models share their embeddings.")
+            # one copy of the embedding models is enough
+            ner_tagger_2.embeddings = ner_tagger_1.embeddings
+            return SharedEmbeddingTagger([ner_tagger_1, ner_tagger_2])
+        logging.info("The embeddings of the NER models differ, they are "
+                     "computed for each model.")
     flairTagger = MultitaskModel([ner_tagger_1, ner_tagger_2])
     return flairTagger
 
 
+def get_calibration_key(conf: dict) -> str:
+    """Identifies the model pair and the machine the calibrated settings
+    belong to. The models are identified by their path, size and
+    modification time, so replacing a model triggers a new calibration.
+
+    Args:
+        conf (dict): Configuration dict containing the paths to the NER
+            models.
+
+    Returns:
+        str: The key of the settings in the calibration file.
+    """
+    sha = hashlib.sha1()
+    for key in ("PATH_TO_NER_MODEL_1", "PATH_TO_NER_MODEL_2"):
+        path = os.path.abspath(conf[key])
+        sha.update(path.encode("utf8"))
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        sha.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode("utf8"))
+    machine = "-".join([platform.node(), platform.machine(),
+                        str(os.cpu_count()), str(flair.device)])
+    return f"{sha.hexdigest()[:12]}:{machine}"
+
+
+def load_calibrations(path: str) -> dict:
+    """Loads all calibrated settings.
+
+    Args:
+        path (str): Path to the calibration file.
+
+    Returns:
+        dict: Calibration key -> settings, empty if there is no file yet.
+    """
+    try:
+        with open(path, encoding="utf8") as inf:
+            return json.load(inf)
+    except (OSError, ValueError):
+        return {}
+
+
+def store_calibration(path: str, key: str, settings: dict) -> None:
+    """Adds the settings to the calibration file. The file is written to a
+    temporary file first and then renamed, so it is never half-written.
+
+    Args:
+        path (str): Path to the calibration file.
+        key (str): The calibration key (see get_calibration_key).
+        settings (dict): The calibrated settings.
+    """
+    calibrations = load_calibrations(path)
+    calibrations[key] = settings
+    folder = os.path.dirname(path) or "."
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf8") as outf:
+        json.dump(calibrations, outf, indent=4, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def apply_thread_settings(settings: dict) -> None:
+    """Sets the number of torch threads of the settings. The inter-op
+    threads can only be set once per process, before torch runs any
+    parallel work, so a later change is skipped with a warning.
+
+    Args:
+        settings (dict): Tagging settings with "num_threads" and
+            "interop_threads", None keeps the torch default.
+    """
+    if settings.get("num_threads"):
+        torch.set_num_threads(settings["num_threads"])
+    interop_threads = settings.get("interop_threads")
+    if interop_threads and interop_threads != torch.get_num_interop_threads():
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError:
+            logging.warning("Could not set the inter-op threads to %s, "
+                            "torch is already running.", interop_threads)
+
+
+def get_thread_candidates(cpu_count: int) -> list:
+    """The numbers of threads tried by the calibration: all cores, half of
+    them, a quarter and an eighth.
+
+    Args:
+        cpu_count (int): Number of cores of the machine.
+
+    Returns:
+        list: Distinct numbers of threads, in descending order.
+    """
+    return sorted({max(1, cpu_count // 2 ** i) for i in range(4)},
+                  reverse=True)
+
+
+def build_sentences(sample: list) -> list:
+    """Builds untagged sentences from a sample of the collection.
+
+    Args:
+        sample (list): (filename, sentence) tuples as yielded by
+            iter_collection_sentences.
+
+    Returns:
+        list: The CustomSentences.
+    """
+    sentences = []
+    for filename, sentence in sample:
+        new_sentence = CustomSentence(filename, "")
+        for text, coord, orig in sentence:
+            new_sentence._add_token(CustomToken(text, coord, orig))
+        sentences.append(new_sentence)
+    return sentences
+
+
+def check_shared_embeddings(tagger: SharedEmbeddingTagger,
+                            sample: list,
+                            settings: dict) -> bool:
+    """Tags the sample with and without the shared embeddings and compares
+    the combined labels. If they differ, the tagger falls back to computing
+    the embeddings for each model.
+
+    Args:
+        tagger (SharedEmbeddingTagger): The tagger to check.
+        sample (list): (filename, sentence) tuples as yielded by
+            iter_collection_sentences.
+        settings (dict): The tagging settings of the run.
+
+    Returns:
+        bool: True if the labels are the same.
+    """
+    combined = []
+    for share_embeddings in (False, True):
+        tagger.share_embeddings = share_embeddings
+        sentences = build_sentences(sample)
+        predict_sentences(tagger, sentences, settings["token_budget"],
+                          mini_batch_size=settings["mini_batch_size"])
+        tagged = defaultdict(list)
+        add_sentences(tagged, sentences)
+        combined.append(tagged)
+    if combined[0] != combined[1]:
+        logging.warning("The shared embeddings change the labels, they are "
+                        "computed for each model instead.")
+        tagger.share_embeddings = False
+        return False
+    logging.info("The shared embeddings give the same labels on %s "
+                 "sentences.", len(sample))
+    return True
+
+
+def time_predict(tagger: MultitaskModel,
+                 sample: list,
+                 settings: dict) -> float:
+    """Tags the sample once with the settings and measures the throughput.
+    The sentences are built anew, so no labels of earlier runs are reused.
+
+    Args:
+        tagger (MultitaskModel): The tagger to calibrate.
+        sample (list): (filename, sentence) tuples as yielded by
+            iter_collection_sentences.
+        settings (dict): The tagging settings to measure.
+
+    Returns:
+        float: Tagged sentences per second.
+    """
+    sentences = build_sentences(sample)
+    apply_thread_settings(settings)
+    start = time.perf_counter()
+    predict_sentences(tagger, sentences, settings["token_budget"],
+                      mini_batch_size=settings["mini_batch_size"])
+    return len(sentences) / max(time.perf_counter() - start, 1e-9)
+
+
+def calibrate_tagger(tagger: MultitaskModel, sample: list) -> dict:
+    """Finds the fastest tagging settings for the sample. First the number
+    of threads is swept with the default batches, then the batch sizes and
+    token budgets with the fastest number of threads. On a GPU only the
+    batches are swept.
+
+    Args:
+        tagger (MultitaskModel): The tagger to calibrate.
+        sample (list): (filename, sentence) tuples as yielded by
+            iter_collection_sentences.
+
+    Returns:
+        dict: The fastest settings ("mini_batch_size", "token_budget",
+            "num_threads", "interop_threads") and their throughput
+            ("sentences_per_second").
+    """
+    best = dict(DEFAULT_TAGGING_SETTINGS)
+    if flair.device.type == "cpu":
+        best["num_threads"] = torch.get_num_threads()
+    best["interop_threads"] = torch.get_num_interop_threads()
+    # the first prediction is slower, independent of the settings
+    time_predict(tagger, sample, best)
+
+    if flair.device.type == "cpu":
+        candidates = [
+            dict(best, num_threads=num_threads)
+            for num_threads in get_thread_candidates(os.cpu_count() or 1)
+        ]
+    else:
+        candidates = [best]
+    speeds = [time_predict(tagger, sample, candidate)
+              for candidate in candidates]
+    best = candidates[speeds.index(max(speeds))]
+
+    candidates = [
+        dict(best, mini_batch_size=mini_batch_size, token_budget=0)
+        for mini_batch_size in CALIBRATION_MINI_BATCH_SIZES
+    ] + [
+        dict(best, token_budget=token_budget)
+        for token_budget in CALIBRATION_TOKEN_BUDGETS
+    ]
+    speeds = [time_predict(tagger, sample, candidate)
+              for candidate in candidates]
+    best = dict(candidates[speeds.index(max(speeds))],
+                sentences_per_second=round(max(speeds), 1))
+    logging.info("Calibrated tagging settings: %s", best)
+    return best
+
+
+def get_tagging_overrides(conf: dict) -> dict:
+    """The tagging settings that are fixed in the config file. They take
+    precedence over the calibrated settings.
+
+    Args:
+        conf (dict): A dictionary describing various paths and settings.
+
+    Returns:
+        dict: The settings whose config keys are set (not null).
+    """
+    return {
+        name: int(conf[key])
+        for name, key in TAGGING_SETTING_KEYS.items()
+        if conf.get(key) is not None
+    }
+
+
+def load_tagging_settings(conf: dict) -> dict:
+    """The tagging settings of an earlier calibration for this model pair
+    and machine, or the defaults, updated with the config overrides.
+
+    Args:
+        conf (dict): A dictionary describing various paths and settings.
+
+    Returns:
+        dict: The tagging settings.
+    """
+    settings = dict(DEFAULT_TAGGING_SETTINGS)
+    if conf.get("TAG_CALIBRATION", False):
+        path = conf.get("PATH_TO_TAG_CALIBRATION") or CALIBRATION_FILE
+        settings.update(
+            load_calibrations(path).get(get_calibration_key(conf), {})
+        )
+    settings.update(get_tagging_overrides(conf))
+    return settings
+
+
+def resolve_tagging_settings(conf: dict,
+                             tagger: MultitaskModel,
+                             collection) -> tuple:
+    """Returns the tagging settings for the run and applies their threads.
+    If calibration is enabled (TAG_CALIBRATION) and this model pair was not
+    calibrated on this machine yet, the first TAG_CALIBRATION_SENTENCES
+    sentences of the collection are used to calibrate the tagger, and the
+    result is stored for the following runs. If the collection has fewer
+    sentences, the timings would be too noisy, so the calibration is
+    skipped and nothing is stored. The same sample is used to check a
+    SharedEmbeddingTagger (see check_shared_embeddings).
+
+    Args:
+        conf (dict): A dictionary describing various paths and settings.
+        tagger (MultitaskModel): The tagger of the run.
+        collection (dict or iterable): The first year to be tagged (see
+            iter_collection_sentences).
+
+    Returns:
+        tuple: The collection, which has to be used instead of the given
+            one, because the sample was taken from it, and the settings.
+    """
+    calibrate = False
+    if conf.get("TAG_CALIBRATION", False):
+        path = conf.get("PATH_TO_TAG_CALIBRATION") or CALIBRATION_FILE
+        key = get_calibration_key(conf)
+        calibrate = key not in load_calibrations(path)
+    sample = []
+    sample_size = int(conf.get("TAG_CALIBRATION_SENTENCES", 256))
+    if calibrate or isinstance(tagger, SharedEmbeddingTagger):
+        sentences = iter_collection_sentences(collection)
+        sample = list(islice(sentences, sample_size))
+        collection = chain(sample, sentences)
+    if calibrate and len(sample) < sample_size:
+        logging.info("Skipping the calibration of the tagger, the year has "
+                     "only %s of %s sentences.", len(sample), sample_size)
+        calibrate = False
+    if calibrate:
+        logging.info("Calibrating the tagger on %s sentences.", len(sample))
+        store_calibration(path, key, calibrate_tagger(tagger, sample))
+    settings = load_tagging_settings(conf)
+    apply_thread_settings(settings)
+    if isinstance(tagger, SharedEmbeddingTagger) and sample:
+        check_shared_embeddings(tagger, sample, settings)
+    logging.info("Tagging with %s", settings)
+    return collection, settings
+
+
+def open_result_cache(conf: dict):
+    """Opens the on-disk cache of the tagged sentences for the NER models
+    of the conf, if "PATH_TO_TAG_RESULT_CACHE" is set. Its size is capped by
+    "TAG_RESULT_CACHE_MAX_MB".
+
+    Args:
+        conf (dict): A dictionary describing various paths and settings.
+
+    Returns:
+        TagResultCache: The cache, or None if it is disabled.
+    """
+    cache_dir = conf.get("PATH_TO_TAG_RESULT_CACHE")
+    if not cache_dir:
+        return None
+    fingerprint = model_fingerprint([conf["PATH_TO_NER_MODEL_1"],
+                                     conf["PATH_TO_NER_MODEL_2"]])
+    return TagResultCache(
+        cache_dir, fingerprint,
+        int(conf.get("TAG_RESULT_CACHE_MAX_MB", DEFAULT_MAX_MB))
+    )
+
+
 def package_generator_output_paths(generator, batch_size):
     """
     Packages the output from a generator into batches of a specified size.
@@ -300,33 +1095,48 @@ def execute_tagging(preprocessed_data,
         flairTagger: The flair tagger model used for tagging the data.
         conf (dict): Configuration dictionary containing various settings
             and paths.
-        tasks (list): List of tasks to be performed. Must include 'prep' for
-            this function to execute.
+        tasks (list): List of tasks to be performed. If 'prep' is not
+            included, the years prepared by an earlier run are read from
+            the .prep files in the outfile folder.
 
-    Raises:
-        Exception: If 'prep' is not included in the tasks list, an exception
-            is raised indicating that 'prep,tag' must be called together.
+    Note:
+        The batching and the torch threads are taken from the calibration
+        of the model pair on this machine (see resolve_tagging_settings),
+        which runs on the first year if TAG_CALIBRATION is set and there is
+        no calibration yet. TAG_MINI_BATCH_SIZE, BATCH_TOKEN_BUDGET,
+        TAG_NUM_THREADS and TAG_INTEROP_THREADS override it.
+        If TAG_CACHE_SIZE is greater than 0, repeated sentences are tagged
+        once per run (see SentenceTagCache). If PATH_TO_TAG_RESULT_CACHE is
+        set, sentences tagged by earlier runs with the same models are
+        taken from there (see open_result_cache).
 
     Returns:
         None
     """
     flairTagger = setup_flair_tagger(conf, gpu_num)
+    settings = None
+    cache_size = int(conf.get("TAG_CACHE_SIZE", 0))
+    cache = SentenceTagCache(cache_size) if cache_size > 0 else None
+    result_cache = open_result_cache(conf)
     start_time = datetime.now()
     logging.info("Starting Tagging at", datetime.now(), ":")
-    if "prep" not in tasks:  # TODO this cannot be called seperately
-        raise Exception("'prep,tag' must be called together.")
-        # this is supposed to make prep,tag independent, does not work yet
-        # conf["PATH_TO_INPUT_FOLDERS"] += "/tag/"
-        # preprocessed_data = loadDataIterative(conf)
+    if "prep" not in tasks:
+        preprocessed_data = (
+            {year: data} for year, data in iter_prep_years(conf)
+        )
     else:
         # TODO: instead of packaging the output into batches,
         # just read give a year file to the tag_flair script
         # and process one year after the other
         # this is probably not the bottleneck atm, but i still should
         # change this at some point
-        preprocessed_data = package_generator_output_paths(
-            preprocessed_data, conf["BATCH_SIZE"]
-        )
+        # also the pipelined preprocessing streams the sentences
+        if conf.get("STREAM_PREPROCESSING", False):
+            preprocessed_data = group_streamed_years(preprocessed_data)
+        else:
+            preprocessed_data = package_generator_output_paths(
+                preprocessed_data, conf["BATCH_SIZE"]
+            )
     for magazine in preprocessed_data:
         for year, data in magazine.items():
             logging.info("Tagging %s", year)
@@ -336,11 +1146,34 @@ def execute_tagging(preprocessed_data,
                 os.makedirs(yearfolder)
             outfile_path = os.path.join(yearfolder,
                                         "".join(year[1:]) + ".jsonl")
+            if settings is None:
+                data, settings = resolve_tagging_settings(
+                    conf, flairTagger, data
+                )
             tag_year_data_and_save(
                 data,
                 flairTagger,
                 outfile_path,
-                int(conf["SENTENCE_BATCH_SIZE"])
+                int(conf["SENTENCE_BATCH_SIZE"]),
+                settings["token_budget"],
+                settings["mini_batch_size"],
+                cache,
+                result_cache
             )
             logging.info(f"Finished tagging {year}.")
+            if cache is not None:
+                logging.info(
+                    "Tag cache: %s of %s sentences were repeated (%.1f%%), "
+                    "%s are cached.", cache.hits, cache.hits + cache.misses,
+                    100 * cache.hit_rate(), len(cache.labels)
+                )
+            if result_cache is not None:
+                logging.info(
+                    "Tag result cache: %s of %s sentences were tagged "
+                    "before.", result_cache.hits,
+                    result_cache.hits + result_cache.misses
+                )
+    if result_cache is not None:
+        result_cache.evict()
+        result_cache.close()
     logging.info("Tagging took: ", datetime.now() - start_time)
@@ -0,0 +1,62 @@
+import glob
+
+import pytest
+
+from src.preprocessing.preprocess import PreprocessConfig
+from utility.benchmark import (
+    STAGES,
+    benchmark_get_pagenumbers,
+    benchmark_stages,
+    benchmark_tokenize,
+    load_pages,
+    run_stage,
+)
+from utility.synthetic_ocr import generate_year
+
+
+def test_benchmark_tokenize():
+    preprocess_data = PreprocessConfig(
+        ABBREVIATION_FILE="./src/preprocessing/abbrevs.txt"
+    )
+    preprocess_data.load_abbrevs()
+    pages = load_pages("tests/test_data/input/obl/2004_000")
+
+    result = benchmark_tokenize(pages, preprocess_data, repeat=1)
+
+    assert len(pages) == 19
+    assert result["tokens"] > 0
+    assert result["tokens_per_second"] > 0
+
+
+def test_benchmark_stages(tmp_path):
+    paths = generate_year(str(tmp_path), 5, words_per_page=100)
+
+    results = benchmark_stages(paths, "./src/preprocessing/abbrevs.txt",
+                               stages=["tokenize", "check_for_abbrev"])
+
+    assert [result["stage"] for result in results] == \
+        ["tokenize", "check_for_abbrev"]
+    for result in results:
+        assert result["pages"] == 5
+        assert result["tokens"] > 0
+        assert result["pages_per_second"] > 0
+        assert result["peak_rss_mb"] > 0
+
+
+@pytest.mark.parametrize("stage", STAGES)
+def test_run_stage(stage):
+    paths = sorted(glob.glob("tests/test_data/input/obl/2004_000/*.txt"))
+
+    result = run_stage(stage, paths, "./src/preprocessing/abbrevs.txt")
+
+    assert result["stage"] == stage
+    assert result["pages"] == 19
+    assert result["tokens_per_second"] > 0
+
+
+def test_benchmark_get_pagenumbers():
+    result = benchmark_get_pagenumbers(200, repeat=1)
+
+    assert result["pages"] == 200
+    assert result["issues"] == 4
+    assert result["pages_per_second"] > 0
@@ -0,0 +1,72 @@
+import glob
+import pickle
+
+import numpy as np
+import pytest
+
+from src.preprocessing.columns import PageColumns, encode_page
+from src.preprocessing.preprocess import (
+    preprocess_file,
+    prep_year_data_for_tagging,
+)
+
+CONF = {"PATH_TO_ABBREVIATION_FILE": "./src/preprocessing/abbrevs.txt"}
+YEAR = "tests/test_data/input/obl/2004_000"
+
+
+def test_page_columns_round_trip():
+    for infile in sorted(glob.glob(YEAR + "/*.txt")):
+        sentences = preprocess_file(infile, CONF)
+        columns = PageColumns.from_sentences(sentences)
+
+        assert len(columns) == len(sentences)
+        assert columns.to_sentences() == sentences
+        assert pickle.loads(pickle.dumps(columns)) == columns
+
+
+def test_page_columns_arrays():
+    sentences = [
+        [{"token": "(", "coord": "1,2,3,4:lpunc"},
+         {"token": "Wortteile", "coord": "1,2,3,4;5,6,7,8:main"},
+         {"token": ".", "coord": "5,6,7,8:rpunc"}],
+        [{"token": "HANS", "coord": "9,10,11,12:main", "normalized": "Hans"}],
+    ]
+
+    columns = PageColumns.from_sentences(sentences)
+
+    assert columns.text == "(Wortteile.HANS"
+    assert columns.token_offsets.tolist() == [0, 1, 10, 11, 15]
+    assert columns.kinds.tolist() == [1, 0, 2, 0]
+    assert columns.boxes.dtype == np.int32
+    assert columns.boxes.tolist() == [
+        [1, 2, 3, 4], [1, 2, 3, 4], [5, 6, 7, 8], [5, 6, 7, 8],
+        [9, 10, 11, 12]
+    ]
+    assert columns.box_offsets.tolist() == [0, 1, 3, 4, 5]
+    assert columns.sentence_offsets.tolist() == [0, 3, 4]
+    assert columns.to_sentences() == sentences
+
+
+@pytest.mark.parametrize(
+    "coord", ["12345:main", "01,2,3,4:main", "1,2,3,4:other", "-1,2,3,4:main"]
+)
+def test_encode_page_falls_back_on_unexpected_coords(coord):
+    sentences = [[{"token": "This", "coord": coord}]]
+
+    with pytest.raises(ValueError):
+        PageColumns.from_sentences(sentences)
+    assert encode_page(sentences) is sentences
+
+
+def test_prep_year_data_for_tagging_columnar():
+    infiles = sorted(glob.glob(YEAR + "/*.txt"))
+    conf = dict(CONF, COLUMNAR_PAGES=True)
+
+    columnar, year = prep_year_data_for_tagging((("obl", "2004"), infiles, conf))
+    expected, _ = prep_year_data_for_tagging((("obl", "2004"), infiles, CONF))
+
+    assert year == ("obl", "2004")
+    assert list(columnar) == list(expected)
+    for page, columns in columnar.items():
+        assert isinstance(columns, PageColumns)
+        assert columns.to_sentences() == expected[page]
@@ -0,0 +1,112 @@
+import glob
+import os
+import zipfile
+
+import pytest
+
+from src.preprocessing.input_files import (
+    find_year_directory,
+    get_page_size,
+    get_year_name,
+    list_year_directories,
+    list_year_pages,
+    open_page,
+    split_archive_path,
+)
+from src.preprocessing.preprocess import execute_preprocessing
+from src.preprocessing.prep_store import iter_prep_years, save_prep_year
+from utility.reprocess_abbrevs import get_year_directory
+
+YEAR = "tests/test_data/input/obl/2004_000"
+PAGES = sorted(glob.glob(YEAR + "/*.txt"))
+
+
+@pytest.fixture
+def archives(tmp_path):
+    # a year archive and a magazine archive with the same pages
+    (tmp_path / "obl").mkdir()
+    with zipfile.ZipFile(tmp_path / "obl" / "2004_000.zip", "w") as year:
+        for page in PAGES:
+            year.write(page, os.path.basename(page))
+    with zipfile.ZipFile(tmp_path / "obx.zip", "w") as magazine:
+        for page in PAGES:
+            magazine.write(page, "2004_000/" + os.path.basename(page))
+        magazine.writestr("2004_000/readme.md", "no page")
+    return tmp_path
+
+
+def test_split_archive_path(archives):
+    year = str(archives / "obl" / "2004_000.zip")
+
+    assert split_archive_path(year + "/a.txt") == (year, "a.txt")
+    assert split_archive_path(str(archives / "obx.zip") + "/2004_000") == \
+        (str(archives / "obx.zip"), "2004_000")
+    assert split_archive_path(YEAR) == (None, YEAR)
+    # directories named like archives are no archives
+    os.mkdir(archives / "grs.zip")
+    assert split_archive_path(str(archives / "grs.zip" / "a.txt")) == \
+        (None, str(archives / "grs.zip" / "a.txt"))
+
+
+def test_list_year_directories(archives):
+    assert list_year_directories(str(archives / "obx.zip")) == \
+        [str(archives / "obx.zip") + "/2004_000"]
+    assert list_year_directories(str(archives / "obl")) == \
+        [str(archives / "obl" / "2004_000.zip")]
+
+
+def test_get_year_name():
+    assert get_year_name("/input/obl/2004_000.zip") == ["obl", "2004_000"]
+    assert get_year_name("/input/grs.zip/1990_000/") == ["grs", "1990_000"]
+    assert get_year_name(YEAR) == ["obl", "2004_000"]
+
+
+def test_find_year_directory(archives):
+    assert find_year_directory(str(archives), "obl", "2004_000") == \
+        str(archives / "obl" / "2004_000.zip")
+    assert find_year_directory(str(archives), "obx", "2004_000") == \
+        str(archives / "obx.zip" / "2004_000")
+    assert find_year_directory(str(archives), "grs", "1990_000") == \
+        str(archives / "grs" / "1990_000")
+    assert get_year_directory(("obx", "2004_000"),
+                              {"PATH_TO_INPUT_FOLDERS": str(archives)}) == \
+        str(archives / "obx.zip" / "2004_000")
+
+
+def test_iter_prep_years_of_archives(archives, tmp_path):
+    year = str(archives / "obx.zip" / "2004_000")
+    conf = {"PATH_TO_OUTFILE_FOLDER": str(tmp_path / "out"),
+            "CUSTOM_PATHS": [year]}
+    save_prep_year(("obx", "2004_000"), {"a.txt": [[{"token": "Hans",
+                                                     "coord": "1"}]]}, conf)
+
+    assert [name for name, _ in iter_prep_years(conf)] == \
+        [("obx", "2004_000")]
+    assert get_year_directory(("obx", "2004_000", "-", "00"), conf) == year
+
+
+@pytest.mark.parametrize("year", ["obl/2004_000.zip", "obx.zip/2004_000"])
+def test_read_pages_from_archive(archives, year):
+    year_directory = str(archives / year)
+    pages = list_year_pages(year_directory)
+
+    assert [os.path.basename(page) for page in pages] == \
+        [os.path.basename(page) for page in PAGES]
+    assert get_year_name(year_directory)[-1] == "2004_000"
+    for page, original in zip(pages, PAGES):
+        assert get_page_size(page) == os.path.getsize(original)
+        with open_page(page) as inf, open(original, encoding="utf8") as orig:
+            assert inf.read() == orig.read()
+
+
+def test_execute_preprocessing_from_archives(archives):
+    conf = {"PATH_TO_ABBREVIATION_FILE": "./src/preprocessing/abbrevs.txt",
+            "BATCH_SIZE": 2}
+    expected = list(execute_preprocessing(dict(conf, CUSTOM_PATHS=[YEAR])))
+
+    result = list(execute_preprocessing(
+        dict(conf, PATH_TO_INPUT_FOLDERS=str(archives))
+    ))
+
+    assert result == [(("obl", "2004_000"), expected[0][1]),
+                      (("obx", "2004_000"), expected[0][1])]
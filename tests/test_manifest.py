@@ -0,0 +1,91 @@
+import glob
+import json
+import os
+import shutil
+from unittest.mock import patch
+
+from src.postprocess import get_data_paths_iterative
+from src.preprocessing.preprocess import execute_preprocessing
+from utility.manifest import Manifest, get_manifest
+
+YEAR = "tests/test_data/input/obl/2004_000"
+
+
+def make_tree(tmp_path):
+    root = tmp_path / "input"
+    shutil.copytree(YEAR, root / "obl" / "2004_000")
+    (root / "obl" / "2005_000").mkdir()
+    (root / "obl" / "2005_000" / "page.txt").write_text("Wort 1,2,3,4\n")
+    return str(root)
+
+
+def test_manifest_glob_and_summary(tmp_path):
+    root = make_tree(tmp_path)
+    manifest = Manifest(str(tmp_path / "manifest.json"))
+    manifest.crawl(root)
+
+    for directory in [root, root + "/obl", root + "/obl/2004_000"]:
+        assert manifest.glob(directory) == sorted(glob.glob(directory + "/*"))
+    assert manifest.glob(root + "/obl/2004_000", "*.txt") == \
+        sorted(glob.glob(root + "/obl/2004_000/*.txt"))
+    page = root + "/obl/2005_000/page.txt"
+    assert manifest.get_size(page) == os.path.getsize(page)
+
+    summary = manifest.get_year_summary()
+    assert summary[os.path.abspath(root + "/obl/2004_000")]["pages"] == 19
+    assert summary[os.path.abspath(root + "/obl/2005_000")] == \
+        {"pages": 1, "size": os.path.getsize(page)}
+
+
+def test_manifest_refreshes_changed_directories(tmp_path):
+    root = make_tree(tmp_path)
+    path = str(tmp_path / "manifest.json")
+    manifest = Manifest(path)
+    manifest.crawl(root)
+    manifest.save()
+    with open(path) as inf:
+        assert len(json.load(inf)["years"]) == 2
+
+    (tmp_path / "input" / "obl" / "2005_000" / "new.txt").write_text("")
+    listed = []
+    scandir = os.scandir
+
+    def record_scandir(directory):
+        listed.append(directory)
+        return scandir(directory)
+
+    manifest = Manifest(path)
+    with patch("os.scandir", side_effect=record_scandir):
+        manifest.crawl(root)
+
+    # only the changed year is listed again
+    assert listed == [os.path.abspath(root + "/obl/2005_000")]
+    assert manifest.glob(root + "/obl/2005_000") == [
+        root + "/obl/2005_000/new.txt", root + "/obl/2005_000/page.txt"
+    ]
+
+
+def test_execute_preprocessing_with_manifest(tmp_path):
+    root = make_tree(tmp_path)
+    conf = {"PATH_TO_ABBREVIATION_FILE": "./src/preprocessing/abbrevs.txt",
+            "PATH_TO_INPUT_FOLDERS": root,
+            "BATCH_SIZE": 2}
+    expected = list(execute_preprocessing(conf))
+
+    conf["PATH_TO_MANIFEST"] = str(tmp_path / "manifest.json")
+    assert list(execute_preprocessing(conf)) == expected
+    assert os.path.exists(conf["PATH_TO_MANIFEST"])
+    assert get_manifest(conf) is get_manifest(conf)
+
+
+def test_get_data_paths_iterative_with_manifest(tmp_path):
+    tag = tmp_path / "output" / "tag"
+    for name in ["obl/2004_000.jsonl", "obl/2005_000-00.jsonl",
+                 "obl/2005_000-01.jsonl", "grs/1990_000.json"]:
+        os.makedirs(os.path.dirname(tag / name), exist_ok=True)
+        (tag / name).write_text("")
+    conf = {"CUSTOM_PATHS": str(tag), "BATCH_SIZE": 10}
+    expected = list(get_data_paths_iterative(conf))
+
+    conf["PATH_TO_MANIFEST"] = str(tmp_path / "manifest.json")
+    assert list(get_data_paths_iterative(conf)) == expected
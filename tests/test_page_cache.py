@@ -0,0 +1,50 @@
+import os
+
+from src.preprocessing.page_cache import (
+    page_cache_key,
+    get_cache_path,
+    load_cached_page,
+    store_cached_page,
+    evict_page_cache,
+)
+
+SENTENCES = [[{"token": "Hello", "coord": "1,2,3,4:main"},
+              {"token": ".", "coord": "1,2,3,4:rpunc"}]]
+
+
+def test_page_cache_key_depends_on_content_and_fingerprint():
+    key = page_cache_key("Hello 1,2,3,4", "abc")
+
+    assert key == page_cache_key("Hello 1,2,3,4", "abc")
+    assert key != page_cache_key("Hello 1,2,3,5", "abc")
+    assert key != page_cache_key("Hello 1,2,3,4", "abd")
+
+
+def test_store_and_load_cached_page(tmp_path):
+    key = page_cache_key("Hello 1,2,3,4", "abc")
+
+    assert load_cached_page(str(tmp_path), key) is None
+    store_cached_page(str(tmp_path), key, SENTENCES)
+
+    assert load_cached_page(str(tmp_path), key) == SENTENCES
+    assert os.listdir(os.path.dirname(get_cache_path(str(tmp_path), key))) \
+        == [key + ".json"]
+
+
+def test_evict_page_cache_removes_least_recently_used(tmp_path):
+    keys = [page_cache_key(str(i), "abc") for i in range(3)]
+    for i, key in enumerate(keys):
+        store_cached_page(str(tmp_path), key, [["x" * 400_000]])
+        path = get_cache_path(str(tmp_path), key)
+        os.utime(path, (i, i))
+
+    removed = evict_page_cache(str(tmp_path), max_mb=1)
+
+    assert removed == 1
+    assert load_cached_page(str(tmp_path), keys[0]) is None
+    assert load_cached_page(str(tmp_path), keys[1]) is not None
+    assert load_cached_page(str(tmp_path), keys[2]) is not None
+
+
+def test_evict_page_cache_missing_directory(tmp_path):
+    assert evict_page_cache(str(tmp_path / "missing")) == 0
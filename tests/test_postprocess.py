@@ -786,6 +786,6 @@ def test_execute_postprocessing_copilot(mock_get_found_names, mock_pool):
     mock_pool.assert_called_with(batch_size)
 
     # Verify get_found_names was called for each item
-    mock_get_found_names.assert_any_call(("year1", "data1"))
-    mock_get_found_names.assert_any_call(("year2", "data2"))
-    mock_get_found_names.assert_any_call(("year3", "data3"))
+    mock_get_found_names.assert_any_call(("year1", "data1"), structure_cache=None)
+    mock_get_found_names.assert_any_call(("year2", "data2"), structure_cache=None)
+    mock_get_found_names.assert_any_call(("year3", "data3"), structure_cache=None)
@@ -0,0 +1,98 @@
+from collections import OrderedDict
+import logging
+import os
+
+import pytest
+
+from src.preprocessing.columns import PageColumns
+from src.preprocessing.preprocess import prep_year_data_for_tagging
+from src.preprocessing.prep_store import (
+    PrepYearFile,
+    get_prep_path,
+    iter_prep_years,
+    save_prep_year,
+    write_prep_file,
+)
+
+CONF = {"PATH_TO_ABBREVIATION_FILE": "./src/preprocessing/abbrevs.txt"}
+YEAR = "tests/test_data/input/obl/2004_000"
+
+
+def test_write_and_read_prep_file(tmp_path):
+    infiles = sorted(os.path.join(YEAR, f) for f in os.listdir(YEAR))
+    files, _ = prep_year_data_for_tagging((("obl", "2004_000"), infiles, CONF))
+    # an unencodable page is kept as plain sentences
+    files["odd.txt"] = [[{"token": "x", "coord": "01,2,3,4:main"}]]
+    path = str(tmp_path / "2004_000.prep")
+
+    write_prep_file(path, files)
+    prepared = PrepYearFile(path)
+
+    assert list(prepared) == list(files)
+    assert len(prepared) == len(files)
+    for name, sentences in files.items():
+        page = prepared[name]
+        if name == "odd.txt":
+            assert page == sentences
+        else:
+            assert isinstance(page, PageColumns)
+            assert page.to_sentences() == sentences
+
+
+def test_read_columnar_pages(tmp_path):
+    sentences = [[{"token": "Zürich", "coord": "1,2,3,4:main"},
+                  {"token": ".", "coord": "1,2,3,4:rpunc"}]]
+    files = OrderedDict([("a.txt", PageColumns.from_sentences(sentences)),
+                         ("empty.txt", PageColumns.from_sentences([]))])
+    path = str(tmp_path / "year.prep")
+
+    write_prep_file(path, files)
+    prepared = PrepYearFile(path)
+
+    assert prepared["a.txt"] == files["a.txt"]
+    assert len(prepared["empty.txt"]) == 0
+
+
+def test_read_invalid_file(tmp_path):
+    path = tmp_path / "year.prep"
+    path.write_bytes(b"not a prep file")
+
+    with pytest.raises(ValueError):
+        PrepYearFile(str(path))
+
+
+@pytest.mark.parametrize("custom_paths, expected", [
+    (None, [("obl", "2004_000"), ("obl", "2005_000-00"),
+            ("obl", "2005_000-01")]),
+    (["/docs/obl/2005_000"], [("obl", "2005_000-00"), ("obl", "2005_000-01")]),
+    (["/docs/obl/2004_000/"], [("obl", "2004_000")]),
+])
+def test_iter_prep_years(tmp_path, custom_paths, expected):
+    conf = {"PATH_TO_OUTFILE_FOLDER": str(tmp_path)}
+    for year in [("obl", "2004_000"), ("obl", "2005_000", "-", "01"),
+                 ("obl", "2005_000", "-", "00")]:
+        save_prep_year(year, {}, conf)
+    if custom_paths:
+        conf["CUSTOM_PATHS"] = custom_paths
+
+    years = [year for year, _ in iter_prep_years(conf)]
+
+    assert years == expected
+    assert get_prep_path(("obl", "2005_000", "-", "00"), conf).endswith(
+        os.path.join("prep", "obl", "2005_000-00.prep")
+    )
+
+
+def test_iter_prep_years_missing(tmp_path, caplog):
+    conf = {"PATH_TO_OUTFILE_FOLDER": str(tmp_path)}
+
+    with pytest.raises(FileNotFoundError):
+        list(iter_prep_years(conf))
+
+    save_prep_year(("obl", "2004_000"), {}, conf)
+    conf["CUSTOM_PATHS"] = ["/docs/obl/2004_000", "/docs/obl/2005_000.zip"]
+    with caplog.at_level(logging.ERROR):
+        years = [year for year, _ in iter_prep_years(conf)]
+
+    assert years == [("obl", "2004_000")]
+    assert "No prepared year for /docs/obl/2005_000.zip" in caplog.text
@@ -1,3 +1,5 @@
+import dataclasses
+import glob
 import json
 import os
 import tempfile
@@ -9,6 +11,7 @@ import pytest
 # If your script is named "preprocessing.py", do:
 from src.preprocessing.preprocess import (
     PreprocessConfig,
+    AbbreviationMatcher,
     fuse_hyphens,
     check_for_abbrev,
     check_roman_numeral,
@@ -16,9 +19,13 @@ from src.preprocessing.preprocess import (
     split_sentences,
     preprocess_file,
     get_year_chunk_paths,
+    cut_by_size,
     prep_year_data_for_tagging,
     start_preprocessing,
     execute_preprocessing,  # timed_execute_preprocessing
+    iter_preprocess_file,
+    stream_preprocessing,
+    pipeline_preprocessing,
 )
 
 
@@ -197,6 +204,47 @@ def test_check_for_abbrev(pos, text, expected, preprocess_data):
     assert check_for_abbrev(pos, text, preprocess_data) == expected
 
 
+# -------------------------------------------------
+# 4b. Test AbbreviationMatcher
+# -------------------------------------------------
+def test_abbreviation_matcher_multi_token():
+    matcher = AbbreviationMatcher([("a.", "d.", "hrsg."), ("vgl.",)])
+    words = ["Siehe", "A.", "d.", "Hrsg.", "und", "a.", "d.", "VGL."]
+
+    assert matcher.match(words) == [
+        False, True, True, True, False, False, False, True
+    ]
+
+
+def test_tokenize_parity_with_check_for_abbrev(preprocess_data):
+    """
+    Tokenizing with the compiled matcher must give exactly the same output
+    as checking every position with check_for_abbrev.
+    """
+    class ReferenceMatcher:
+        def match(self, words):
+            text = [(word,) for word in words]
+            return [check_for_abbrev(pos, text, preprocess_data)
+                    for pos in range(len(text))]
+
+    reference_data = dataclasses.replace(
+        preprocess_data, ABBREVIATION_MATCHER=ReferenceMatcher()
+    )
+    with open(preprocess_data.ABBREVIATION_FILE, encoding="utf8") as inf:
+        abbrev_page = "\n".join(
+            "{} 1,1,1,1".format(word) for word in inf.read().split()
+        )
+    pages = [abbrev_page]
+    for infile in sorted(glob.glob("tests/test_data/input/obl/2004_000/*")):
+        with open(infile, encoding="utf8") as inf:
+            pages.append(inf.read())
+
+    for page in pages:
+        content = fuse_hyphens(page, preprocess_data)
+        assert tokenize(content, preprocess_data) == \
+            tokenize(content, reference_data)
+
+
 # -------------------------------------------------
 # 5. Test tokenize
 # -------------------------------------------------
@@ -401,6 +449,22 @@ sentence. 67891\nAnother 12345\nline 67891\nwith¬ 67891\nhyphen. 67891\n"
         assert sentences[-1][-2]["token"] == "withhyphen"  # Check fuse hyphens
 
 
+def test_preprocess_file_with_cache(tmp_path):
+    conf = {
+        "PATH_TO_ABBREVIATION_FILE": "./src/preprocessing/abbrevs.txt",
+        "PATH_TO_PREP_CACHE": str(tmp_path)
+    }
+    infile = "tests/test_data/input/obl/2004_000/obl-001_2004_000_0012.txt"
+    expected = preprocess_file(
+        infile, {"PATH_TO_ABBREVIATION_FILE": "./src/preprocessing/abbrevs.txt"}
+    )
+
+    assert preprocess_file(infile, conf) == expected
+    with patch("src.preprocessing.preprocess.tokenize") as mock_tokenize:
+        assert preprocess_file(infile, conf) == expected
+        mock_tokenize.assert_not_called()
+
+
 # -------------------------------------------------
 # 8. Test get_year_chunk_paths
 # -------------------------------------------------
@@ -433,6 +497,44 @@ def test_get_year_chunk_paths_with_large_number_of_files_copilot():
             assert files == mock_chunks[i][1]  # Files in the chunk
 
 
+@pytest.mark.parametrize(
+    "sizes, max_size, expected",
+    [
+        ([1, 1, 1, 1], 10, [4]),
+        ([5, 5, 5, 5], 10, [2, 2]),
+        ([9, 1, 1, 1, 1, 1, 1, 1, 1, 1], 10, [1, 9]),
+        ([30, 1, 1], 10, [1, 2]),
+        ([4, 4, 4, 4, 4], 9, [2, 2, 1]),
+    ],
+)
+def test_cut_by_size(sizes, max_size, expected):
+    infiles = [f"page{i}.txt" for i in range(len(sizes))]
+
+    chunks = cut_by_size(infiles, sizes, max_size)
+
+    assert [len(chunk) for chunk in chunks] == expected
+    assert sum(chunks, []) == infiles
+
+
+def test_get_year_chunk_paths_with_memory_budget(tmp_path):
+    year = tmp_path / "obl" / "2004_000"
+    year.mkdir(parents=True)
+    for i in range(6):
+        # about 30000 tokens per page
+        (year / f"obl-001_2004_000_{i:04}.txt").write_text("x" * 22 * 30000)
+
+    # 20 MB are about 65000 tokens
+    result = get_year_chunk_paths(str(year), memory_budget_mb=20)
+
+    assert [chunk for chunk, _ in result] == [
+        ("obl", "2004_000", "-", str(i).zfill(2)) for i in range(3)
+    ]
+    assert [len(infiles) for _, infiles in result] == [2, 2, 2]
+    assert get_year_chunk_paths(str(year), memory_budget_mb=100) == [
+        (("obl", "2004_000"), sorted(str(path) for path in year.iterdir()))
+    ]
+
+
 # -------------------------------------------------
 # 9. Test prep_year_data_for_tagging
 # -------------------------------------------------
@@ -545,6 +647,27 @@ def test_start_preprocessing(year_dirs, conf, expected):
     assert expected == [x for x in start_preprocessing(year_dirs, conf)]
 
 
+def test_start_preprocessing_page_ranges_keep_order():
+    year = "tests/test_data/input/obl/2004_000"
+    conf = {
+        "BATCH_SIZE": 2,
+        "PAGES_PER_TASK": 3,
+        "PATH_TO_ABBREVIATION_FILE": "./src/preprocessing/abbrevs.txt"
+    }
+    expected, _ = prep_year_data_for_tagging(
+        (("obl", "2004_000"), sorted(glob.glob(year + "/*.txt")), conf)
+    )
+
+    result = list(start_preprocessing(["missing", year, "missing2"], conf))
+
+    assert [y for y, _ in result] == [
+        ("missing",), ("obl", "2004_000"), ("missing2",)
+    ]
+    assert result[0][1] == {}
+    assert list(result[1][1].items()) == list(expected.items())
+    assert result[2][1] == {}
+
+
 # -------------------------------------------------
 # 11. Test execute_preprocessing
 # -------------------------------------------------
@@ -571,3 +694,100 @@ def test_start_preprocessing(year_dirs, conf, expected):
 )
 def test_execute_preprocessing(conf, expected):
     assert expected == [x for x in execute_preprocessing(conf)]
+
+
+# -------------------------------------------------
+# 12. Test streaming preprocessing
+# -------------------------------------------------
+def test_iter_preprocess_file_matches_preprocess_file():
+    conf = {"PATH_TO_ABBREVIATION_FILE": "./src/preprocessing/abbrevs.txt"}
+    infiles = sorted(glob.glob("tests/test_data/input/obl/2004_000/*.txt"))
+
+    for infile in infiles:
+        assert list(iter_preprocess_file(infile, conf)) == \
+            preprocess_file(infile, conf)
+
+
+def test_stream_preprocessing():
+    conf = {"PATH_TO_ABBREVIATION_FILE": "./src/preprocessing/abbrevs.txt"}
+    year = "tests/test_data/input/obl/2004_000"
+
+    stream = stream_preprocessing([year], conf)
+    assert not isinstance(stream, list)
+
+    expected, _ = prep_year_data_for_tagging(
+        (("obl", "2004_000"), sorted(glob.glob(year + "/*.txt")), conf)
+    )
+    expected = [(("obl", "2004_000"), page, sentence)
+                for page, sentences in expected.items()
+                for sentence in sentences]
+    assert list(stream) == expected
+
+
+@pytest.mark.parametrize("columnar", [False, True])
+def test_pipeline_preprocessing(columnar):
+    conf = {
+        "BATCH_SIZE": 2,
+        "PAGES_PER_TASK": 3,
+        "PIPELINE_QUEUE_SIZE": 1,
+        "COLUMNAR_PAGES": columnar,
+        "PATH_TO_ABBREVIATION_FILE": "./src/preprocessing/abbrevs.txt"
+    }
+    years = ["tests/test_data/input/obl/2004_000", "missing",
+             "tests/test_data/input/obl/2004_000"]
+
+    expected = list(stream_preprocessing(years[:1], conf))
+    if columnar:
+        # columnar pages are yielded as the tuples the tagger takes
+        expected = [
+            (year, page, [(token.get("normalized", token["token"]),
+                           token["coord"], token["token"])
+                          for token in sentence])
+            for year, page, sentence in expected
+        ]
+
+    assert list(pipeline_preprocessing(years, conf)) == expected * 2
+
+
+def test_pipeline_preprocessing_stops_early():
+    conf = {
+        "BATCH_SIZE": 2,
+        "PAGES_PER_TASK": 1,
+        "PIPELINE_QUEUE_SIZE": 1,
+        "PATH_TO_ABBREVIATION_FILE": "./src/preprocessing/abbrevs.txt"
+    }
+    stream = pipeline_preprocessing(["tests/test_data/input/obl/2004_000"],
+                                    conf)
+
+    year, _, _ = next(stream)
+    stream.close()
+
+    assert year == ("obl", "2004_000")
+
+
+def test_pipeline_preprocessing_raises_worker_errors():
+    conf = {
+        "BATCH_SIZE": 2,
+        "PATH_TO_ABBREVIATION_FILE": "/missing/abbrevs.txt"
+    }
+
+    with pytest.raises(FileNotFoundError):
+        list(pipeline_preprocessing(["tests/test_data/input/obl/2004_000"],
+                                    conf))
+
+
+def test_execute_preprocessing_stream():
+    conf = {
+        "BATCH_SIZE": 3,
+        "PATH_TO_ABBREVIATION_FILE": "./src/preprocessing/abbrevs.txt",
+        "CUSTOM_PATHS": ["tests/test_data/input/obl/2004_000"]
+    }
+
+    result = list(execute_preprocessing(conf, stream=True))
+
+    assert len(result) > 0
+    assert all(year == ("obl", "2004_000") for year, _, _ in result)
+    assert result[0][1] == "obl-001_2004_000_0003.txt"
+
+    conf["PIPELINE_PREPROCESSING"] = True
+    assert list(execute_preprocessing(conf, stream=True)) == result
@@ -0,0 +1,136 @@
+import glob
+import json
+import os
+from unittest.mock import MagicMock, patch
+
+from src.preprocessing.preprocess import (
+    execute_preprocessing,
+    preprocess_file,
+)
+from src.preprocessing.prep_store import PrepYearFile, save_prep_year
+from src.preprocessing.token_index import (
+    build_token_index,
+    get_index_path,
+    iter_page_words,
+)
+from utility.reprocess_abbrevs import (
+    find_affected_pages,
+    get_changed_abbrevs,
+    merge_tagged_pages,
+    reprocess_abbrevs,
+)
+
+ABBREVS = "./src/preprocessing/abbrevs.txt"
+YEAR = "tests/test_data/input/obl/2004_000"
+
+
+def write_new_abbrevs(tmp_path, removed):
+    with open(ABBREVS, encoding="utf8") as inf:
+        lines = [line for line in inf if line.strip() not in removed]
+    new_abbrevs = tmp_path / "abbrevs.txt"
+    new_abbrevs.write_text("".join(lines), encoding="utf8")
+    return str(new_abbrevs)
+
+
+def test_get_changed_abbrevs(tmp_path):
+    new_abbrevs = write_new_abbrevs(tmp_path, {"Dr.", "a. d. O."})
+
+    assert get_changed_abbrevs(ABBREVS, new_abbrevs) == {
+        ("dr.",), ("a.", "d.", "o.")
+    }
+
+
+def test_find_affected_pages():
+    index = {"pages": ["a.txt", "b.txt", "c.txt"],
+             "tokens": {"a": [0, 1], "d": [1, 2], "o": [1], "dr": [2]}}
+
+    assert find_affected_pages(index, {("a.", "d.", "o.")}) == ["b.txt"]
+    assert find_affected_pages(index, {("dr.",), ("a.", "x.")}) == ["c.txt"]
+    assert find_affected_pages(index, set()) == []
+
+
+def test_merge_tagged_pages(tmp_path):
+    outfile = tmp_path / "2004_000.jsonl"
+    outfile.write_text('{"a.txt": [1]}\n{"b.txt": [2]}\n{"b.txt": [3]}\n'
+                       '{"d.txt": [4]}\n')
+    new = tmp_path / "2004_000.jsonl.new"
+    new.write_text('{"b.txt": [5]}\n{"c.txt": [6]}\n')
+
+    merge_tagged_pages(str(outfile), str(new), ["b.txt", "c.txt", "d.txt"])
+
+    assert outfile.read_text() == '{"a.txt": [1]}\n{"b.txt": [5]}\n' \
+        '{"c.txt": [6]}\n'
+    assert not new.exists()
+
+
+def test_merge_tagged_pages_keeps_order(tmp_path):
+    # the pages of a split year are in the order of the issues
+    outfile = tmp_path / "1980_000-00.jsonl"
+    outfile.write_text('{"z.txt": [1]}\n{"m.txt": [2]}\n{"a.txt": [3]}\n')
+    new = tmp_path / "1980_000-00.jsonl.new"
+    new.write_text('{"a.txt": [4]}\n{"z.txt": [5]}\n')
+
+    merge_tagged_pages(str(outfile), str(new), ["a.txt", "z.txt"])
+
+    assert outfile.read_text() == '{"z.txt": [5]}\n{"m.txt": [2]}\n' \
+        '{"a.txt": [4]}\n'
+
+
+def test_reprocess_abbrevs(tmp_path):
+    conf = {
+        "PATH_TO_ABBREVIATION_FILE": ABBREVS,
+        "PATH_TO_OUTFILE_FOLDER": str(tmp_path),
+        "CUSTOM_PATHS": [YEAR],
+        "BATCH_SIZE": 2,
+        "SENTENCE_BATCH_SIZE": 8,
+        "WRITE_TOKEN_INDEX": True,
+    }
+    for year, files in execute_preprocessing(conf):
+        save_prep_year(year, files, conf)
+    # a stale key on every page, which only the reprocessed pages lose
+    index_path = get_index_path(("obl", "2004_000"), conf)
+    with open(index_path) as inf:
+        index = json.load(inf)
+    index["tokens"]["stale"] = list(range(len(index["pages"])))
+    with open(index_path, mode="w") as out:
+        json.dump(index, out)
+    tag_folder = tmp_path / "tag" / "obl"
+    tag_folder.mkdir(parents=True)
+    (tag_folder / "2004_000.jsonl").write_text("")
+
+    conf["PATH_TO_ABBREVIATION_FILE"] = write_new_abbrevs(
+        tmp_path, {"Dr.", "bzw."}
+    )
+    with patch("src.tag_flair.setup_flair_tagger", return_value=MagicMock()):
+        reprocessed = reprocess_abbrevs(conf, ABBREVS)
+
+    changed = []
+    for infile in sorted(glob.glob(YEAR + "/*.txt")):
+        old = preprocess_file(infile, {"PATH_TO_ABBREVIATION_FILE": ABBREVS})
+        new = preprocess_file(infile, conf)
+        if old != new:
+            changed.append(os.path.basename(infile))
+    assert changed
+    assert set(changed) <= set(reprocessed[("obl", "2004_000")])
+
+    prepared = PrepYearFile(str(tmp_path / "prep" / "obl" / "2004_000.prep"))
+    for infile in sorted(glob.glob(YEAR + "/*.txt")):
+        page = os.path.basename(infile)
+        assert prepared[page].to_sentences() == preprocess_file(infile, conf)
+    with open(tag_folder / "2004_000.jsonl") as inf:
+        tagged = {next(iter(json.loads(line))) for line in inf}
+    assert tagged == set(reprocessed[("obl", "2004_000")])
+
+    # the index has the tokens of the new preprocessing
+    with open(index_path) as inf:
+        index = json.load(inf)
+    stale = index["tokens"].pop("stale")
+    assert index == build_token_index(
+        (os.path.basename(infile),
+         iter_page_words(preprocess_file(infile, conf)))
+        for infile in sorted(glob.glob(YEAR + "/*.txt"))
+    )
+    assert [index["pages"][position] for position in stale] == [
+        page for page in index["pages"]
+        if page not in reprocessed[("obl", "2004_000")]
+    ]
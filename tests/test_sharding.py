@@ -0,0 +1,182 @@
+import argparse
+import json
+import os
+from unittest.mock import patch
+
+import pytest
+
+import main
+from src.evaluation import execute_evaluation
+from utility.sharding import (
+    apply_shard,
+    assign_shards,
+    get_year_key,
+    in_shard,
+    list_input_years,
+    parse_shard,
+)
+
+
+def make_tree(tmp_path, years):
+    root = tmp_path / "input"
+    for (magazine, year), pages in years.items():
+        directory = root / magazine / year
+        directory.mkdir(parents=True)
+        for page in range(pages):
+            (directory / f"{magazine}-001_{year}_{page:04}.txt").write_text(
+                "Wort 1,2,3,4\n"
+            )
+    return str(root)
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("0/1", (0, 1)),
+    ("3/4", (3, 4)),
+])
+def test_parse_shard(value, expected):
+    assert parse_shard(value) == expected
+
+
+@pytest.mark.parametrize("value", ["4/4", "-1/4", "0/0", "1", "a/b", "1/2/3"])
+def test_parse_shard_invalid(value):
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_shard(value)
+
+
+def test_assign_shards_balanced_and_deterministic():
+    year_pages = {"a": 10, "b": 7, "c": 5, "d": 4, "e": 3, "f": 1}
+
+    shards = assign_shards(year_pages, 2)
+
+    assert shards == [["a", "d", "f"], ["b", "c", "e"]]
+    assert assign_shards(dict(reversed(year_pages.items())), 2) == shards
+    # more shards than years leaves some shards empty
+    assert assign_shards({"a": 1}, 3) == [["a"], [], []]
+
+
+def test_apply_shard(tmp_path):
+    root = make_tree(tmp_path, {
+        ("obl", "2004_000"): 6, ("obl", "2005_000"): 2,
+        ("grs", "1990_000"): 3, ("grs", "1991_000"): 3,
+    })
+    conf = {"PATH_TO_INPUT_FOLDERS": root,
+            "PATH_TO_OUTFILE_FOLDER": str(tmp_path / "out") + "/"}
+    all_years = list_input_years(conf)
+
+    shards = []
+    for index in range(2):
+        shard_conf = dict(conf)
+        years = apply_shard(shard_conf, index, 2)
+        shards.append(years)
+        # the input folder is filtered by the keys of the shard
+        assert "CUSTOM_PATHS" not in shard_conf
+        assert shard_conf["SHARD_YEARS"] == \
+            [year.split("/")[-2:] for year in years]
+        assert shard_conf["SHARD"] == [index, 2]
+        assert shard_conf["PATH_TO_OUTFILE_FOLDER"] == os.path.join(
+            str(tmp_path), "out", "shards", f"{index}_of_2", ""
+        )
+
+    # every year is in exactly one shard, balanced by the pages
+    assert sorted(shards[0] + shards[1]) == sorted(all_years)
+    assert shards == [
+        [root + "/obl/2004_000", root + "/obl/2005_000"],
+        [root + "/grs/1990_000", root + "/grs/1991_000"],
+    ]
+
+
+def test_apply_shard_custom_paths(tmp_path):
+    root = make_tree(tmp_path, {
+        ("obl", "2004_000"): 6, ("obl", "2005_000"): 2,
+        ("grs", "1990_000"): 3,
+    })
+    conf = {"PATH_TO_INPUT_FOLDERS": root,
+            "PATH_TO_OUTFILE_FOLDER": str(tmp_path / "out") + "/",
+            "CUSTOM_PATHS": [root + "/obl/2005_000", root + "/grs/1990_000"]}
+
+    years = apply_shard(conf, 1, 2)
+
+    assert years == conf["CUSTOM_PATHS"] == [root + "/obl/2005_000"]
+    assert conf["SHARD_YEARS"] == [["obl", "2005_000"]]
+
+
+def test_get_year_key():
+    assert get_year_key("/in/obl/2004_000") == ["obl", "2004_000"]
+    assert get_year_key("/in/obl/2004_000.zip") == ["obl", "2004_000"]
+    assert get_year_key("out/tag/obl/2004_000.jsonl") == ["obl", "2004_000"]
+    assert get_year_key("out/tag/obl/1980_000-00.jsonl") == \
+        ["obl", "1980_000"]
+
+
+def test_main_shard_finish_custom_paths(tmp_path):
+    tagged = []
+    for magazine, year, size in [("obl", "2004_000", 600),
+                                 ("obl", "2005_000", 200),
+                                 ("grs", "1990_000", 300),
+                                 ("grs", "1991_000", 250)]:
+        path = tmp_path / "tag" / magazine / f"{year}.jsonl"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("x" * size)
+        tagged.append(str(path))
+    config_file = tmp_path / "conf.json"
+    config_file.write_text(json.dumps({
+        "PATH_TO_INPUT_FOLDERS": str(tmp_path / "input"),
+        "PATH_TO_OUTFILE_FOLDER": str(tmp_path / "out") + "/",
+        "BATCH_SIZE": 8,
+    }))
+
+    shards = []
+    for index in range(2):
+        argv = ["main.py", "--shard", f"{index}/2", "--tasks", "finish",
+                "--magazine_year_paths", ",".join(tagged),
+                "--config_file", str(config_file)]
+        with patch("sys.argv", argv), \
+                patch("main.execute_postprocessing",
+                      return_value=iter([])) as post, \
+                patch("main.execute_aggregation"), \
+                patch("main.execute_linking"):
+            main.main()
+        shards.append({key: value for year_dict in post.call_args[0][0]
+                       for key, value in year_dict.items()})
+
+    # the given tagged years are split between the shards
+    assert shards == [
+        {("obl", "2004_000"): [tagged[0]]},
+        {("obl", "2005_000"): [tagged[1]], ("grs", "1990_000"): [tagged[2]],
+         ("grs", "1991_000"): [tagged[3]]},
+    ]
+
+
+def test_in_shard():
+    conf = {"SHARD": [0, 2], "SHARD_YEARS": [["obl", "2004_000"]]}
+
+    assert in_shard(conf, "obl", "2004_000.json")
+    assert in_shard(conf, "obl", "2004_000-01.jsonl")
+    assert not in_shard(conf, "obl", "2005_000.json")
+    assert not in_shard(conf, "grs", "2004_000.json")
+    assert in_shard({}, "grs", "2004_000.json")
+
+
+def test_execute_evaluation_only_evaluates_shard(tmp_path):
+    gt = tmp_path / "gt"
+    for magazine, year in [("obl", "2004_000"), ("obl", "2005_000"),
+                           ("grs", "1990_000")]:
+        (gt / magazine).mkdir(parents=True, exist_ok=True)
+        (gt / magazine / f"{year}.json").write_text("{}")
+    (gt / "obl" / "notes.txt").write_text("")
+    conf = {"SHARD": [0, 2], "SHARD_YEARS": [["obl", "2004_000"]]}
+
+    with patch("src.evaluation.Paths") as paths, \
+            patch("src.evaluation.evaluate_person", return_value={}) \
+            as evaluate, patch("src.evaluation.Scores"):
+        paths.return_value.success = True
+        paths.return_value.get.side_effect = \
+            lambda type_, key: str(gt) if key == "" else \
+            str(gt / paths.return_value.update.call_args.kwargs["value"])
+        execute_evaluation(conf, "ref", True)
+
+    files = [call.kwargs["value"]
+             for call in paths.return_value.update.call_args_list
+             if call.kwargs["key"] == "file"]
+    assert files == ["2004_000.json"]
+    assert evaluate.call_count == 1
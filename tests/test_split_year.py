@@ -1,11 +1,17 @@
 from unittest.mock import patch, MagicMock
 from lxml import etree
 import logging
+from utility.synthetic_ocr import generate_structure_xml
 from utility.split_year import (
     get_pagenumbers,
     check_for_missing_pages,
     cut_pagenumbers,
     compare_pagenames,
+    load_page_reports,
+    reconcile_pagenames,
+    resolve_chunk_pages,
+    report_unresolved_pages,
+    split_year_at_articles,
     split_directory
 )
 LOGGER = logging.getLogger(__name__)
@@ -87,6 +93,70 @@ def test_get_pagenumbers_with_missing_resource_id_copilot():
     assert issue_dict["Issue1"] == []
 
 
+def test_get_pagenumbers_regions_and_duplicates():
+    xml_content = """
+    <root>
+        <element type="Issue" ID="1">
+            <attr type="IssueNumber">Issue1</attr>
+            <element ID="2"/>
+            <element ID="3"/>
+        </element>
+        <element type="Agora:Page" ID="p1">
+            <resource-id>r1</resource-id>
+            <element type="Agora:Region" ID="p1-0"/>
+        </element>
+        <element type="Agora:Page" ID="p2">
+            <resource-id>r2</resource-id>
+        </element>
+        <element type="Agora:Page" ID="p2">
+            <resource-id>r1</resource-id>
+        </element>
+        <link-list>
+            <link from="3" to="p2"/>
+            <link from="2" to="p1-0"/>
+            <link from="2" to="p2"/>
+            <link from="1" to="p1"/>
+        </link-list>
+        <resource-list>
+            <resource ID="r1">
+                <attr type="Agora:Path">/path/to/page1.jpg</attr>
+            </resource>
+            <resource ID="r2">
+                <attr type="Agora:Path">/path/to/page2.jpg</attr>
+            </resource>
+            <resource ID="r2">
+                <attr type="Agora:Path">/path/to/other.jpg</attr>
+            </resource>
+        </resource-list>
+    </root>
+    """
+    xml = etree.fromstring(xml_content)
+
+    returncode, issue_dict = get_pagenumbers(xml)
+
+    # regions resolve to their page, the first element and resource with an
+    # ID win and every page is only listed once per issue
+    assert returncode == 0
+    assert issue_dict == {"Issue1": ["page1.txt", "page2.txt"]}
+
+
+def test_get_pagenumbers_synthetic_structure(tmp_path):
+    path = str(tmp_path / "structure.xml")
+    generate_structure_xml(path, 120, pages_per_issue=50)
+    xml = etree.parse(path).getroot()
+
+    returncode, issue_dict = get_pagenumbers(xml)
+
+    assert returncode == 0
+    assert list(issue_dict) == ["1", "2", "3"]
+    assert [len(pages) for pages in issue_dict.values()] == [50, 50, 20]
+    # the articles link their pages in order, the cover linked by the
+    # issue itself is already listed
+    assert issue_dict["1"] == [
+        "syn-001_2000_000_{:04}.txt".format(i) for i in range(1, 51)
+    ]
+
+
 # -------------------------------------------------
 # Test check_for_missing_pages
 # -------------------------------------------------
@@ -180,6 +250,100 @@ def test_cut_pagenumbers_with_multiple_issues_copilot():
     assert len(result[1]) == 1  # Second chunk contains issue3
 
 
+def test_split_year_at_articles_never_cuts_articles():
+    pages = [f"page{i}" for i in range(10)]
+    # the second article shares its first page with the first one
+    articles = {"1": [pages[0:4], pages[3:7], pages[7:8], pages[8:10]]}
+
+    assert split_year_at_articles({"1": pages}, articles, 5) == \
+        [{"1-0": pages[0:7]}, {"1-1": pages[7:10]}]
+    assert split_year_at_articles({"1": pages}, articles, 4) == \
+        [{"1-0": pages[0:7]}, {"1-1": pages[7:8]}, {"1-2": pages[8:10]}]
+
+
+def test_split_year_at_articles_balances_weights():
+    pages = [f"page{i}" for i in range(8)]
+    articles = {"1": [[page] for page in pages]}
+    # the first two pages are as large as the other six together
+    weights = dict(zip(pages, [30, 30, 10, 10, 10, 10, 10, 10]))
+
+    assert split_year_at_articles({"1": pages}, articles, 4) == \
+        [{"1-0": pages[:4]}, {"1-1": pages[4:]}]
+    assert split_year_at_articles({"1": pages}, articles, 6,
+                                  page_weights=weights) == \
+        [{"1-0": pages[:2]}, {"1-1": pages[2:]}]
+
+
+def test_split_year_at_articles_caps_pages():
+    pages = [f"page{i}" for i in range(30)]
+    articles = {"1": [[page] for page in pages]}
+    # one very heavy page followed by many light ones
+    weights = {page: 1 for page in pages}
+    weights["page0"] = 1000
+
+    chunks = split_year_at_articles({"1": pages}, articles, 10,
+                                    page_weights=weights)
+
+    assert [len(part) for chunk in chunks for part in chunk.values()] == \
+        [1, 10, 9, 10]
+    assert [page for chunk in chunks for part in chunk.values()
+            for page in part] == pages
+
+
+def test_cut_pagenumbers_at_article_borders(caplog):
+    pages = [f"page{i}" for i in range(1, 1201)]
+    # articles of 7 pages, so a cut every 500 pages would cut through them
+    articles = [pages[i:i + 7] for i in range(0, 1200, 7)]
+    pagenos = {"issue0": ["cover"], "issue1": pages}
+
+    with caplog.at_level(logging.WARNING):
+        result = cut_pagenumbers(pagenos, 500, 1000,
+                                 articles={"issue1": articles})
+
+    assert "split at article borders" in caplog.text
+    assert list(result[0]) == ["issue0", "issue1-0"]
+    assert result[0]["issue0"] == ["cover"]
+    parts = [chunk[f"issue1-{i}"] for i, chunk in enumerate(result)]
+    assert sum(parts, []) == pages
+    # three chunks of about the same size, all of them start an article
+    assert [sum(map(len, chunk.values())) for chunk in result] == \
+        [400, 399, 402]
+    assert all(pages.index(part[0]) % 7 == 0 for part in parts)
+
+
+def test_cut_pagenumbers_balances_normal_issues():
+    pagenos = {}
+    articles = {}
+    for issue, length in [("1", 400), ("2", 150), ("3", 400), ("4", 50)]:
+        pagenos[issue] = [f"{issue}-page{i}" for i in range(length)]
+        articles[issue] = [pagenos[issue][i:i + 10]
+                           for i in range(0, length, 10)]
+
+    # whole issues are packed into uneven chunks
+    assert [sum(map(len, chunk.values()))
+            for chunk in cut_pagenumbers(pagenos, 500, 1000)] == \
+        [400, 150, 450]
+
+    result = cut_pagenumbers(pagenos, 500, 1000, articles=articles)
+    assert result == [
+        {"1": pagenos["1"], "2-0": pagenos["2"][:100]},
+        {"2-1": pagenos["2"][100:], "3": pagenos["3"], "4": pagenos["4"]},
+    ]
+
+    # the pages of the first issue are twice as large
+    weights = {page: 2 if page.startswith("1-") else 1
+               for pages in pagenos.values() for page in pages}
+    result = cut_pagenumbers(pagenos, 500, 1000, articles=articles,
+                             page_weights=weights)
+    # the rest of the year is too long for one chunk
+    assert result == [
+        {"1-0": pagenos["1"][:350]},
+        {"1-1": pagenos["1"][350:], "2": pagenos["2"],
+         "3-0": pagenos["3"][:100]},
+        {"3-1": pagenos["3"][100:], "4": pagenos["4"]},
+    ]
+
+
 # -------------------------------------------------
 # Test compare_pagenames
 # -------------------------------------------------
@@ -190,9 +354,13 @@ def test_compare_pagenames_matching_pages_copilot():
         "/path/to/page3.txt",
         "/path/to/page4.txt"
     ]
+    pagenos = {
+        "issue1": ["page1.txt", "page2.txt"],
+        "issue2": ["page3.txt", "page4.txt"]
+    }
     page_count = 4
 
-    assert compare_pagenames("", year_pages, page_count, "") == 0
+    assert compare_pagenames(pagenos, year_pages, page_count, "") == 0
 
 
 def test_compare_pagenames_missing_pages_copilot():
@@ -236,6 +404,85 @@ def test_compare_pagenames_extra_pages_copilot():
     mock_open_.assert_called()  # Ensure logs were written
 
 
+def test_compare_pagenames_same_count_different_pages(tmp_path,
+                                                      monkeypatch):
+    monkeypatch.setattr("utility.split_year.REPORT_FOLDER", str(tmp_path))
+    pagenos = {"1": ["page1.txt", "page2.txt"]}
+    directory = "/in/obl/2004_000"
+    # an older report of the year is still valid
+    compare_pagenames(pagenos, [directory + "/page1.txt"], 2, directory)
+
+    # one page is missing and another one is extra
+    year_pages = [directory + "/page1.txt", directory + "/page3.txt"]
+    assert compare_pagenames(pagenos, year_pages, 2, directory) == -1
+
+    reports = load_page_reports()
+    assert [(report["missing"], report["extra"]) for report in reports] == \
+        [(["page2.txt"], ["page3.txt"])]
+
+
+def test_reconcile_pagenames():
+    pagenos = {"1": ["page1.txt", "page2.txt"], "2": ["page4.txt"]}
+    year_pages = ["/year/page1.txt", "/year/page3.txt", "/year/page4.txt",
+                  "/year/page5.txt"]
+
+    assert reconcile_pagenames(pagenos, year_pages) == (
+        ["page2.txt"], ["page3.txt", "page5.txt"]
+    )
+
+
+def test_compare_pagenames_writes_report(tmp_path, monkeypatch):
+    monkeypatch.setattr("utility.split_year.REPORT_FOLDER", str(tmp_path))
+    pagenos = {"1": ["page1.txt", "page2.txt"], "2": ["page4.txt"]}
+    year_pages = ["/in/obl/2004_000/page1.txt", "/in/obl/2004_000/page3.txt"]
+
+    assert compare_pagenames(pagenos, year_pages, 3, "/in/obl/2004_000") == -1
+
+    assert load_page_reports() == [{
+        "directory": "/in/obl/2004_000",
+        "issue_pages": 3,
+        "directory_pages": 2,
+        "missing": ["page2.txt", "page4.txt"],
+        "extra": ["page3.txt"],
+    }]
+
+    # once the pages match, the report is removed
+    year_pages = ["/in/obl/2004_000/page{}.txt".format(i) for i in [1, 2, 4]]
+    assert compare_pagenames(pagenos, year_pages, 3, "/in/obl/2004_000") == 0
+    assert load_page_reports() == []
+
+
+# -------------------------------------------------
+# Test resolve_chunk_pages
+# -------------------------------------------------
+def test_resolve_chunk_pages():
+    chunks = [{"1": ["a.txt", "b.txt"]}, {"2": ["c.txt", "x.txt"],
+                                          "3": ["ya.txt"]}]
+    year_pages = ["/year/a.txt", "/year/b.txt", "/year/c.txt",
+                  "/year/ya.txt", "/year/xa.txt"]
+
+    chunk_pagepaths, unresolved = resolve_chunk_pages(chunks, year_pages)
+
+    assert chunk_pagepaths == [["/year/a.txt", "/year/b.txt"],
+                               ["/year/c.txt", "/year/ya.txt"]]
+    assert unresolved == ["x.txt"]
+
+
+def test_report_unresolved_pages(tmp_path, monkeypatch, caplog):
+    log_path = tmp_path / "pipeline.log"
+    monkeypatch.setattr("utility.split_year.LOG_PATH", str(log_path))
+    pages = ["page{}.txt".format(i) for i in range(12)]
+
+    with caplog.at_level(logging.ERROR):
+        report_unresolved_pages("/year", pages)
+
+    # one message for all pages instead of one per page
+    assert len(caplog.records) == 1
+    assert "12 pages" in caplog.text and "page11.txt" not in caplog.text
+    assert log_path.read_text().count("\n") == 1
+    assert "page11.txt" in log_path.read_text()
+
+
 # -------------------------------------------------
 # Test split_directory
 # -------------------------------------------------
@@ -0,0 +1,247 @@
+import gzip
+import json
+import os
+from unittest.mock import patch
+
+import pytest
+from lxml import etree
+
+from src.postprocess import get_structure_info
+from utility import structure_cache
+from utility.split_year import split_directory
+from utility.structure_cache import (
+    distill_structure,
+    get_cache_path,
+    get_structure_paths,
+    load_structure,
+    stream_structure,
+)
+from utility.synthetic_ocr import generate_structure_xml
+
+XML_CONTENT = """<root>
+    <element-list>
+        <element type="Agora:Document">
+            <attr type="Agora:DocumentID">doc123</attr>
+        </element>
+        <element type="Agora:ImageSet">
+            <element type="Agora:Page" ID="page1">
+                <attr type="Agora:PhysicalNo">1</attr>
+                <resource-id>res1</resource-id>
+            </element>
+            <element type="Agora:Page" ID="page2">
+                <attr type="Agora:PhysicalNo">2</attr>
+                <resource-id>res2</resource-id>
+            </element>
+        </element>
+        <element type="Journal" ID="journal">
+            <element type="Issue" ID="issue1">
+                <attr type="IssueNumber">1</attr>
+                <element type="Article" ID="article1">
+                    <element type="Paragraph" ID="paragraph1"/>
+                </element>
+            </element>
+        </element>
+    </element-list>
+    <link-list>
+        <link from="journal" to="page1"/>
+        <link from="article1" to="page1"/>
+        <link from="article1" to="page2"/>
+        <link from="paragraph1" to="page2"/>
+    </link-list>
+    <resource-list>
+        <resource ID="res1">
+            <attr type="Agora:Path">/path/to/obl_2004_000_0001.jpg</attr>
+        </resource>
+        <resource ID="res2">
+            <attr type="Agora:Path">/path/to/obl_2004_000_0002.jpg</attr>
+        </resource>
+    </resource-list>
+</root>
+"""
+
+
+@pytest.fixture
+def mount(tmp_path, monkeypatch):
+    monkeypatch.setattr(structure_cache, "CACHE_DIR", str(tmp_path / "cache"))
+    mount = tmp_path / "mnt"
+    (mount / "xml.cache.prod01" / "obl").mkdir(parents=True)
+    (mount / "xml.cache.staging01" / "obl").mkdir(parents=True)
+    return str(mount)
+
+
+def test_get_structure_paths():
+    assert get_structure_paths("/mnt/", "obl", "2004_000") == [
+        "/mnt/xml.cache.prod01/obl/obl_2004_000.xml",
+        "/mnt/xml.cache.staging01/obl/obl_2004_000.xml",
+    ]
+    assert get_structure_paths("/mnt/", "bse-cr", "1990_000")[0] == \
+        "/mnt/xml.cache.prod01/bse-cr/BSE-CR-1990_000.xml"
+
+
+def test_load_structure_parses_once(mount):
+    prod_path, staging_path = get_structure_paths(mount, "obl", "2004_000")
+    with open(prod_path, mode="w", encoding="utf8") as out:
+        out.write(XML_CONTENT)
+
+    structure = load_structure([prod_path, staging_path])
+    with patch("lxml.etree.parse") as mock_parse:
+        cached = load_structure([prod_path, staging_path])
+
+    mock_parse.assert_not_called()
+    assert cached == structure
+    assert structure["returncode"] == 0
+    assert structure["issues"] == {
+        "1": ["obl_2004_000_0001.txt", "obl_2004_000_0002.txt"]
+    }
+    assert structure["pages"] == {
+        "obl_2004_000_0001.txt": ("doc123:page1", ["article1"], "1"),
+        # paragraphs are resolved to their article
+        "obl_2004_000_0002.txt": ("doc123:page2",
+                                  ["article1", "paragraph1", "article1"],
+                                  "2"),
+    }
+
+
+def test_load_structure_invalidated_by_mtime(mount):
+    prod_path, _ = get_structure_paths(mount, "obl", "2004_000")
+    with open(prod_path, mode="w", encoding="utf8") as out:
+        out.write(XML_CONTENT)
+    load_structure([prod_path])
+
+    with open(prod_path, mode="w", encoding="utf8") as out:
+        out.write(XML_CONTENT.replace("doc123", "doc456"))
+    os.utime(prod_path, ns=(1, 1))
+
+    assert load_structure([prod_path])["pages"][
+        "obl_2004_000_0001.txt"][0] == "doc456:page1"
+
+
+def test_load_structure_falls_back_to_staging_once(mount):
+    prod_path, staging_path = get_structure_paths(mount, "obl", "2004_000")
+    with open(prod_path, mode="w", encoding="utf8") as out:
+        out.write("<root><broken")
+    with open(staging_path, mode="w", encoding="utf8") as out:
+        out.write(XML_CONTENT)
+
+    structure = load_structure([prod_path, staging_path])
+    # the broken file is cached as unreadable
+    with gzip.open(get_cache_path(prod_path), mode="rt") as inf:
+        assert json.load(inf)["structure"] is None
+    with patch("lxml.etree.parse") as mock_parse:
+        assert load_structure([prod_path, staging_path]) == structure
+    mock_parse.assert_not_called()
+
+    assert load_structure([prod_path]) is None
+
+
+def test_cache_shared_between_mounts(mount, tmp_path):
+    prod_path, _ = get_structure_paths(mount, "obl", "2004_000")
+    with open(prod_path, mode="w", encoding="utf8") as out:
+        out.write(XML_CONTENT)
+    other_mount = tmp_path / "other"
+    os.symlink(mount, other_mount)
+    other_path = get_structure_paths(str(other_mount), "obl", "2004_000")[0]
+
+    assert get_cache_path(prod_path) == get_cache_path(other_path)
+
+
+def test_split_and_postprocess_share_structure(mount, tmp_path):
+    year = tmp_path / "input" / "obl" / "2004_000"
+    year.mkdir(parents=True)
+    for page in ["obl_2004_000_0001.txt", "obl_2004_000_0002.txt"]:
+        (year / page).write_text("Wort 1,2,3,4\n")
+    prod_path, _ = get_structure_paths(mount, "obl", "2004_000")
+    with open(prod_path, mode="w", encoding="utf8") as out:
+        out.write(XML_CONTENT)
+
+    with patch("utility.split_year.DATA2_MNT", mount), \
+            patch("src.postprocess.DATA2_MNT", mount), \
+            patch("lxml.etree.parse", wraps=etree.parse) as parse:
+        chunks = list(split_directory(str(year)))
+        structure_info = get_structure_info(("obl", "2004_000"))
+
+    parse.assert_called_once_with(prod_path)
+    assert chunks == [(0, [str(year / "obl_2004_000_0001.txt"),
+                           str(year / "obl_2004_000_0002.txt")])]
+    assert structure_info["obl_2004_000_0001.txt"] == \
+        ("doc123:page1", ["article1"], "1")
+
+
+def test_split_and_postprocess_use_conf_cache_dir(mount, tmp_path):
+    year = tmp_path / "input" / "obl" / "2004_000"
+    year.mkdir(parents=True)
+    (year / "obl_2004_000_0001.txt").write_text("Wort 1,2,3,4\n")
+    prod_path, _ = get_structure_paths(mount, "obl", "2004_000")
+    with open(prod_path, mode="w", encoding="utf8") as out:
+        out.write(XML_CONTENT)
+    cache_dir = str(tmp_path / "conf_cache")
+
+    with patch("utility.split_year.DATA2_MNT", mount), \
+            patch("src.postprocess.DATA2_MNT", mount), \
+            patch("lxml.etree.parse", wraps=etree.parse) as parse:
+        list(split_directory(str(year), structure_cache=cache_dir))
+        get_structure_info(("obl", "2004_000"), structure_cache=cache_dir)
+
+    parse.assert_called_once_with(prod_path)
+    assert os.path.exists(get_cache_path(prod_path, cache_dir))
+    # nothing is written to the default directory
+    assert not os.path.exists(structure_cache.CACHE_DIR)
+
+
+NO_ISSUES_XML = """<root>
+    <resource-list>
+        <resource><attr type="Agora:Path">/path/to/Page1.jpg</attr></resource>
+        <resource><attr type="Agora:Path">/path/to/page2.gif</attr></resource>
+    </resource-list>
+</root>
+"""
+
+MISSING_RESOURCE_XML = """<root>
+    <element type="Issue" ID="1">
+        <attr type="IssueNumber">Issue1</attr>
+        <element ID="2">
+            <link from="2" to="3"/>
+        </element>
+    </element>
+    <element type="Agora:Page" ID="3">
+        <element type="Agora:Region" ID="4"/>
+    </element>
+</root>
+"""
+
+
+@pytest.mark.parametrize("xml_content", [
+    XML_CONTENT, NO_ISSUES_XML, MISSING_RESOURCE_XML
+])
+def test_stream_structure_equals_distill_structure(tmp_path, xml_content):
+    path = tmp_path / "structure.xml"
+    path.write_text(xml_content)
+
+    assert stream_structure(str(path)) == \
+        distill_structure(etree.parse(str(path)).getroot())
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_stream_structure_synthetic(tmp_path, seed):
+    path = str(tmp_path / "structure.xml")
+    generate_structure_xml(path, 130, pages_per_issue=40, seed=seed)
+
+    structure = stream_structure(path)
+
+    assert structure == distill_structure(etree.parse(path).getroot())
+    assert structure["returncode"] == 0
+    assert len(structure["issues"]) == 4
+    assert len(structure["pages"]) == 130
+
+
+def test_load_structure_streams_large_files(mount, monkeypatch):
+    monkeypatch.setattr(structure_cache, "STREAM_MIN_SIZE", 0)
+    prod_path, _ = get_structure_paths(mount, "obl", "2004_000")
+    with open(prod_path, mode="w", encoding="utf8") as out:
+        out.write(XML_CONTENT)
+
+    with patch("lxml.etree.parse") as mock_parse:
+        structure = load_structure([prod_path])
+
+    mock_parse.assert_not_called()
+    assert structure == distill_structure(etree.fromstring(XML_CONTENT))
@@ -0,0 +1,46 @@
+import random
+import re
+
+from src.preprocessing.preprocess import preprocess_file
+from utility.synthetic_ocr import (
+    generate_page,
+    generate_year,
+    load_abbreviations,
+)
+
+ABBREVS = "./src/preprocessing/abbrevs.txt"
+LINE_PATTERN = re.compile(r"\S+ \d+,\d+,\d+,\d+$")
+
+
+def test_generate_page_format():
+    abbreviations = load_abbreviations(ABBREVS)
+    page = generate_page(random.Random(1), abbreviations, 300)
+    lines = page.splitlines()
+
+    assert re.match(r"\d+,\d+$", lines[0])
+    for line in lines[1:]:
+        assert line in ("<EOS>", "<EOP>") or LINE_PATTERN.match(line)
+    assert lines[-2:] == ["<EOS>", "<EOP>"]
+    assert lines[1].split()[0].isupper()
+
+
+def test_generate_year(tmp_path):
+    paths = generate_year(str(tmp_path), 40, seed=3, abbreviation_file=ABBREVS)
+    again = generate_year(str(tmp_path / "again"), 40, seed=3,
+                          abbreviation_file=ABBREVS)
+
+    assert len(paths) == 40
+    assert paths[0].endswith("syn/2000_000/syn-001_2000_000_0001.txt")
+    contents = [open(path, encoding="utf8").read() for path in paths]
+    assert contents == [open(path, encoding="utf8").read() for path in again]
+    text = "".join(contents)
+    assert "¬ " in text
+    # title pages and dense pages
+    lengths = sorted(len(content.splitlines()) for content in contents)
+    assert lengths[-1] > 3 * lengths[0]
+
+    sentences = preprocess_file(paths[1],
+                                {"PATH_TO_ABBREVIATION_FILE": ABBREVS})
+    assert sentences
+    assert not any("¬" in token["token"]
+                   for sentence in sentences for token in sentence)
@@ -0,0 +1,59 @@
+from unittest.mock import patch
+
+from src.tag_cache import (
+    TagResultCache,
+    model_fingerprint,
+    sentence_key,
+)
+
+LABELS = [[["ner", "B-PER", 0.9], ["det", "B-AN", 0.8]], []]
+
+
+def test_model_fingerprint(tmp_path):
+    bio = tmp_path / "ner-bio.pt"
+    det = tmp_path / "ner-det.pt"
+    bio.write_bytes(b"bio")
+    det.write_bytes(b"det")
+    fingerprint = model_fingerprint([str(bio), str(det)])
+
+    assert fingerprint == model_fingerprint([str(bio), str(det)])
+    det.write_bytes(b"det2")
+    assert fingerprint != model_fingerprint([str(bio), str(det)])
+
+
+def test_sentence_key():
+    assert sentence_key(("Hans", "Muster")) == \
+        sentence_key(("Hans", "Muster"))
+    assert sentence_key(("ab", "c")) != sentence_key(("a", "bc"))
+
+
+def test_store_and_load_labels(tmp_path):
+    cache = TagResultCache(str(tmp_path), "models")
+    cache.put_many({("Hans", "."): LABELS})
+
+    assert cache.get_many([("Hans", "."), ("Doe", ".")]) == {
+        ("Hans", "."): LABELS
+    }
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.close()
+
+    # other models don't see the labels, but the same models do later
+    other = TagResultCache(str(tmp_path), "other models")
+    assert other.get_many([("Hans", ".")]) == {}
+    again = TagResultCache(str(tmp_path), "models")
+    assert again.get_many([("Hans", ".")]) == {("Hans", "."): LABELS}
+
+
+def test_evict_removes_least_recently_used(tmp_path):
+    cache = TagResultCache(str(tmp_path), "models", max_mb=1)
+    labels = [[["ner", "B-PER" * 100_000, 0.9]]]
+    with patch("time.time", side_effect=[1, 2, 3, 4]):
+        for i in range(3):
+            cache.put_many({(str(i),): labels})
+        cache.get_many([("0",)])
+
+    assert cache.get_size() > 1024 * 1024
+    assert cache.evict() == 1
+    assert cache.get_size() <= 1024 * 1024
+    assert set(cache.get_many([("0",), ("1",), ("2",)])) == {("0",), ("2",)}
+    assert cache.evict() == 0
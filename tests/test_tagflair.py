@@ -1,10 +1,21 @@
+from collections import Counter
+import copy
+import logging
+import os
 from unittest.mock import MagicMock, mock_open, patch
-from flair.data import Label
+from flair.data import Corpus, Dictionary, Label
+from flair.datasets import FlairDatapointDataset
+from flair.embeddings import OneHotEmbeddings, StackedEmbeddings
+from flair.models import SequenceTagger
 import pytest
 import json
 from flair.models import MultitaskModel
 from flair.nn import Classifier
 import flair
+import torch
+
+from src.preprocessing.columns import PageColumns
+from src.preprocessing.prep_store import save_prep_year
 
 from src.tag_flair import (
     decide_tag_no_tag_lower_prio,
@@ -13,8 +24,32 @@ from src.tag_flair import (
     tag_year_data_and_save,
     setup_flair_tagger,
     package_generator_output_paths,
-    execute_tagging
+    execute_tagging,
+    iter_collection_sentences,
+    group_streamed_years,
+    make_token_batches,
+    count_padded_tokens,
+    predict_sentences,
+    get_padding_ratio,
+    CustomSentence,
+    CustomToken,
+    get_thread_candidates,
+    get_tagging_overrides,
+    calibrate_tagger,
+    resolve_tagging_settings,
+    load_calibrations,
+    get_calibration_key,
+    embeddings_identical,
+    SharedEmbeddingTagger,
+    check_shared_embeddings,
+    DEFAULT_TAGGING_SETTINGS,
+    SentenceTagCache,
+    predict_uncached_sentences,
+    build_sentences,
+    open_result_cache,
+    model_uses_context,
 )
+from src.tag_cache import TagResultCache
 
 
 # -------------------------------------------------
@@ -262,6 +297,347 @@ def test_tag_year_data_and_save_copilot():
     assert "teacher" in written_data
 
 
+def test_tag_year_data_and_save_streamed_sentences():
+    collection = iter([
+        ("file1.txt", [{"token": "John", "coord": (0, 4)}]),
+        ("file1.txt", [{"token": "Doe", "coord": (5, 8)}]),
+        ("file2.txt", [{"token": "teacher", "coord": (10, 17)}]),
+    ])
+    mock_tagger = MagicMock(spec=MultitaskModel)
+
+    mock_outfile = mock_open()
+    with patch("builtins.open", mock_outfile):
+        tag_year_data_and_save(collection,
+                               mock_tagger,
+                               "/path/to/output.jsonl",
+                               2)
+
+    assert mock_tagger.predict.call_count == 2
+    written = [json.loads(call[0][0])
+               for call in mock_outfile().write.call_args_list]
+    assert written[0]["file1.txt"][1][0]["token"] == "Doe"
+    assert written[1]["file2.txt"][0][0]["token"] == "teacher"
+
+
+def test_make_token_batches():
+    lengths = [3, 40, 2, 38, 3, 1]
+
+    batches = make_token_batches(lengths, 80)
+
+    # 3 and 2 tokens share a length bucket, 1 token does not
+    assert batches == [[1, 3], [0, 4, 2], [5]]
+    assert count_padded_tokens(lengths, batches) == 90
+    # a sentence longer than the budget gets a batch of its own
+    assert make_token_batches([100, 2], 50) == [[0], [1]]
+    assert make_token_batches([], 50) == []
+
+
+def test_get_padding_ratio():
+    padding = Counter(tokens=75, default=100, bucketed=80)
+
+    assert get_padding_ratio(padding, "default") == 0.25
+    assert get_padding_ratio(Counter(), "bucketed") == 0.0
+
+
+def make_sentences(lengths):
+    sentences = []
+    for number, length in enumerate(lengths):
+        sentence = CustomSentence("file1.txt", "")
+        for i in range(length):
+            text = f"w{(number + i) % 5}"
+            sentence._add_token(CustomToken(text, f"{i},0,1,1:main", text))
+        sentences.append(sentence)
+    return sentences
+
+
+def test_predict_sentences_token_budget():
+    sentences = make_sentences([2, 30, 0, 3, 28, 1])
+    mock_tagger = MagicMock(spec=MultitaskModel)
+    padding = Counter()
+
+    predict_sentences(mock_tagger, sentences, 60, padding)
+
+    batches = [call[0][0] for call in mock_tagger.predict.call_args_list]
+    assert [[len(sentence) for sentence in batch] for batch in batches] == \
+        [[30, 28], [3, 2], [1]]
+    assert all(call[1]["mini_batch_size"] == len(call[0][0])
+               for call in mock_tagger.predict.call_args_list)
+    # the context follows the file order, not the batches
+    assert sentences[1].previous_sentence() is sentences[0]
+    assert padding == Counter(tokens=64, default=4 * 30 + 1, bucketed=67)
+
+
+def make_embeddings():
+    train = FlairDatapointDataset(make_sentences([5]))
+    return OneHotEmbeddings.from_corpus(
+        Corpus(train=train, dev=train, test=train),
+        embedding_length=8, min_freq=1
+    )
+
+
+def make_tagger(embeddings, tag_type="ner"):
+    dictionary = Dictionary()
+    for tag in ["O", "B-PER", "I-PER", "B-AN"]:
+        dictionary.add_item(tag)
+    tagger = SequenceTagger(hidden_size=8, embeddings=embeddings,
+                            tag_dictionary=dictionary, tag_type=tag_type)
+    return tagger.eval()
+
+
+def test_predict_sentences_parity():
+    torch.manual_seed(0)
+    tagger = make_tagger(make_embeddings())
+    lengths = [2, 30, 3, 28, 1, 17, 4]
+
+    default = make_sentences(lengths)
+    predict_sentences(tagger, default)
+    bucketed = make_sentences(lengths)
+    predict_sentences(tagger, bucketed, 40)
+
+    assert [[token.get_label("ner").value for token in sentence]
+            for sentence in default] == \
+        [[token.get_label("ner").value for token in sentence]
+         for sentence in bucketed]
+
+
+def test_tag_year_data_and_save_token_budget():
+    collection = iter([
+        ("file1.txt", [{"token": "John", "coord": (0, 4)},
+                       {"token": "Doe", "coord": (5, 8)}]),
+        ("file1.txt", [{"token": "Hi", "coord": (0, 2)}]),
+        ("file2.txt", [{"token": "teacher", "coord": (10, 17)}]),
+    ])
+    mock_tagger = MagicMock(spec=MultitaskModel)
+
+    mock_outfile = mock_open()
+    with patch("builtins.open", mock_outfile):
+        tag_year_data_and_save(collection,
+                               mock_tagger,
+                               "/path/to/output.jsonl",
+                               3,
+                               token_budget=2)
+
+    assert mock_tagger.predict.call_count == 2
+    written = [json.loads(call[0][0])
+               for call in mock_outfile().write.call_args_list]
+    assert [token["token"] for sentence in written[0]["file1.txt"]
+            for token in sentence] == ["John", "Doe", "Hi"]
+    assert written[1]["file2.txt"][0][0]["token"] == "teacher"
+
+
+def test_sentence_tag_cache():
+    cache = SentenceTagCache(2)
+    cache.put(("a",), ((),))
+    cache.put(("b",), ((),))
+    cache.get(("a",))
+    cache.put(("c",), ((),))
+
+    # "b" was used least recently
+    assert list(cache.labels) == [("a",), ("c",)]
+    assert cache.get(("b",)) is None
+    cache.hits, cache.misses = 3, 1
+    assert cache.hit_rate() == 0.75
+
+
+def label_tokens(sentences, **kwargs):
+    for sentence in sentences:
+        for token in sentence:
+            token.add_label("ner", "B-PER", 0.9)
+            token.add_label("det", "B-AN", 0.8)
+
+
+def test_predict_uncached_sentences():
+    header = [("OBERÜBERGER", "1,1,1,1", "OBERÜBERGER"),
+              ("BLÄTTER", "2,2,2,2", "BLÄTTER")]
+    moved = [(text, "9,9,9,9", orig) for text, _, orig in header]
+    text = [("Hans", "3,3,3,3", "Hans")]
+    mock_tagger = MagicMock(spec=MultitaskModel)
+    mock_tagger.predict.side_effect = label_tokens
+    cache = SentenceTagCache(10)
+
+    first = build_sentences([("file1.txt", sentence)
+                             for sentence in [header, text, moved]])
+    predict_uncached_sentences(mock_tagger, first, cache)
+    second = build_sentences([("file1.txt", moved)])
+    predict_uncached_sentences(mock_tagger, second, cache)
+
+    assert [len(call[0][0]) for call in mock_tagger.predict.call_args_list] \
+        == [2]
+    assert (cache.hits, cache.misses) == (2, 2)
+    new_data = {"file1.txt": []}
+    add_sentences(new_data, first + second)
+    assert [[(token["coord"], token["tag"]) for token in sentence]
+            for sentence in new_data["file1.txt"]] == [
+        [("1,1,1,1", "B-PER-AN"), ("2,2,2,2", "B-PER-AN")],
+        [("3,3,3,3", "B-PER-AN")],
+        [("9,9,9,9", "B-PER-AN"), ("9,9,9,9", "B-PER-AN")],
+        [("9,9,9,9", "B-PER-AN"), ("9,9,9,9", "B-PER-AN")],
+    ]
+
+
+def test_tag_year_data_and_save_cache():
+    collection = iter([
+        ("file1.txt", [{"token": "Fortsetzung", "coord": "1"},
+                       {"token": "folgt", "coord": "2"}]),
+        ("file2.txt", [{"token": "Fortsetzung", "coord": "3"},
+                       {"token": "folgt", "coord": "4"}]),
+    ])
+    mock_tagger = MagicMock(spec=MultitaskModel)
+    mock_tagger.predict.side_effect = label_tokens
+    cache = SentenceTagCache(10)
+
+    mock_outfile = mock_open()
+    with patch("builtins.open", mock_outfile):
+        tag_year_data_and_save(collection, mock_tagger,
+                               "/path/to/output.jsonl", 1, cache=cache)
+
+    assert [len(call[0][0]) for call in mock_tagger.predict.call_args_list] \
+        == [1]
+    written = [json.loads(call[0][0])
+               for call in mock_outfile().write.call_args_list]
+    assert written[1]["file2.txt"] == [[
+        {"token": "Fortsetzung", "coord": "3", "normalized": "Fortsetzung",
+         "tag": "B-PER-AN"},
+        {"token": "folgt", "coord": "4", "normalized": "folgt",
+         "tag": "B-PER-AN"},
+    ]]
+
+
+def test_predict_uncached_sentences_parity():
+    torch.manual_seed(0)
+    embeddings = make_embeddings()
+    tagger = MultitaskModel([make_tagger(embeddings, "ner"),
+                             make_tagger(embeddings, "det")])
+    # the first and the last line have the same tokens, as a running
+    # header on every page
+    sample = [("file1.txt", [(f"w{(number + i) % 5}", f"{number},{i}",
+                              f"w{(number + i) % 5}") for i in range(length)])
+              for number, length in enumerate([3, 12, 3, 1, 12, 3])]
+
+    uncached = build_sentences(sample)
+    predict_uncached_sentences(tagger, uncached)
+    cache = SentenceTagCache(10)
+    cached = build_sentences(sample)
+    predict_uncached_sentences(tagger, cached, cache)
+
+    assert cache.hits == 1
+    expected = {"file1.txt": []}
+    add_sentences(expected, uncached)
+    new_data = {"file1.txt": []}
+    add_sentences(new_data, cached)
+    assert new_data == expected
+
+
+def test_model_uses_context():
+    embeddings = make_embeddings()
+    tagger = make_tagger(embeddings)
+
+    assert not model_uses_context(tagger)
+    embeddings.context_length = 64
+    assert model_uses_context(tagger)
+    tagger.embeddings = StackedEmbeddings([make_embeddings(), embeddings])
+    assert model_uses_context(tagger)
+
+
+def test_setup_flair_tagger_context_turns_off_caches():
+    conf = {
+        "PATH_TO_NER_MODEL_1": "/path/to/ner_model_1.pt",
+        "PATH_TO_NER_MODEL_2": "/path/to/ner_model_2.pt",
+        "TAG_CACHE_SIZE": 1000,
+        "PATH_TO_TAG_RESULT_CACHE": "/path/to/cache",
+    }
+    embeddings = make_embeddings()
+    embeddings.context_length = 64
+
+    with patch("flair.nn.Classifier.load",
+               side_effect=[make_tagger(embeddings),
+                            make_tagger(make_embeddings())]):
+        setup_flair_tagger(conf, 0)
+
+    assert conf["TAG_CACHE_SIZE"] == 0
+    assert not conf["PATH_TO_TAG_RESULT_CACHE"]
+
+
+def test_predict_uncached_sentences_result_cache(tmp_path):
+    sample = [("file1.txt", [("Hans", "1", "HANS")]),
+              ("file1.txt", [("Doe", "2", "Doe")]),
+              ("file2.txt", [("Hans", "3", "Hans")])]
+    mock_tagger = MagicMock(spec=MultitaskModel)
+    mock_tagger.predict.side_effect = label_tokens
+
+    result_cache = TagResultCache(str(tmp_path), "models")
+    predict_uncached_sentences(mock_tagger, build_sentences(sample[:2]),
+                               result_cache=result_cache)
+    # a later run with the same models
+    result_cache = TagResultCache(str(tmp_path), "models")
+    sentences = build_sentences(sample)
+    predict_uncached_sentences(mock_tagger, sentences,
+                               result_cache=result_cache)
+
+    assert mock_tagger.predict.call_count == 1
+    assert (result_cache.hits, result_cache.misses) == (2, 0)
+    new_data = {"file1.txt": [], "file2.txt": []}
+    add_sentences(new_data, sentences)
+    assert new_data["file2.txt"] == [[{
+        "token": "Hans", "coord": "3", "normalized": "Hans",
+        "tag": "B-PER-AN"
+    }]]
+
+
+def test_open_result_cache(tmp_path):
+    conf = {
+        "PATH_TO_NER_MODEL_1": str(tmp_path / "ner-bio.pt"),
+        "PATH_TO_NER_MODEL_2": str(tmp_path / "ner-det.pt"),
+        "PATH_TO_TAG_RESULT_CACHE": "",
+    }
+    assert open_result_cache(conf) is None
+
+    (tmp_path / "ner-bio.pt").write_bytes(b"bio")
+    (tmp_path / "ner-det.pt").write_bytes(b"det")
+    conf["PATH_TO_TAG_RESULT_CACHE"] = str(tmp_path / "cache")
+    conf["TAG_RESULT_CACHE_MAX_MB"] = 10
+    result_cache = open_result_cache(conf)
+    assert result_cache.max_mb == 10
+    assert os.path.exists(tmp_path / "cache" / "tag_cache.sqlite")
+
+
+def test_iter_collection_sentences():
+    sentences = [
+        [{"token": "HANS", "coord": "1,2,3,4:main", "normalized": "Hans"},
+         {"token": ".", "coord": "1,2,3,4:rpunc"}],
+        [{"token": "Doe", "coord": "5,6,7,8;9,10,11,12:main"}],
+    ]
+    expected = [
+        ("file1.txt", [("Hans", "1,2,3,4:main", "HANS"),
+                       (".", "1,2,3,4:rpunc", ".")]),
+        ("file1.txt", [("Doe", "5,6,7,8;9,10,11,12:main", "Doe")]),
+    ]
+
+    assert list(iter_collection_sentences({"file1.txt": sentences})) == \
+        expected
+    columns = {"file1.txt": PageColumns.from_sentences(sentences)}
+    assert list(iter_collection_sentences(columns)) == expected
+    streamed = iter([("file1.txt", sentence) for sentence in sentences])
+    assert list(iter_collection_sentences(streamed)) == expected
+
+
+def test_group_streamed_years():
+    stream = iter([
+        ("2020", "file1.txt", ["a"]),
+        ("2020", "file2.txt", ["b"]),
+        ("2021", "file1.txt", ["c"]),
+    ])
+
+    result = [(year, list(sentences))
+              for batch in group_streamed_years(stream)
+              for year, sentences in batch.items()]
+
+    assert result == [
+        ("2020", [("file1.txt", ["a"]), ("file2.txt", ["b"])]),
+        ("2021", [("file1.txt", ["c"])]),
+    ]
+
+
 # -------------------------------------------------
 # Test setup_flair_tagger
 # -------------------------------------------------
@@ -309,6 +685,185 @@ def test_setup_flair_tagger_with_cpu():
         assert flair.device.type == "cpu"  # Ensure CPU is being used
 
 
+# -------------------------------------------------
+# Test the shared embeddings
+# -------------------------------------------------
+def test_embeddings_identical():
+    torch.manual_seed(0)
+    embeddings = make_embeddings()
+
+    assert embeddings_identical(embeddings, copy.deepcopy(embeddings))
+    # same vocabulary, but differently initialized
+    assert not embeddings_identical(embeddings, make_embeddings())
+
+
+def test_shared_embedding_tagger():
+    torch.manual_seed(0)
+    embeddings = make_embeddings()
+    bio = make_tagger(embeddings, "ner")
+    det = make_tagger(copy.deepcopy(embeddings), "det")
+    lengths = [2, 30, 3, 28, 1, 17, 4]
+
+    expected = make_sentences(lengths)
+    MultitaskModel([bio, det]).predict(expected, mini_batch_size=4,
+                                       force_token_predictions=True)
+    det.embeddings = bio.embeddings
+    sentences = make_sentences(lengths)
+    with patch.object(embeddings, "_add_embeddings_internal",
+                      wraps=embeddings._add_embeddings_internal) as embed:
+        SharedEmbeddingTagger([bio, det]).predict(
+            sentences, mini_batch_size=4, force_token_predictions=True
+        )
+
+    assert embed.call_count == 2  # once per batch
+    assert [[(name, label.value) for token in sentence
+             for name, labels in token.annotation_layers.items()
+             for label in labels] for sentence in sentences] == \
+        [[(name, label.value) for token in sentence
+          for name, labels in token.annotation_layers.items()
+          for label in labels] for sentence in expected]
+    assert all(not token._embeddings
+               for sentence in sentences for token in sentence)
+
+
+def test_check_shared_embeddings():
+    torch.manual_seed(0)
+    embeddings = make_embeddings()
+    tagger = SharedEmbeddingTagger([make_tagger(embeddings, "ner"),
+                                    make_tagger(embeddings, "det")])
+    sample = [("file1.txt", [(f"w{i % 5}", "1", f"w{i % 5}")
+                             for i in range(length)])
+              for length in [3, 12, 1]]
+
+    assert check_shared_embeddings(tagger, sample, DEFAULT_TAGGING_SETTINGS)
+    assert tagger.share_embeddings
+
+    with patch("src.tag_flair.add_sentences",
+               side_effect=lambda data, sentences: data.update(
+                   shared=tagger.share_embeddings)):
+        assert not check_shared_embeddings(tagger, sample,
+                                           DEFAULT_TAGGING_SETTINGS)
+    assert not tagger.share_embeddings
+
+
+def test_setup_flair_tagger_shared_embeddings():
+    conf = {
+        "PATH_TO_NER_MODEL_1": "/path/to/ner_model_1.pt",
+        "PATH_TO_NER_MODEL_2": "/path/to/ner_model_2.pt",
+        "SHARED_EMBEDDINGS": True,
+    }
+    torch.manual_seed(0)
+    embeddings = make_embeddings()
+    bio = make_tagger(embeddings)
+    det = make_tagger(copy.deepcopy(embeddings))
+    other = make_tagger(make_embeddings())
+
+    with patch("flair.nn.Classifier.load", side_effect=[bio, det]):
+        tagger = setup_flair_tagger(conf, 0)
+    assert isinstance(tagger, SharedEmbeddingTagger)
+    assert det.embeddings is bio.embeddings
+
+    with patch("flair.nn.Classifier.load", side_effect=[bio, other]):
+        tagger = setup_flair_tagger(conf, 0)
+    assert not isinstance(tagger, SharedEmbeddingTagger)
+
+
+# -------------------------------------------------
+# Test the calibration of the tagging settings
+# -------------------------------------------------
+def test_get_thread_candidates():
+    assert get_thread_candidates(32) == [32, 16, 8, 4]
+    assert get_thread_candidates(6) == [6, 3, 1]
+    assert get_thread_candidates(1) == [1]
+
+
+def test_get_tagging_overrides():
+    conf = {"TAG_NUM_THREADS": "8", "BATCH_TOKEN_BUDGET": None,
+            "TAG_MINI_BATCH_SIZE": 16}
+
+    assert get_tagging_overrides(conf) == {
+        "num_threads": 8, "mini_batch_size": 16
+    }
+
+
+def test_calibrate_tagger():
+    def fake_speed(tagger, sample, settings):
+        # fastest with 4 threads and a budget of 1024 tokens
+        return (100 - abs((settings["num_threads"] or 1) - 4)
+                + (settings["token_budget"] == 1024)
+                + settings["mini_batch_size"] / 1000)
+
+    with patch("src.tag_flair.time_predict", side_effect=fake_speed), \
+            patch("os.cpu_count", return_value=16), \
+            patch("flair.device", torch.device("cpu")):
+        best = calibrate_tagger(MagicMock(), [("file1.txt", [])])
+
+    assert best["num_threads"] == 4
+    assert best["token_budget"] == 1024
+    assert best["mini_batch_size"] == 4
+    assert best["sentences_per_second"] == 101.0
+
+
+def test_resolve_tagging_settings(tmp_path):
+    conf = {
+        "PATH_TO_NER_MODEL_1": str(tmp_path / "ner-bio.pt"),
+        "PATH_TO_NER_MODEL_2": str(tmp_path / "ner-det.pt"),
+        "PATH_TO_TAG_CALIBRATION": str(tmp_path / "calibration.json"),
+        "TAG_CALIBRATION": True,
+        "TAG_CALIBRATION_SENTENCES": 1,
+        "TAG_MINI_BATCH_SIZE": 8,
+    }
+    collection = {"file1.txt": [[{"token": "Hans", "coord": "1"}],
+                                [{"token": "Doe", "coord": "2"}]]}
+    calibrated = {"mini_batch_size": 32, "token_budget": 2048,
+                  "num_threads": None, "interop_threads": None,
+                  "sentences_per_second": 10.0}
+
+    with patch("src.tag_flair.calibrate_tagger",
+               return_value=calibrated) as mock_calibrate:
+        data, settings = resolve_tagging_settings(conf, MagicMock(),
+                                                  collection)
+        again, _ = resolve_tagging_settings(conf, MagicMock(), collection)
+
+    mock_calibrate.assert_called_once()
+    assert mock_calibrate.call_args[0][1] == [
+        ("file1.txt", [("Hans", "1", "Hans")])
+    ]
+    # the sample is not lost for the tagging
+    assert [sentence for _, sentence in iter_collection_sentences(data)] \
+        == [[("Hans", "1", "Hans")], [("Doe", "2", "Doe")]]
+    assert again is collection
+    assert settings["token_budget"] == 2048
+    assert settings["mini_batch_size"] == 8  # the config overrides
+    assert load_calibrations(conf["PATH_TO_TAG_CALIBRATION"]) == {
+        get_calibration_key(conf): calibrated
+    }
+
+
+def test_resolve_tagging_settings_small_sample(tmp_path, caplog):
+    conf = {
+        "PATH_TO_NER_MODEL_1": str(tmp_path / "ner-bio.pt"),
+        "PATH_TO_NER_MODEL_2": str(tmp_path / "ner-det.pt"),
+        "PATH_TO_TAG_CALIBRATION": str(tmp_path / "calibration.json"),
+        "TAG_CALIBRATION": True,
+        "TAG_CALIBRATION_SENTENCES": 3,
+    }
+    collection = {"file1.txt": [[{"token": "Hans", "coord": "1"}],
+                                [{"token": "Doe", "coord": "2"}]]}
+
+    with patch("src.tag_flair.calibrate_tagger") as mock_calibrate, \
+            caplog.at_level(logging.INFO):
+        data, settings = resolve_tagging_settings(conf, MagicMock(),
+                                                  collection)
+
+    mock_calibrate.assert_not_called()
+    assert "Skipping the calibration" in caplog.text
+    assert load_calibrations(conf["PATH_TO_TAG_CALIBRATION"]) == {}
+    assert len(list(iter_collection_sentences(data))) == 2
+    assert settings["token_budget"] == \
+        DEFAULT_TAGGING_SETTINGS["token_budget"]
+
+
 # -------------------------------------------------
 # Test package_generator_output_paths
 # -------------------------------------------------
@@ -415,3 +970,24 @@ def test_execute_tagging_copilot():
                 mock_open.assert_called()
                 # Ensure directories were created
                 mock_makedirs.assert_called()
+
+
+def test_execute_tagging_from_prep_files(tmp_path):
+    conf = {
+        "PATH_TO_OUTFILE_FOLDER": str(tmp_path),
+        "BATCH_SIZE": 1,
+        "SENTENCE_BATCH_SIZE": 2,
+    }
+    sentences = [[{"token": "Hans", "coord": "1,2,3,4:main"}]]
+    save_prep_year(("obl", "2004_000"), {"file1.txt": sentences}, conf)
+
+    mock_tagger = MagicMock()
+    with patch("src.tag_flair.setup_flair_tagger", return_value=mock_tagger):
+        execute_tagging(None, conf, ["tag"], 0)
+
+    with open(tmp_path / "tag" / "obl" / "2004_000.jsonl") as inf:
+        tagged = [json.loads(line) for line in inf]
+    assert tagged == [{"file1.txt": [[{
+        "token": "Hans", "coord": "1,2,3,4:main", "normalized": "Hans",
+        "tag": "O"
+    }]]}]
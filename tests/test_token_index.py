@@ -0,0 +1,101 @@
+import json
+
+from src.preprocessing.columns import PageColumns
+from src.preprocessing.token_index import (
+    build_token_index,
+    get_index_path,
+    index_key,
+    index_preprocessed_years,
+    iter_page_words,
+    replace_index_pages,
+)
+
+SENTENCES = [
+    [{"token": "(", "coord": "1,2,3,4:lpunc"},
+     {"token": "Dr", "coord": "1,2,3,4:main"},
+     {"token": ".", "coord": "1,2,3,4:rpunc"}],
+    [{"token": "HANS", "coord": "5,6,7,8:main", "normalized": "Hans"},
+     {"token": "St.", "coord": "5,6,7,8:main"}],
+]
+
+
+def test_index_key():
+    assert index_key("Dr.") == index_key("Dr") == "dr"
+    assert index_key("HANS") == "hans"
+
+
+def test_iter_page_words():
+    words = ["Dr", "HANS", "St."]
+    assert list(iter_page_words(SENTENCES)) == words
+    assert list(iter_page_words(PageColumns.from_sentences(SENTENCES))) == \
+        words
+    assert list(iter_page_words(
+        PageColumns.from_sentences(SENTENCES).iter_sentences()
+    )) == words
+
+
+def test_build_token_index():
+    index = build_token_index([("a.txt", ["Dr", "dr.", "Hans"]),
+                               ("b.txt", []),
+                               ("c.txt", ["DR"])])
+
+    assert index == {"pages": ["a.txt", "b.txt", "c.txt"],
+                     "tokens": {"dr": [0, 2], "hans": [0]}}
+
+
+def test_index_preprocessed_years(tmp_path):
+    conf = {"PATH_TO_OUTFILE_FOLDER": str(tmp_path)}
+    years = [(("obl", "2004_000"), {"a.txt": SENTENCES}),
+             (("obl", "2005_000"), {})]
+
+    assert list(index_preprocessed_years(iter(years), conf)) == years
+    with open(get_index_path(("obl", "2004_000"), conf)) as inf:
+        assert json.load(inf) == {
+            "pages": ["a.txt"],
+            "tokens": {"dr": [0], "hans": [0], "st": [0]}
+        }
+    with open(get_index_path(("obl", "2005_000"), conf)) as inf:
+        assert json.load(inf) == {"pages": [], "tokens": {}}
+
+
+def test_index_streamed_years(tmp_path):
+    conf = {"PATH_TO_OUTFILE_FOLDER": str(tmp_path)}
+    stream = [(("obl", "2004_000"), "a.txt", SENTENCES[0]),
+              (("obl", "2004_000"), "b.txt", SENTENCES[1]),
+              (("obl", "2005_000"), "a.txt", SENTENCES[1])]
+
+    assert list(index_preprocessed_years(iter(stream), conf, True)) == stream
+    with open(get_index_path(("obl", "2004_000"), conf)) as inf:
+        assert json.load(inf) == {
+            "pages": ["a.txt", "b.txt"],
+            "tokens": {"dr": [0], "hans": [1], "st": [1]}
+        }
+    with open(get_index_path(("obl", "2005_000"), conf)) as inf:
+        assert json.load(inf)["pages"] == ["a.txt"]
+
+
+def test_index_streamed_pages_of_several_sentences(tmp_path):
+    conf = {"PATH_TO_OUTFILE_FOLDER": str(tmp_path)}
+    stream = [(("obl", "2004_000"), "a.txt", SENTENCES[0]),
+              (("obl", "2004_000"), "a.txt", SENTENCES[1]),
+              (("obl", "2004_000"), "a.txt", SENTENCES[0]),
+              (("obl", "2004_000"), "b.txt", SENTENCES[0])]
+
+    list(index_preprocessed_years(iter(stream), conf, True))
+    with open(get_index_path(("obl", "2004_000"), conf)) as inf:
+        assert json.load(inf) == {
+            "pages": ["a.txt", "b.txt"],
+            "tokens": {"dr": [0, 1], "hans": [0], "st": [0]}
+        }
+
+
+def test_replace_index_pages():
+    index = build_token_index([("a.txt", ["Dr", "Hans"]),
+                               ("b.txt", ["Dr"]),
+                               ("c.txt", ["St."])])
+
+    replace_index_pages(index, {"a.txt": ["St"], "c.txt": [],
+                                "d.txt": ["Hans"]})
+
+    assert index == {"pages": ["a.txt", "b.txt", "c.txt", "d.txt"],
+                     "tokens": {"dr": [1], "st": [0], "hans": [3]}}
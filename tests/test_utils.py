@@ -109,6 +109,7 @@ def test_parse_arguments_defaults_copilot(monkeypatch):
     assert args.config_file == "./configs/configurations.json"
     assert args.eval_level == "ref"
     assert args.fuzzy is True
+    assert args.shard is None
 
 
 def test_parse_arguments_with_input_copilot(monkeypatch):
@@ -121,7 +122,8 @@ def test_parse_arguments_with_input_copilot(monkeypatch):
             "--magazine_year_paths", "/path/to/data",
             "--config_file", "/path/to/config.json",
             "--eval_level", "ent",
-            "--fuzzy", "false"
+            "--fuzzy", "false",
+            "--shard", "1/4"
         ]
     )
 
@@ -133,6 +135,7 @@ def test_parse_arguments_with_input_copilot(monkeypatch):
     assert args.config_file == "/path/to/config.json"
     assert args.eval_level == "ent"
     assert args.fuzzy is False
+    assert args.shard == (1, 4)
 
 
 # -------------------------------------------------
@@ -0,0 +1,315 @@
+"""
+Micro-benchmarks for the preprocessing pipeline.
+
+Run from the repository root:
+    python -m utility.benchmark --input tests/test_data/input/obl/2004_000
+
+or on a synthetic year (see utility.synthetic_ocr), with throughput and
+peak RSS for every preprocessing stage:
+    python -m utility.benchmark --synthetic_pages 2000
+
+or on how fast a synthetic structure file is split into issues:
+    python -m utility.benchmark --structure_pages 5000
+"""
+import argparse
+from functools import partial
+import glob
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+from lxml import etree
+
+from src.preprocessing.preprocess import (
+    PreprocessConfig,
+    check_for_abbrev,
+    fuse_hyphens,
+    preprocess_file,
+    split_sentences,
+    tokenize,
+)
+from utility.split_year import get_pagenumbers
+from utility.synthetic_ocr import generate_structure_xml, generate_year
+
+STAGES = ("fuse_hyphens", "tokenize", "split_sentences", "check_for_abbrev",
+          "abbreviation_matcher", "preprocess_file")
+
+
+def load_pages_from(paths: list) -> list:
+    """Reads the given OCR pages.
+
+    Args:
+        paths (list): Paths to the pages.
+
+    Returns:
+        list: The contents of the pages.
+    """
+    pages = []
+    for path in paths:
+        with open(path, encoding="utf8") as inf:
+            pages.append(inf.read())
+    return pages
+
+
+def load_pages(directory: str) -> list:
+    """Reads all OCR pages (.txt files) of the given directory.
+
+    Args:
+        directory (str): Path to a year directory.
+
+    Returns:
+        list: The contents of the pages, sorted by filename.
+    """
+    return load_pages_from(sorted(glob.glob(os.path.join(directory, "*.txt"))))
+
+
+def benchmark_tokenize(pages: list,
+                       preprocess_data: PreprocessConfig,
+                       repeat: int = 5) -> dict:
+    """Measures the throughput of tokenize on the given pages. The hyphens
+    are fused beforehand, so only tokenizing is timed.
+
+    Args:
+        pages (list): Contents of OCR pages.
+        preprocess_data (PreprocessConfig): Config with loaded abbreviations.
+        repeat (int, optional): How often all pages are tokenized. The
+         fastest run is reported. Defaults to 5.
+
+    Returns:
+        dict: Number of tokens per run, seconds of the fastest run and
+         tokens per second.
+    """
+    fused_pages = [fuse_hyphens(page, preprocess_data) for page in pages]
+    best = None
+    tokens = 0
+    for _ in range(repeat):
+        tokens = 0
+        start = time.perf_counter()
+        for content in fused_pages:
+            tokens += len(tokenize(content, preprocess_data))
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return {
+        "tokens": tokens,
+        "seconds": best,
+        "tokens_per_second": tokens / best if best else 0.0,
+    }
+
+
+def split_words(fused_page: list, preprocess_data: PreprocessConfig) -> list:
+    """Splits the fused words of a page like tokenize does before the
+    abbreviations are checked.
+
+    Args:
+        fused_page (list): The output of fuse_hyphens.
+        preprocess_data (PreprocessConfig): Config with loaded abbreviations.
+
+    Returns:
+        list: The words that are matched against the abbreviations.
+    """
+    words = []
+    punc_match = preprocess_data.PUNC_PATTERN.match
+    for element in fused_page:
+        _, word, _ = punc_match(element["word"]).groups()
+        word = preprocess_data.IN_WORD_SPLIT_PATTERN.sub(r" \1 ", word)
+        word = preprocess_data.PERIOD_SPLIT_PATTERN.sub(r"\1 ", word)
+        words.extend(x for x in word.split(" ") if x)
+    return words
+
+
+def check_all_abbrevs(text: list, preprocess_data: PreprocessConfig) -> list:
+    """Runs check_for_abbrev on every position of the text.
+
+    Args:
+        text (list): The words of a page as 1-tuples, like the tokens
+         check_for_abbrev gets from tokenize.
+        preprocess_data (PreprocessConfig): The loaded abbreviations.
+
+    Returns:
+        list: The result of check_for_abbrev per position.
+    """
+    return [check_for_abbrev(pos, text, preprocess_data)
+            for pos in range(len(text))]
+
+
+def run_stage(stage: str, paths: list, abbreviation_file: str,
+              repeat: int = 1) -> dict:
+    """Measures a single preprocessing stage on the given pages. The input
+    of the stage is prepared beforehand and not timed.
+
+    Args:
+        stage (str): One of STAGES.
+        paths (list): Paths to OCR pages.
+        abbreviation_file (str): Path to the abbreviation file.
+        repeat (int, optional): How often the stage is run. The fastest run
+         is reported. Defaults to 1.
+
+    Returns:
+        dict: The stage, the number of pages and tokens, seconds of the
+         fastest run, pages and tokens per second and the peak RSS in MB of
+         the process (including the input of the stage).
+    """
+    preprocess_data = PreprocessConfig(ABBREVIATION_FILE=abbreviation_file)
+    preprocess_data.load_abbrevs()
+    conf = {"PATH_TO_ABBREVIATION_FILE": abbreviation_file}
+    pages = load_pages_from(paths)
+    fused = [fuse_hyphens(page, preprocess_data) for page in pages]
+    tokens = [tokenize(page, preprocess_data) for page in fused]
+    token_count = sum(map(len, tokens))
+
+    if stage == "fuse_hyphens":
+        inputs = pages
+        function = partial(fuse_hyphens, preprocess_data=preprocess_data)
+    elif stage == "tokenize":
+        inputs = fused
+        function = partial(tokenize, preprocess_data=preprocess_data)
+    elif stage == "split_sentences":
+        inputs = tokens
+        function = partial(split_sentences, preprocess_data=preprocess_data)
+    elif stage == "check_for_abbrev":
+        inputs = [[(word,) for word in split_words(page, preprocess_data)]
+                  for page in fused]
+        function = partial(check_all_abbrevs, preprocess_data=preprocess_data)
+    elif stage == "abbreviation_matcher":
+        inputs = [split_words(page, preprocess_data) for page in fused]
+        function = preprocess_data.ABBREVIATION_MATCHER.match
+    elif stage == "preprocess_file":
+        inputs = paths
+        function = partial(preprocess_file, conf=conf)
+    else:
+        raise ValueError("Unknown stage: " + stage)
+    del fused, tokens
+
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in inputs:
+            function(item)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return {
+        "stage": stage,
+        "pages": len(pages),
+        "tokens": token_count,
+        "seconds": best,
+        "pages_per_second": len(pages) / best if best else 0.0,
+        "tokens_per_second": token_count / best if best else 0.0,
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(
+            resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def benchmark_stages(paths: list, abbreviation_file: str,
+                     repeat: int = 1, stages=STAGES) -> list:
+    """Runs every stage in a fresh process, so the peak RSS of a stage isn't
+    influenced by the stages before.
+
+    Args:
+        paths (list): Paths to OCR pages.
+        abbreviation_file (str): Path to the abbreviation file.
+        repeat (int, optional): How often each stage is run. Defaults to 1.
+        stages (iterable, optional): The stages to run. Defaults to STAGES.
+
+    Returns:
+        list: The results of run_stage for every stage.
+    """
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for stage in stages:
+        with context.Pool(1) as pool:
+            results.append(pool.apply(
+                run_stage, (stage, paths, abbreviation_file, repeat)
+            ))
+    return results
+
+
+def print_stage_results(results: list) -> None:
+    """Prints the results of benchmark_stages as a table."""
+    print("{:<22}{:>8}{:>10}{:>10}{:>14}{:>10}".format(
+        "stage", "pages", "seconds", "pages/s", "tokens/s", "RSS MB"
+    ))
+    for result in results:
+        print("{:<22}{:>8}{:>10.3f}{:>10.0f}{:>14.0f}{:>10.1f}".format(
+            result["stage"], result["pages"], result["seconds"],
+            result["pages_per_second"], result["tokens_per_second"],
+            result["peak_rss_mb"]
+        ))
+
+
+def benchmark_get_pagenumbers(pages: int, repeat: int = 5) -> dict:
+    """Measures how long get_pagenumbers takes on a synthetic structure file
+    (see utility.synthetic_ocr.generate_structure_xml). Parsing the file is
+    not timed.
+
+    Args:
+        pages (int): Number of pages in the structure file.
+        repeat (int, optional): How often the issues are collected. The
+         fastest run is reported. Defaults to 5.
+
+    Returns:
+        dict: Number of pages and issues found, seconds of the fastest run
+         and pages per second.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "structure.xml")
+        generate_structure_xml(path, pages)
+        xml = etree.parse(path).getroot()
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        _, issue_dict = get_pagenumbers(xml)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    found = sum(map(len, issue_dict.values()))
+    return {
+        "pages": found,
+        "issues": len(issue_dict),
+        "seconds": best,
+        "pages_per_second": found / best if best else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--input", type=str, default="tests/test_data/input/obl/2004_000"
+    )
+    parser.add_argument(
+        "--abbreviations", type=str,
+        default="./src/preprocessing/abbrevs.txt"
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--synthetic_pages", type=int, default=0)
+    parser.add_argument("--words_per_page", type=int, default=400)
+    parser.add_argument("--stages", type=str, default=",".join(STAGES))
+    parser.add_argument("--structure_pages", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.structure_pages:
+        result = benchmark_get_pagenumbers(args.structure_pages, args.repeat)
+        print("get_pagenumbers: {} pages in {} issues in {:.3f}s "
+              "({:.0f} pages/s)".format(result["pages"], result["issues"],
+                                       result["seconds"],
+                                       result["pages_per_second"]))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.synthetic_pages:
+            paths = generate_year(tmp, args.synthetic_pages,
+                                  words_per_page=args.words_per_page,
+                                  abbreviation_file=args.abbreviations)
+        else:
+            paths = sorted(glob.glob(os.path.join(args.input, "*.txt")))
+        results = benchmark_stages(paths, args.abbreviations, args.repeat,
+                                   args.stages.split(","))
+    print_stage_results(results)
+
+
+if __name__ == "__main__":
+    main()
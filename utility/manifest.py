@@ -0,0 +1,221 @@
+"""
+Cached listing of the input and output trees.
+
+Listing the magazine and year directories on the network mount takes
+minutes, so the directories are crawled once with os.scandir and the
+entries (name, size, mtime) are saved in a JSON manifest. On the next run a
+directory is only listed again if its mtime changed, i.e. if files were
+added, removed or renamed in it. Within a run, every directory is listed at
+most once.
+
+The manifest is used by the preprocessing and the postprocessing if
+"PATH_TO_MANIFEST" is set in the config.
+
+Build or refresh it from the repository root:
+    python -m utility.manifest --root /mnt/fulltexts --manifest manifest.json
+"""
+import argparse
+import fnmatch
+import json
+import logging
+import os
+import tempfile
+
+MANIFEST_VERSION = 1
+
+# manifest path -> Manifest, one per process
+_MANIFESTS = {}
+
+
+class Manifest:
+    """The cached directory listings.
+
+    Attributes:
+        path (str): Path of the manifest file (None to keep it in memory).
+        directories (dict): Normalized directory path -> {"mtime": mtime_ns,
+         "entries": {name: [is_dir, size, mtime_ns]}}.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self.directories = {}
+        # directories that are up to date in this process
+        self._fresh = set()
+        if path and os.path.exists(path):
+            try:
+                with open(path, encoding="utf8") as inf:
+                    manifest = json.load(inf)
+            except ValueError:
+                logging.warning("Ignoring broken manifest %s.", path)
+                return
+            if manifest.get("version") == MANIFEST_VERSION:
+                self.directories = manifest["directories"]
+
+    @staticmethod
+    def _key(directory: str) -> str:
+        return os.path.normpath(os.path.abspath(directory))
+
+    def refresh(self, directory: str) -> dict:
+        """Lists the directory again if it changed since it was cached.
+
+        Args:
+            directory (str): Path to the directory.
+
+        Returns:
+            dict: The entries of the directory, empty if it doesn't exist.
+        """
+        key = self._key(directory)
+        self._fresh.add(key)
+        try:
+            mtime = os.stat(key).st_mtime_ns
+        except OSError:
+            self.directories.pop(key, None)
+            return {}
+        cached = self.directories.get(key)
+        if cached is not None and cached["mtime"] == mtime:
+            return cached["entries"]
+        entries = {}
+        try:
+            with os.scandir(key) as scan:
+                for entry in scan:
+                    is_dir = entry.is_dir()
+                    stat = entry.stat()
+                    entries[entry.name] = [
+                        is_dir, 0 if is_dir else stat.st_size, stat.st_mtime_ns
+                    ]
+        except NotADirectoryError:
+            return {}
+        self.directories[key] = {"mtime": mtime, "entries": entries}
+        return entries
+
+    def crawl(self, root: str, depth: int = 2) -> None:
+        """Refreshes the directory and its subdirectories.
+
+        Args:
+            root (str): Path to the directory.
+            depth (int, optional): How many levels of subdirectories are
+             crawled. Defaults to 2, i.e. magazines and years.
+        """
+        entries = self.refresh(root)
+        if depth > 0:
+            for name, (is_dir, _, _) in sorted(entries.items()):
+                if is_dir:
+                    self.crawl(os.path.join(root, name), depth - 1)
+
+    def listdir(self, directory: str) -> dict:
+        """Returns the entries of a directory, refreshed once per process.
+
+        Args:
+            directory (str): Path to the directory.
+
+        Returns:
+            dict: Entry name -> [is_dir, size, mtime_ns].
+        """
+        key = self._key(directory)
+        if key not in self._fresh:
+            return self.refresh(directory)
+        cached = self.directories.get(key)
+        return cached["entries"] if cached else {}
+
+    def glob(self, directory: str, pattern: str = "*") -> list:
+        """Like sorted(glob.glob(directory + "/" + pattern)) for a single
+        level.
+
+        Args:
+            directory (str): Path to the directory.
+            pattern (str, optional): fnmatch pattern of the names. Defaults
+             to "*".
+
+        Returns:
+            list: Sorted paths of the matching entries.
+        """
+        return sorted(
+            directory.rstrip("/") + "/" + name
+            for name in self.listdir(directory)
+            if fnmatch.fnmatch(name, pattern) and not name.startswith(".")
+        )
+
+    def get_size(self, path: str) -> int:
+        """Returns the size of a file from its directory listing.
+
+        Args:
+            path (str): Path to the file.
+
+        Returns:
+            int: The size in bytes.
+        """
+        entry = self.listdir(os.path.dirname(path) or ".").get(
+            os.path.basename(path)
+        )
+        if entry is None:
+            return os.path.getsize(path)
+        return entry[1]
+
+    def get_year_summary(self) -> dict:
+        """Summarizes the cached directories that contain OCR pages.
+
+        Returns:
+            dict: Year directory -> {"pages": number of .txt files, "size":
+             their total size in bytes}.
+        """
+        summary = {}
+        for directory, listing in sorted(self.directories.items()):
+            sizes = [entry[1] for name, entry in listing["entries"].items()
+                     if name.endswith(".txt") and not entry[0]]
+            if sizes:
+                summary[directory] = {"pages": len(sizes), "size": sum(sizes)}
+        return summary
+
+    def save(self) -> None:
+        """Writes the manifest, including the summary of the years."""
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, mode="w", encoding="utf8") as out:
+            json.dump({
+                "version": MANIFEST_VERSION,
+                "years": self.get_year_summary(),
+                "directories": self.directories,
+            }, out)
+        os.replace(tmp_path, self.path)
+
+
+def get_manifest(conf: dict):
+    """Returns the manifest of this process if "PATH_TO_MANIFEST" is set.
+
+    Args:
+        conf (dict): A dictionary describing various paths and settings.
+
+    Returns:
+        Manifest: The manifest, or None if no manifest is configured.
+    """
+    path = conf.get("PATH_TO_MANIFEST")
+    if not path:
+        return None
+    if path not in _MANIFESTS:
+        _MANIFESTS[path] = Manifest(path)
+    return _MANIFESTS[path]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--root", type=str, required=True)
+    parser.add_argument("--manifest", type=str, required=True)
+    parser.add_argument("--depth", type=int, default=2)
+    args = parser.parse_args()
+
+    manifest = Manifest(args.manifest)
+    manifest.crawl(args.root, args.depth)
+    manifest.save()
+    summary = manifest.get_year_summary()
+    print("{} years, {} pages, {:.1f} MB".format(
+        len(summary),
+        sum(year["pages"] for year in summary.values()),
+        sum(year["size"] for year in summary.values()) / 1024 / 1024,
+    ))
+
+
+if __name__ == "__main__":
+    main()
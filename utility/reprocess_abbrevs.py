@@ -0,0 +1,268 @@
+"""
+Re-runs prep and tag only on the pages affected by a change of the
+abbreviation list.
+
+The pages are found with the token indexes written during the preprocessing
+(see src.preprocessing.token_index). The new abbreviation file is
+PATH_TO_ABBREVIATION_FILE of the config file, unless --new_abbreviations is
+given.
+
+Run from the repository root:
+    python -m utility.reprocess_abbrevs --old_abbreviations old_abbrevs.txt \
+        --new_abbreviations src/preprocessing/abbrevs.txt
+"""
+import argparse
+from collections import OrderedDict
+import glob
+import json
+import logging
+import os
+
+from src.preprocessing.input_files import (
+    find_year_directory,
+    get_year_name,
+)
+from src.preprocessing.preprocess import (
+    PreprocessConfig,
+    prep_year_data_for_tagging,
+)
+from src.preprocessing.prep_store import (
+    PrepYearFile,
+    get_prep_path,
+    write_prep_file,
+)
+from src.preprocessing.token_index import (
+    INDEX_FOLDER,
+    index_key,
+    iter_page_words,
+    replace_index_pages,
+    save_token_index,
+)
+
+
+def read_abbrev_sequences(abbreviation_file: str) -> set:
+    """Reads the abbreviations of a file as sequences of words.
+
+    Args:
+        abbreviation_file (str): Path to the abbreviation file.
+
+    Returns:
+        set: One tuple of lowercased words per abbreviation.
+    """
+    preprocess_data = PreprocessConfig()
+    with open(abbreviation_file, encoding="utf8") as inf:
+        return {
+            tuple(words)
+            for words in map(preprocess_data.split_abbrev, inf)
+            if words
+        }
+
+
+def get_changed_abbrevs(old_file: str, new_file: str) -> set:
+    """Returns the abbreviations that were added or removed.
+
+    Args:
+        old_file (str): Path to the old abbreviation file.
+        new_file (str): Path to the new abbreviation file.
+
+    Returns:
+        set: Sequences of words that are only in one of the files.
+    """
+    return read_abbrev_sequences(old_file) ^ read_abbrev_sequences(new_file)
+
+
+def find_affected_pages(index: dict, abbrevs: set) -> list:
+    """Finds the pages that contain all words of at least one of the given
+    abbreviations. Only those pages can be preprocessed differently.
+
+    Args:
+        index (dict): The token index of a year.
+        abbrevs (set): Sequences of words.
+
+    Returns:
+        list: The affected page names in their order.
+    """
+    postings = index["tokens"]
+    affected = set()
+    for abbrev in abbrevs:
+        pages = None
+        for key in {index_key(word) for word in abbrev}:
+            found = set(postings.get(key, ()))
+            pages = found if pages is None else pages & found
+            if not pages:
+                break
+        if pages:
+            affected |= pages
+    return [index["pages"][position] for position in sorted(affected)]
+
+
+def get_year_directory(year: tuple, conf: dict) -> str:
+    """Finds the input directory of a year (chunk).
+
+    Args:
+        year (tuple): The magazine shortname followed by the year (parts).
+        conf (dict): A dictionary describing various paths and settings.
+
+    Returns:
+        str: Path to the year directory.
+    """
+    for year_directory in conf.get("CUSTOM_PATHS", []):
+        if get_year_name(year_directory) == list(year[:2]):
+            return year_directory
+    return find_year_directory(conf["PATH_TO_INPUT_FOLDERS"], year[0],
+                               year[1])
+
+
+def iter_year_indexes(conf: dict):
+    """Loads the token indexes of all years.
+
+    Args:
+        conf (dict): A dictionary describing various paths and settings.
+
+    Yields:
+        tuple: The year and its index.
+    """
+    pattern = os.path.join(conf["PATH_TO_OUTFILE_FOLDER"], INDEX_FOLDER,
+                           "*", "*.json")
+    for path in sorted(glob.glob(pattern)):
+        magazine = os.path.basename(os.path.dirname(path))
+        name = os.path.basename(path)[:-len(".json")]
+        # chunks of large years are named like 1980_000-00
+        head, separator, chunk = name.partition("-")
+        year = (magazine, head, separator, chunk) if separator \
+            else (magazine, name)
+        with open(path, encoding="utf8") as inf:
+            yield year, json.load(inf)
+
+
+def merge_tagged_pages(outfile_path: str, new_path: str, pages: list):
+    """Replaces the given pages in a tag output with the ones in new_path,
+    in place, so the order of the pages stays the same.
+
+    Args:
+        outfile_path (str): Path to the tag output of the year.
+        new_path (str): Path to the tag output of the affected pages. It is
+         removed afterwards.
+        pages (list): The affected pages. Pages that are not in new_path
+         anymore are removed from the output.
+    """
+    decoder = json.JSONDecoder()
+
+    def read_lines(path):
+        lines = OrderedDict()
+        with open(path, encoding="utf8") as inf:
+            for line in inf:
+                # the filename is the first key of every line
+                filename, _ = decoder.raw_decode(line, 1)
+                lines.setdefault(filename, []).append(line)
+        return lines
+
+    lines = read_lines(outfile_path)
+    new_lines = read_lines(new_path)
+    for page in pages:
+        if page not in new_lines:
+            lines.pop(page, None)
+    # the pages keep their place (e.g. the issue order of split years),
+    # only new pages are appended
+    lines.update(new_lines)
+    with open(outfile_path + ".tmp", mode="w", encoding="utf8") as out:
+        for page_lines in lines.values():
+            out.writelines(page_lines)
+    os.replace(outfile_path + ".tmp", outfile_path)
+    os.remove(new_path)
+
+
+def reprocess_abbrevs(conf: dict, old_file: str, gpu_num: int = 0) -> dict:
+    """Preprocesses and tags the pages affected by the change from old_file
+    to the abbreviation file in the conf again and updates the outputs.
+
+    Args:
+        conf (dict): A dictionary describing various paths and settings.
+        old_file (str): Path to the old abbreviation file.
+        gpu_num (int, optional): The GPU used for tagging. Defaults to 0.
+
+    Returns:
+        dict: The reprocessed pages per year.
+    """
+    abbrevs = get_changed_abbrevs(old_file,
+                                  conf["PATH_TO_ABBREVIATION_FILE"])
+    logging.info("%s abbreviations changed.", len(abbrevs))
+    tagger = None
+    reprocessed = {}
+    for year, index in iter_year_indexes(conf):
+        pages = find_affected_pages(index, abbrevs)
+        if not pages:
+            continue
+        logging.info("Reprocessing %s pages of %s", len(pages), year)
+        year_directory = get_year_directory(year, conf)
+        infiles = [os.path.join(year_directory, page) for page in pages]
+        files, _ = prep_year_data_for_tagging((year, infiles, conf))
+
+        prep_path = get_prep_path(year, conf)
+        if os.path.exists(prep_path):
+            prepared = OrderedDict(PrepYearFile(prep_path).items())
+            for page in pages:
+                if page not in files:
+                    prepared.pop(page, None)
+            prepared.update(files)
+            write_prep_file(prep_path, prepared)
+        # the next run has to find the pages by their new tokens
+        replace_index_pages(index, {
+            page: list(iter_page_words(files.get(page, []))) for page in pages
+        })
+        save_token_index(year, index, conf)
+
+        outfile_path = os.path.join(conf["PATH_TO_OUTFILE_FOLDER"], "tag",
+                                    year[0], "".join(year[1:]) + ".jsonl")
+        if os.path.exists(outfile_path):
+            if tagger is None:
+                # imported here, because torch and flair are slow to import
+                from src.tag_flair import apply_thread_settings, \
+                    load_tagging_settings, open_result_cache, \
+                    setup_flair_tagger, tag_year_data_and_save
+                tagger = setup_flair_tagger(conf, gpu_num)
+                settings = load_tagging_settings(conf)
+                apply_thread_settings(settings)
+                # the unchanged sentences of the pages are not tagged again
+                result_cache = open_result_cache(conf)
+            tag_year_data_and_save(files, tagger, outfile_path + ".new",
+                                   int(conf["SENTENCE_BATCH_SIZE"]),
+                                   settings["token_budget"],
+                                   settings["mini_batch_size"],
+                                   result_cache=result_cache)
+            merge_tagged_pages(outfile_path, outfile_path + ".new", pages)
+        reprocessed[year] = pages
+    if tagger is not None and result_cache is not None:
+        result_cache.close()
+    return reprocessed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--old_abbreviations", type=str, required=True)
+    parser.add_argument("--new_abbreviations", type=str)
+    parser.add_argument(
+        "--config_file", type=str, default="./configs/configurations.json"
+    )
+    parser.add_argument("--gpu", type=int, default=0)
+    parser.add_argument("--magazine_year_paths", type=str)
+    args = parser.parse_args()
+
+    with open(args.config_file, encoding="utf8") as inf:
+        conf = json.load(inf)
+    if args.new_abbreviations:
+        conf["PATH_TO_ABBREVIATION_FILE"] = args.new_abbreviations
+    if args.magazine_year_paths:
+        conf["CUSTOM_PATHS"] = args.magazine_year_paths.split(",")
+
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+    reprocessed = reprocess_abbrevs(conf, args.old_abbreviations, args.gpu)
+    print("Reprocessed {} pages in {} years.".format(
+        sum(map(len, reprocessed.values())), len(reprocessed)
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+Static sharding of the input years for runs on several nodes.
+
+With "--shard i/N", node i (counting from 0) of N processes only its share of
+the years and writes into its own output subtree, so the nodes don't need
+any coordination. The years are assigned deterministically and balanced by
+their number of pages (or the size of the given output files), so every node
+computes the same assignment.
+"""
+import argparse
+import glob
+import os
+
+from src.preprocessing.input_files import (
+    ARCHIVE_SUFFIX,
+    get_year_name,
+    list_year_directories,
+    list_year_pages,
+)
+from utility.manifest import get_manifest
+
+SHARD_FOLDER = "shards"
+
+
+def parse_shard(value: str) -> tuple:
+    """Custom type function for argparse that parses "i/N".
+
+    Args:
+        value (str): The shard, e.g. "0/4" for the first of four shards.
+
+    Raises:
+        argparse.ArgumentTypeError: If the value is not a valid shard.
+
+    Returns:
+        tuple: The index of the shard and the number of shards.
+    """
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"{value} is not a shard like 0/4"
+        ) from None
+    if count <= 0 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(
+            f"{value}: the shard index must be between 0 and {count - 1}"
+        )
+    return index, count
+
+
+def list_input_years(conf: dict) -> list:
+    """Lists all year directories of the run, either the custom paths or
+    all years of all magazines in the input folder.
+
+    Args:
+        conf (dict): A dictionary describing various paths and settings.
+
+    Returns:
+        list: Paths to the year directories.
+    """
+    if "CUSTOM_PATHS" in conf:
+        return list(conf["CUSTOM_PATHS"])
+    manifest = get_manifest(conf)
+    if manifest is not None:
+        magazines = manifest.glob(conf["PATH_TO_INPUT_FOLDERS"])
+    else:
+        magazines = sorted(glob.glob(conf["PATH_TO_INPUT_FOLDERS"] + "/*"))
+    return [
+        year
+        for magazine in magazines
+        for year in list_year_directories(magazine, manifest)
+    ]
+
+
+def get_year_key(path: str) -> list:
+    """Returns the (magazine, year) key of an input of the run, which is
+    either a year directory (or archive) of the input or an output file of
+    an earlier step, e.g. tag/obl/2004_000.jsonl or a chunk like
+    tag/obl/1980_000-00.jsonl.
+
+    Args:
+        path (str): Path to the year directory or output file.
+
+    Returns:
+        list: The magazine shortname and the year.
+    """
+    magazine, year = get_year_name(path)
+    return [magazine, year.split(".")[0].partition("-")[0]]
+
+
+def get_year_weight(path: str, manifest=None) -> int:
+    """Estimates the work of an input of the run, the number of pages of a
+    year directory or the size of an output file of an earlier step.
+
+    Args:
+        path (str): Path to the year directory or output file.
+        manifest (Manifest, optional): Cached directory listings (see
+         utility.manifest). Defaults to None.
+
+    Returns:
+        int: The weight used to balance the shards.
+    """
+    if os.path.isfile(path) and not path.endswith(ARCHIVE_SUFFIX):
+        return os.path.getsize(path)
+    return len(list_year_pages(path, manifest))
+
+
+def assign_shards(year_pages: dict, count: int) -> list:
+    """Distributes the years over the shards, balanced by their number of
+    pages. The largest years are assigned first, each to the shard with the
+    fewest pages so far. Ties are broken by the year and the shard index, so
+    the result only depends on the input.
+
+    Args:
+        year_pages (dict): Year directory -> number of pages.
+        count (int): Number of shards.
+
+    Returns:
+        list: The sorted year directories of every shard.
+    """
+    shards = [[] for _ in range(count)]
+    loads = [0] * count
+    for year, pages in sorted(year_pages.items(),
+                              key=lambda item: (-item[1], item[0])):
+        index = min(range(count), key=lambda i: (loads[i], i))
+        shards[index].append(year)
+        loads[index] += pages
+    return [sorted(shard) for shard in shards]
+
+
+def apply_shard(conf: dict, index: int, count: int) -> list:
+    """Restricts the run to the years of one shard and moves its output
+    into the subtree shards/<index>_of_<count>/ of the outfile folder.
+
+    The shard is assigned once, from the custom paths or the years in the
+    input folder. Its years are stored as (magazine, year) keys in
+    "SHARD_YEARS", and every step only reads the inputs with these keys
+    (see in_shard). Custom paths are reduced to the ones of the shard and
+    kept for all steps, so they can also point to the outputs of an earlier
+    step, e.g. the tagged years for "--tasks finish".
+
+    Args:
+        conf (dict): A dictionary describing various paths and settings. It
+         is updated in place.
+        index (int): The index of the shard.
+        count (int): The number of shards.
+
+    Returns:
+        list: The year directories (or output files) of the shard.
+    """
+    manifest = get_manifest(conf)
+    year_weights = {
+        year: get_year_weight(year, manifest)
+        for year in list_input_years(conf)
+    }
+    years = assign_shards(year_weights, count)[index]
+    if "CUSTOM_PATHS" in conf:
+        conf["CUSTOM_PATHS"] = years
+    conf["SHARD"] = [index, count]
+    conf["SHARD_YEARS"] = [get_year_key(year) for year in years]
+    conf["PATH_TO_OUTFILE_FOLDER"] = os.path.join(
+        conf["PATH_TO_OUTFILE_FOLDER"], SHARD_FOLDER,
+        f"{index}_of_{count}", ""
+    )
+    return years
+
+
+def in_shard(conf: dict, magazine: str, filename: str) -> bool:
+    """Whether an output file (e.g. of the ground truth) belongs to the
+    years of the shard. Without sharding every file belongs to the run.
+
+    Args:
+        conf (dict): A dictionary describing various paths and settings.
+        magazine (str): The magazine shortname.
+        filename (str): Name of the file, e.g. "2004_000.json" or
+         "1980_000-00.jsonl" for a chunk of a year.
+
+    Returns:
+        bool: True if the file belongs to this run.
+    """
+    if "SHARD_YEARS" not in conf:
+        return True
+    year = filename.split(".")[0].partition("-")[0]
+    return [magazine, year] in conf["SHARD_YEARS"]
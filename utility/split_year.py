@@ -10,16 +10,82 @@ are not processed. Discuss if this is wished for behavior.
 """
 
 import glob
-from lxml import etree
+import json
 import os
 import logging
 
+from src.preprocessing.input_files import (
+    ARCHIVE_SUFFIX,
+    get_page_size,
+    get_year_name,
+    list_year_pages,
+)
+from utility.structure_cache import get_structure_paths, load_structure
+
 DATA2_MNT = "/mnt/adl/"
 LOG_PATH = "./data/logs/pipeline.log"
 # LOG_PATH = "./test.log"
-MISSING_PATH = "./data/logs/missing_content_list.txt"
-# keep track of all years that had content ouside of issues,
-# so we can process these later again if wanted.
+# one JSON report per year whose pages don't match the structure file, so
+# we can process these later again if wanted.
+REPORT_FOLDER = "./data/logs/page_reports"
+# years with more pages are split into several chunks
+MAX_CHUNK_LENGTH = 500
+# issues with more pages are split into several chunks
+MAX_ISSUE_LENGTH = 1000
+
+
+def index_structure(xml) -> dict:
+    """Walks the XML tree once and indexes everything get_pagenumbers looks
+    up, instead of searching the whole tree for every link.
+    utility.structure_cache.stream_structure builds the same index without
+    loading the whole tree.
+
+    Args:
+        xml (etree): XML-Tree with issue-information
+
+    Returns:
+        dict: "issues": (IssueNumber, IDs of the elements of the issue and
+         the issue itself) for every issue, "unstructured_paths": the paths
+         of all resources (used if there are no issues), "resource_ids":
+         element ID -> resource-id of its page, "links": from-ID -> to-IDs
+         and "resource_paths": resource ID -> Agora:Path. For IDs that occur
+         more than once, the first element wins like in the XPath queries.
+    """
+    issues = []
+    for issue in xml.iterfind(".//element[@type='Issue']"):
+        issue_number = issue.find("./attr[@type='IssueNumber']")
+        issues.append((
+            None if issue_number is None else issue_number.text,
+            [elem.get("ID") for elem in issue.findall("./element")]
+            + [issue.get("ID")]
+        ))
+    resource_ids = {}
+    links = {}
+    for node in xml.iterdescendants("element", "link"):
+        if node.tag == "link":
+            links.setdefault(node.get("from"), []).append(node.get("to"))
+        elif node.get("ID") not in resource_ids:
+            # Sometimes, the linked elements are regions. In that case we
+            # take the resource-id of the page the region belongs to.
+            page = node if node.get("type") == "Agora:Page" \
+                else node.getparent()
+            resource_id = page.find("./resource-id")
+            resource_ids[node.get("ID")] = \
+                None if resource_id is None else resource_id.text
+    unstructured_paths = []
+    resource_paths = {}
+    for resource in xml.iterfind("./resource-list/resource"):
+        paths = resource.findall("./attr[@type='Agora:Path']")
+        unstructured_paths.extend(path.text for path in paths)
+        if paths:
+            resource_paths.setdefault(resource.get("ID"), paths[0].text)
+    return {
+        "issues": issues,
+        "unstructured_paths": unstructured_paths,
+        "resource_ids": resource_ids,
+        "links": links,
+        "resource_paths": resource_paths,
+    }
 
 
 def get_pagenumbers(xml):
@@ -32,73 +98,112 @@ def get_pagenumbers(xml):
         dict: Dictionary with information about all issues and the filenumbers
          that refer to the respective pagenumbers
     """
+    return collect_issue_pages(index_structure(xml))
+
+
+def collect_issue_pages(index: dict):
+    """Finds the pages of every issue in the index of a structure file.
+
+    Args:
+        index (dict): The output of index_structure.
+
+    Raises:
+        AttributeError: If an issue has no IssueNumber.
+
+    Returns:
+        tuple: -1 if some linked elements have no page and 0 else, and the
+         dictionary of get_pagenumbers.
+    """
     returncode = 0
 
     issue_dict = {}  # Key: IssueNumber, Value: List of pagenumbers
 
-    # 1. Get all issues with their ids
-    issues = xml.findall(".//element[@type='Issue']")
-
     # Alternative plans if no issue informations are available
-    if len(issues) == 0:
+    if len(index["issues"]) == 0:
         print("WARNING: NO ISSUE INFORMATION WAS FOUND!")
-        filenames = xml.findall(
-            "./resource-list/resource/attr[@type='Agora:Path']"
-            )
         issue_dict["1"] = []
-        for filename in filenames:
-            issue_dict["1"].append(os.path.basename(filename.text.lower())
+        for filename in index["unstructured_paths"]:
+            issue_dict["1"].append(os.path.basename(filename.lower())
                                    .replace(".gif", ".txt")
                                    .replace(".jpg", ".txt"))
+        return returncode, issue_dict
 
-    # 2. get info about first and last element of that issue
-    for issue in issues:
-        issue_number = issue.find("./attr[@type='IssueNumber']").text
-        issue_dict[issue_number] = []
+    links_from = index["links"]
 
-        additional_elements = issue.findall("./element")
-        for elem in additional_elements + [issue]:
-            idx = elem.get("ID")
-            links = xml.findall(".//link[@from='{0}']".format(idx))
-
-            # 3. get all those elements and only get pagenumbers
-            for link in links:
-                page_elem = xml.find(".//element[@ID='{0}']"
-                                     .format(link.get("to")))
-
-                # NOTE: Sometimes, the linked elements are regions. In the
-                # cases I've checked, pages that the regions belong to are
-                # also linked, so we could simply ignore regions but this
-                # might lead to missing pages in cases I've not seen. Instead,
-                # we append the page-resource-id and then we check for
+    # get info about first and last element of that issue
+    for issue_number, element_ids in index["issues"]:
+        if issue_number is None:
+            raise AttributeError("Issue without IssueNumber")
+        issue_dict[issue_number] = []
+        # the same filename can be linked by several elements of an issue
+        issue_filenames = set()
+
+        for idx in element_ids:
+            # str() because the XPath queries formatted a missing ID as "None"
+            # get all the linked elements and only get pagenumbers
+            for to in links_from.get(str(idx), []):
+                # NOTE: Regions are resolved to their page, so we check for
                 # duplicates before appending a filename
-
-                if page_elem.get("type") == "Agora:Page":
-                    resourceId = page_elem.find("./resource-id")
-                else:
-                    resourceId = page_elem.getparent().find("./resource-id")
-                    # resourceId = None
-                if resourceId is None:
+                filename = resolve_linked_page(to, index)
+                if filename is None:
                     # These print-Statements are used to debug
                     logging.warning(
                         "WARNING: No resource-id could be linked so a page might be missing later on.")
-                    logging.warning(elem.get("ID"))
-                    logging.warning(link.get("to"))
+                    logging.warning(idx)
+                    logging.warning(to)
                     returncode = -1
                     continue
-                else:
-                    resourceId = resourceId.text
-                # issue_dict[issue_number].append(physicalNo)
-                filename = xml.find(
-                    "./resource-list/resource[@ID='{0}']/attr[@type='Agora:Path']".format(resourceId)
-                    ).text
-                filename = os.path.basename(filename).replace(".jpg", ".txt")
-                if filename not in issue_dict[issue_number]:
+                if filename not in issue_filenames:
+                    issue_filenames.add(filename)
                     issue_dict[issue_number].append(filename)
 
     return returncode, issue_dict
 
 
+def resolve_linked_page(to: str, index: dict):
+    """Returns the filename of the page a linked element belongs to.
+
+    Args:
+        to (str): ID of the linked element.
+        index (dict): The output of index_structure.
+
+    Returns:
+        str: The filename of the page, or None if it can't be resolved.
+    """
+    resource_id = index["resource_ids"].get(str(to))
+    path = index["resource_paths"].get(str(resource_id))
+    if resource_id is None or path is None:
+        return None
+    return os.path.basename(path).replace(".jpg", ".txt")
+
+
+def collect_issue_articles(index: dict) -> dict:
+    """Finds the pages of every article (i.e. every element of an issue) in
+    the index of a structure file.
+
+    Args:
+        index (dict): The output of index_structure.
+
+    Returns:
+        dict: IssueNumber -> list with the pages of every article.
+    """
+    articles = {}
+    for issue_number, element_ids in index["issues"]:
+        issue_articles = []
+        # the last ID is the issue itself, whose links (e.g. to the cover)
+        # don't belong to an article
+        for idx in element_ids[:-1]:
+            pages = []
+            for to in index["links"].get(str(idx), []):
+                filename = resolve_linked_page(to, index)
+                if filename is not None and filename not in pages:
+                    pages.append(filename)
+            if pages:
+                issue_articles.append(pages)
+        articles[issue_number] = issue_articles
+    return articles
+
+
 def check_for_missing_pages(pagenos: dict):
     """Find duplicates in the pagenos dictionary.
 
@@ -118,9 +223,174 @@ def check_for_missing_pages(pagenos: dict):
     return 0, len(found_pages)
 
 
+def get_article_cuts(pagenumbers: list, articles: list) -> list:
+    """Finds the positions where the pages of an issue can be cut without
+    cutting through an article. A cut at position p is between page p - 1
+    and p.
+
+    Args:
+        pagenumbers (list): The pages of the issue.
+        articles (list): The pages of every article of the issue.
+
+    Returns:
+        list: The allowed cuts in ascending order.
+    """
+    length = len(pagenumbers)
+    positions = {page: i for i, page in enumerate(pagenumbers)}
+    # a cut isn't allowed if an article starts before it and ends on it or
+    # after
+    covered = [0] * (length + 1)
+    for article in articles:
+        article_positions = [positions[page] for page in article
+                             if page in positions]
+        if len(article_positions) > 1:
+            covered[min(article_positions) + 1] += 1
+            covered[max(article_positions) + 1] -= 1
+    cuts = []
+    coverage = 0
+    for position in range(1, length):
+        coverage += covered[position]
+        if coverage == 0:
+            cuts.append(position)
+    return cuts
+
+
+def choose_balanced_cuts(cuts: list,
+                         weights: list,
+                         parts: int,
+                         max_len: int = 0) -> list:
+    """Chooses the allowed cuts that split the pages into parts of about the
+    same weight.
+
+    Args:
+        cuts (list): The allowed cuts in ascending order.
+        weights (list): The weight of every page.
+        parts (int): Into how many parts the pages should be split. If there
+         are too few cuts, there are fewer parts.
+        max_len (int, optional): Max number of pages of a part. If the
+         weights don't allow it, there are more parts. Only an article with
+         more pages can exceed it. Defaults to 0, i.e. no limit.
+
+    Returns:
+        list: The chosen cuts in ascending order.
+    """
+    length = len(weights)
+    if not any(weights):
+        weights = [1] * length
+    # cumulated weight before every position
+    cumulated = [0]
+    for weight in weights:
+        cumulated.append(cumulated[-1] + weight)
+
+    chosen = []
+    start = 0
+    # index of the first cut after start
+    i = 0
+    while True:
+        left = parts - len(chosen)
+        if max_len:
+            left = max(left, -(-(length - start) // max_len))
+        if left <= 1:
+            break
+        while i < len(cuts) and cuts[i] <= start:
+            i += 1
+        if i == len(cuts):
+            break
+        # the remaining weight is shared equally by the remaining parts
+        target = cumulated[start] + (cumulated[length] - cumulated[start]) \
+            / left
+        # the first allowed cut at or after the target, or the one before it
+        j = i
+        while j < len(cuts) and cumulated[cuts[j]] < target:
+            j += 1
+        candidates = [k for k in (j - 1, j)
+                      if i <= k < len(cuts)
+                      and (not max_len or cuts[k] - start <= max_len)]
+        if candidates:
+            best = min(candidates,
+                       key=lambda k: abs(cumulated[cuts[k]] - target))
+        else:
+            # the last cut within max_len pages, or the first one after
+            # them if an article is longer
+            best = min(j, len(cuts)) - 1
+            while best >= i and cuts[best] - start > max_len:
+                best -= 1
+            best = max(best, i)
+        chosen.append(cuts[best])
+        start = cuts[best]
+    return chosen
+
+
+def split_year_at_articles(pagenos: dict,
+                           articles: dict,
+                           max_len=500,
+                           max_len_warning=1000,
+                           page_weights: dict = None) -> list:
+    """Splits the issues of a year into chunks of about the same estimated
+    number of tokens, with at most max_len pages each. The chunks are cut
+    at issue borders and at article borders within an issue, so small
+    issues are combined and large ones are split.
+
+    Args:
+        pagenos (dict): The keys are issues and the values are lists of pages.
+        articles (dict): The pages of every article per issue (see
+         collect_issue_articles).
+        max_len (int, optional): Max number of pages in one chunk. The year
+         is split into as few chunks as this allows, unless the weights
+         need more. Only an article with more pages, or an issue without
+         articles of at most max_len_warning pages, can exceed it. Defaults
+         to 500.
+        max_len_warning (int, optional): Issues without articles are only
+         cut if they have more pages than that, and then between any two
+         pages. Defaults to 1000.
+        page_weights (dict, optional): Page -> estimated number of tokens.
+         Defaults to None, i.e. all pages have the same weight.
+
+    Returns:
+        list: List of Dictionaries of Lists of Pagenumbers. An issue that is
+         split into several chunks is named issue-0, issue-1, ...
+    """
+    issues = [(issue, pages) for issue, pages in pagenos.items() if pages]
+    cuts = []
+    weights = []
+    offset = 0
+    for issue, pages in issues:
+        if offset:
+            cuts.append(offset)
+        if articles.get(issue):
+            issue_cuts = get_article_cuts(pages, articles[issue])
+        elif len(pages) > max_len_warning:
+            issue_cuts = range(1, len(pages))
+        else:
+            issue_cuts = []
+        cuts.extend(offset + cut for cut in issue_cuts)
+        weights.extend(page_weights.get(page, 0) if page_weights else 1
+                       for page in pages)
+        offset += len(pages)
+    parts = -(-offset // max_len)
+    bounds = [0] + choose_balanced_cuts(cuts, weights, parts, max_len) \
+        + [offset]
+
+    chunks = [{} for _ in bounds[1:]]
+    offset = 0
+    for issue, pages in issues:
+        pieces = [
+            (i, pages[max(start - offset, 0):end - offset])
+            for i, (start, end) in enumerate(zip(bounds, bounds[1:]))
+            if start < offset + len(pages) and end > offset
+        ]
+        for number, (i, piece) in enumerate(pieces):
+            name = issue if len(pieces) == 1 else issue + "-" + str(number)
+            chunks[i][name] = piece
+        offset += len(pages)
+    return chunks
+
+
 def cut_pagenumbers(pagenos: dict,
                     max_len=500,
-                    max_len_warning=1000):
+                    max_len_warning=1000,
+                    articles: dict = None,
+                    page_weights: dict = None):
     """Cut the issues into chunks small enough for the processing pipeline.
     Args:
         pagenos (dict): The keys are issues and the values are lists of pages.
@@ -129,9 +399,28 @@ def cut_pagenumbers(pagenos: dict,
         max_len_warning (int, optional): Max number of pages *per issue*.
          If it's more than that, we print a warning and split it within an
          issue. Defaults to 1000.
+        articles (dict, optional): The pages of every article per issue (see
+         collect_issue_articles). If given, a year with more than max_len
+         pages is split at issue and article borders into chunks of about
+         the same weight and at most max_len pages (see
+         split_year_at_articles) instead of packing
+         whole issues into chunks of up to max_len pages. Defaults to None.
+        page_weights (dict, optional): Page -> estimated number of tokens,
+         used to balance the chunks if articles are given. Defaults to
+         None, i.e. all pages have the same weight.
     Returns:
         list: List of Dictionaries of Lists of Pagenumbers
     """
+    page_count = sum(len(pagenumbers) for pagenumbers in pagenos.values())
+    if articles is not None and page_count > max_len:
+        if any(len(pagenumbers) > max_len_warning
+               for pagenumbers in pagenos.values()):
+            logging.warning(
+                "WARNING: Issue is longer than set maximum length, will be split at article borders."
+            )
+        return split_year_at_articles(pagenos, articles, max_len,
+                                      max_len_warning, page_weights)
+
     collected_issues = []
 
     current_chunk = {}
@@ -141,8 +430,6 @@ def cut_pagenumbers(pagenos: dict,
 
         length = len(pagenumbers)
         if length > max_len_warning:
-            # TODO: If a single issue is longer than the maximum length,
-            # we need to split at article borders
             logging.warning(
                 "WARNING: Issue is longer than set maximum length, will be split at set length interval."
             )
@@ -200,8 +487,10 @@ def compare_pagenames(pagenos: dict,
         directory (str): Path to the directory where the pages should be.
 
     Returns:
-        int: -1 if there were files missing, and we write the missing
-         filepaths into a file, else 0.
+        int: -1 if pages of the issues are missing in the directory or the
+         directory has pages that aren't part of any issue, and we write
+         them into a JSON report of the year (see write_page_report), else
+         0.
 
     Note:
         Ismail: Common missing files are the ones at the end of a file that are not
@@ -213,87 +502,176 @@ def compare_pagenames(pagenos: dict,
         logging.warning(
             "WARNING: Page count in data directory doesnt equal page count calculated by year splitter!"
         )
-        flattened_pages = sorted([page for issue in pagenos.values()
-                                 for page in issue])
-        sorted_pages = sorted([os.path.basename(x) for x in year_pages])
-        longer_list = flattened_pages if (
-            len(flattened_pages) >= len(sorted_pages)) else sorted_pages
-        shorter_list = flattened_pages if (
-            len(flattened_pages) < len(sorted_pages)) else sorted_pages
-        parallelized_pages = []
-        i = 0
-        j = 0
-        while i < len(longer_list):
-            page_a = longer_list[i]
-            if page_a in shorter_list[j:]:
-                for k, p in enumerate(shorter_list[j:]):
-                    if p != page_a:
-                        parallelized_pages.append((None, p))
-                    else:
-                        parallelized_pages.append((page_a, p))
-                        j = j + k + 1
-                        break
-                if j > len(shorter_list):
-                    for p in longer_list[i+1:]:
-                        parallelized_pages.append((p, None))
-                    break
-            else:
-                parallelized_pages.append((page_a, None))
-            i += 1
-        logging.info(parallelized_pages)
-
-        # get the indices of all elements that could not be parallelized
-        # this helps for manual check if this is simply the index missing
-        # (which would be fine)
-        indices = ", ".join([str(i) for i, p in enumerate(parallelized_pages)
-                            if None in p])
-        with open(LOG_PATH, mode="a", encoding="utf8") as log:
-            log.write("WARNING: Splitting {} pagecount is suspicious.\
-                      Pages at positions {} are missing.\
-                      Max index is {}.\n".format(directory,
-                                                 indices,
-                                                 str(len(longer_list))))
-        with open(MISSING_PATH, mode="a", encoding="utf8") as mss:
-            mss.write(directory + "\n")
+    # the counts can match although pages are missing and others are extra
+    missing, extra = reconcile_pagenames(pagenos, year_pages)
+    if missing or extra:
+        logging.warning("%s: %s pages of the structure file are missing, %s "
+                        "pages are not part of any issue.", directory,
+                        len(missing), len(extra))
+        write_page_report(directory, page_count, year_pages, missing, extra)
 
         return -1
 
+    # the pages match now, an older report is outdated
+    if directory and os.path.exists(get_page_report_path(directory)):
+        os.remove(get_page_report_path(directory))
     return 0
 
 
-def split_directory(directory: str, custom_xml_path=None):
+def reconcile_pagenames(pagenos: dict, year_pages: list) -> tuple:
+    """Compares the pages of the issues with the pages in the directory.
+
+    Args:
+        pagenos (dict): Keys are issues, the values are lists of pages.
+        year_pages (list): List of paths to pages.
+
+    Returns:
+        tuple: The sorted pages of the issues that aren't in the directory
+         and the sorted pages in the directory that aren't part of any issue.
+    """
+    issue_pages = {page for issue in pagenos.values() for page in issue}
+    directory_pages = {os.path.basename(path) for path in year_pages}
+    return (sorted(issue_pages - directory_pages),
+            sorted(directory_pages - issue_pages))
+
+
+def get_page_report_path(directory: str) -> str:
+    """Returns the path of the page report of a year directory, e.g.
+    REPORT_FOLDER/obl_2004_000.json."""
+    return "{}/{}.json".format(REPORT_FOLDER,
+                               "_".join(get_year_name(directory)))
+
+
+def write_page_report(directory: str,
+                      page_count: int,
+                      year_pages: list,
+                      missing: list,
+                      extra: list) -> None:
+    """Writes the JSON report of a year whose pages don't match its
+    structure file, replacing an older report of the year.
+
+    Args:
+        directory (str): Path to the year directory.
+        page_count (int): How many pages the issues have.
+        year_pages (list): List of paths to pages.
+        missing (list): Pages of the issues that aren't in the directory.
+        extra (list): Pages in the directory that aren't part of any issue.
+    """
+    os.makedirs(REPORT_FOLDER, exist_ok=True)
+    with open(get_page_report_path(directory), mode="w",
+              encoding="utf8") as out:
+        json.dump({
+            "directory": directory,
+            "issue_pages": page_count,
+            "directory_pages": len(year_pages),
+            "missing": missing,
+            "extra": extra,
+        }, out, indent=1)
+
+
+def load_page_reports(report_folder: str = None) -> list:
+    """Reads all page reports, e.g. to reprocess the affected years with
+    "--magazine_year_paths".
+
+    Args:
+        report_folder (str, optional): Folder of the reports. Defaults to
+         REPORT_FOLDER.
+
+    Returns:
+        list: The reports, sorted by their directory.
+    """
+    reports = []
+    for path in glob.glob((report_folder or REPORT_FOLDER) + "/*.json"):
+        with open(path, encoding="utf8") as inf:
+            reports.append(json.load(inf))
+    return sorted(reports, key=lambda report: report["directory"])
+
+
+def resolve_chunk_pages(chunks: list, year_pages: list) -> tuple:
+    """Finds the paths to the pages of every chunk.
+
+    Args:
+        chunks (list): The output of cut_pagenumbers.
+        year_pages (list): List of paths to the pages of the year.
+
+    Returns:
+        tuple: The list of page paths of every chunk and the list of pages
+         that weren't found in year_pages.
+    """
+    # filename -> path, built once instead of searching all the pages of the
+    # year for every page
+    page_index = {}
+    for path in year_pages:
+        page_index.setdefault(os.path.basename(path), path)
+
+    chunk_pagepaths = []
+    unresolved = []
+    for chunk in chunks:
+        pagepaths = []
+        for pages in chunk.values():
+            for page in pages:
+                path = page_index.get(page)
+                if path is None:
+                    unresolved.append(page)
+                else:
+                    pagepaths.append(path)
+        chunk_pagepaths.append(pagepaths)
+    return chunk_pagepaths, unresolved
+
+
+def report_unresolved_pages(directory: str, unresolved: list) -> None:
+    """Logs all pages of the structure file that have no OCR page in the
+    directory at once.
+
+    Args:
+        directory (str): Path to the year directory.
+        unresolved (list): Filenames of the pages without path.
+    """
+    logging.error("ERROR: No path found for %s pages of %s: %s",
+                  len(unresolved), directory, ", ".join(unresolved[:10])
+                  + (", ..." if len(unresolved) > 10 else ""))
+    with open(LOG_PATH, mode="a", encoding="utf8") as log:
+        log.write(
+            "ERROR: Splitting {} no path found for {} pages: {}\n".format(
+                directory, len(unresolved), ", ".join(unresolved)
+            )
+        )
+
+
+def split_directory(directory: str, custom_xml_path=None,
+                    structure_cache=None):
     """Splits the given directory into chunks of pages.
 
     Args:
         directory (str): Path to the directory
         custom_xml_path (str, optional): _description_. Defaults to None.
+        structure_cache (str, optional): Directory of the structure cache
+         (PATH_TO_STRUCTURE_CACHE). Defaults to None, i.e.
+         utility.structure_cache.CACHE_DIR.
 
     Yields:
         dict: Dictionary with chunknames as key and list of pages as pathfiles as values
     """
 
     if custom_xml_path is not None:
-        xml = etree.parse(custom_xml_path).getroot()
+        xml_paths = [custom_xml_path]
     else:
         split_path = directory.split("/")
         short = split_path[-2]
         year = split_path[-1]
-        if short.startswith("bse"):
-            xml_storage = os.path.join(DATA2_MNT, "xml.cache.prod01", short,
-                                       "{0}-{1}.xml".format(
-                                        short.upper(), year))
-        else:
-            xml_storage = os.path.join(DATA2_MNT, "xml.cache.prod01", short,
-                                       "{0}_{1}.xml".format(
-                                        short, year))
-
-        try:
-            xml = etree.parse(xml_storage).getroot()
-        except Exception:
-            xml_storage = xml_storage.replace("prod01", "staging01")
-            xml = etree.parse(xml_storage).getroot()
-
-    returncode, pagenos = get_pagenumbers(xml)
+        if year.endswith(ARCHIVE_SUFFIX):
+            year = year[:-len(ARCHIVE_SUFFIX)]
+        xml_paths = get_structure_paths(DATA2_MNT, short, year)
+
+    # parsed once and shared with the postprocessing (see
+    # utility.structure_cache)
+    structure = load_structure(xml_paths, structure_cache)
+    if structure is None or structure["issues"] is None:
+        raise ValueError(
+            "No readable structure file for {}: {}".format(
+                directory, ", ".join(xml_paths))
+        )
+    returncode, pagenos = structure["returncode"], structure["issues"]
     if returncode != 0:
         with open(LOG_PATH, mode="a", encoding="utf8") as log:
             log.write(
@@ -309,26 +687,30 @@ def split_directory(directory: str, custom_xml_path=None):
     # that when part of the pipeline, we always get stuck at this point.
     # NOTE: It's smarter to just let it pass with an error, but note the error
     # in the log, so it can be fixed and processed again at a later point.
-    chunks = cut_pagenumbers(pagenos)
-
-    year_pages = glob.glob(directory+"/*.txt")
+    year_pages = list_year_pages(directory)
+
+    # the size of a page estimates its number of tokens, the chunks of a
+    # split year are balanced by it
+    page_weights = {}
+    if page_count > MAX_CHUNK_LENGTH:
+        page_paths = {os.path.basename(path): path for path in year_pages}
+        page_weights = {
+            page: get_page_size(page_paths[page])
+            for pages in pagenos.values()
+            for page in pages if page in page_paths
+        }
+    chunks = cut_pagenumbers(pagenos, MAX_CHUNK_LENGTH, MAX_ISSUE_LENGTH,
+                             articles=structure.get("articles"),
+                             page_weights=page_weights)
 
     returncode = compare_pagenames(pagenos, year_pages, page_count, directory)
 
-    for i, chunk in enumerate(chunks):
-        chunk_pagepaths = []
-        for issue, pages in chunk.items():
-            for page in pages:
-                found = False
-                for path in year_pages:
-                    if path.endswith(page):
-                        chunk_pagepaths.append(path)
-                        found = True
-                        break
-                if not found:
-                    print("ERROR: No path found for page {0}!".format(page))
-
-        yield i, chunk_pagepaths
+    chunk_pagepaths, unresolved = resolve_chunk_pages(chunks, year_pages)
+    if unresolved:
+        report_unresolved_pages(directory, unresolved)
+
+    for i, pagepaths in enumerate(chunk_pagepaths):
+        yield i, pagepaths
 
 
 if __name__ == "__main__":
@@ -0,0 +1,496 @@
+"""
+Local cache of the Agora structure files (xml.cache.prod01).
+
+The structure file of a magazine-year is needed twice: by
+utility.split_year.split_directory to cut the year into issues during prep
+and by src.postprocess.get_structure_info to get the articles of every page
+during post. Parsing it from the network mount takes long for large years,
+so it is parsed once, the information both stages need is distilled and
+saved as a small gzipped JSON file in PATH_TO_STRUCTURE_CACHE (CACHE_DIR by
+default). The cached file is used as long as the path (relative to the
+mount), size and mtime of the structure file didn't change. A structure file that can't be parsed is cached as
+well, so the fallback from prod01 to staging01 is only tried once.
+
+Large structure files (STREAM_MIN_SIZE) are read with iterparse by
+stream_structure, which clears every element as soon as it is indexed, so
+the memory of a worker doesn't grow with the region-level content.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+from lxml import etree
+
+CACHE_DIR = "./data/structure_cache"
+CACHE_VERSION = 2
+CACHE_SUFFIX = ".json.gz"
+# structure files from this size on are streamed with iterparse instead of
+# being loaded completely
+STREAM_MIN_SIZE = 32 * 1024 * 1024
+
+
+def get_structure_paths(mount: str, short: str, year: str) -> list:
+    """Returns the paths where the structure file of a year can be found,
+    in the order they are tried.
+
+    Args:
+        mount (str): The mount point of the structure files.
+        short (str): The magazine shortname.
+        year (str): The year.
+
+    Returns:
+        list: The paths in xml.cache.prod01 and xml.cache.staging01.
+    """
+    if short.startswith("bse"):
+        filename = "{0}-{1}.xml".format(short.upper(), year)
+    else:
+        filename = "{0}_{1}.xml".format(short, year)
+    prod_path = os.path.join(mount, "xml.cache.prod01", short, filename)
+    return [prod_path, prod_path.replace("prod01", "staging01")]
+
+
+def index_page_structure(root) -> dict:
+    """Walks the XML tree once and indexes everything get_page_structure
+    looks up. stream_structure builds the same index without loading the
+    whole tree.
+
+    Args:
+        root (etree): Root of the structure file.
+
+    Returns:
+        dict: "document_id", "pages": (ID, PhysicalNo, resource-id) of every
+         page, "links": to-ID -> from-IDs of the link-list, "journals": IDs
+         of the journals, "journal_elements": ID -> (type, ID of the
+         outermost Article ancestor) of the elements in the journals and
+         "resource_paths": resource ID -> Agora:Path.
+    """
+    document_id = root.find("./element-list/element[@type='Agora:Document']/attr[@type='Agora:DocumentID']")
+    pages = []
+    for page in root.iterfind("./element-list/element[@type='Agora:ImageSet']/element[@type='Agora:Page']"):
+        pagenum = page.find("./attr[@type='Agora:PhysicalNo']")
+        resource_id = page.find("./resource-id")
+        pages.append((
+            page.get("ID"),
+            None if pagenum is None else pagenum.text,
+            None if resource_id is None else resource_id.text,
+        ))
+    links = {}
+    for link in root.iterfind("./link-list/link"):
+        links.setdefault(link.get("to"), []).append(link.get("from"))
+    journals = set()
+    journal_elements = {}
+    for journal in root.iterfind("./element-list/element[@type='Journal']"):
+        journals.add(journal.get("ID"))
+        for elem in journal.iterdescendants("element"):
+            if elem.get("ID") in journal_elements:
+                continue
+            articles = [ancestor.get("ID") for ancestor
+                        in elem.iterancestors("element")
+                        if ancestor.get("type") == "Article"]
+            journal_elements[elem.get("ID")] = (
+                elem.get("type"), articles[-1] if articles else None
+            )
+    resource_paths = {}
+    for resource in root.iterfind("./resource-list/resource"):
+        path = resource.find("./attr[@type='Agora:Path']")
+        if path is not None:
+            resource_paths.setdefault(resource.get("ID"), path.text)
+    return {
+        "document_id": None if document_id is None else document_id.text,
+        "pages": pages,
+        "links": links,
+        "journals": journals,
+        "journal_elements": journal_elements,
+        "resource_paths": resource_paths,
+    }
+
+
+def get_page_structure(root) -> dict:
+    """Collects the document ID, physical page number and linked articles of
+    every page.
+
+    Args:
+        root (etree): Root of the structure file.
+
+    Returns:
+        dict: Page filename (e.g., "page1.txt") -> (pid, articles, pagenum),
+         see src.postprocess.get_structure_info.
+    """
+    return collect_page_articles(index_page_structure(root))
+
+
+def collect_page_articles(index: dict) -> dict:
+    """Finds the articles of every page in the index of a structure file.
+
+    Args:
+        index (dict): The output of index_page_structure.
+
+    Raises:
+        AttributeError: If the document ID, a page number or a resource is
+         missing.
+
+    Returns:
+        dict: Page filename (e.g., "page1.txt") -> (pid, articles, pagenum).
+    """
+    pages_to_articles = {}
+
+    document_id = index["document_id"]
+    if document_id is None:
+        raise AttributeError("No Agora:DocumentID")
+
+    for idx, pagenum, resource_id in index["pages"]:
+        if pagenum is None or resource_id is None:
+            raise AttributeError("Page {} is incomplete".format(idx))
+        articles = []
+        for article_idx in index["links"].get(idx, []):
+            # NOTE: Journal-level connections should usually be uninteresting,
+            # so we skip them specifically. For completeness sake, we might
+            # take them in as well though.
+            if article_idx in index["journals"]:
+                continue
+            articles.append(article_idx)
+
+            # if the first element found was not an article
+            # we look for the first ancestor being one
+            article_type, ancestor_idx = index["journal_elements"].get(
+                article_idx, ("Article", None)
+            )
+            if article_type == "Article" or ancestor_idx is None:
+                continue
+            articles.append(ancestor_idx)
+
+        path = index["resource_paths"].get(resource_id)
+        if path is None:
+            raise AttributeError("No path for resource {}".format(resource_id))
+        filename = os.path.basename(path).replace(".jpg", ".txt").lower()
+        pages_to_articles[filename] = (
+            document_id + ":" + idx,
+            articles,
+            pagenum
+        )
+
+    return pages_to_articles
+
+
+def distill_index(issue_index: dict, page_index: dict) -> dict:
+    """Extracts everything split_year and postprocess need from the indexes
+    of a structure file. If a part can't be read, it is None.
+
+    Args:
+        issue_index (dict): The output of split_year.index_structure.
+        page_index (dict): The output of index_page_structure.
+
+    Returns:
+        dict: "returncode" and "issues" of split_year.get_pagenumbers,
+         "articles" of split_year.collect_issue_articles and "pages" of
+         get_page_structure.
+    """
+    # imported here because split_year reads the structure files through
+    # this module
+    from utility.split_year import collect_issue_articles, collect_issue_pages
+
+    structure = {"returncode": None, "issues": None, "articles": None,
+                 "pages": None}
+    try:
+        structure["returncode"], structure["issues"] = \
+            collect_issue_pages(issue_index)
+        structure["articles"] = collect_issue_articles(issue_index)
+    except (AttributeError, TypeError):
+        logging.warning("Could not read the issues of the structure file.")
+    try:
+        structure["pages"] = collect_page_articles(page_index)
+    except (AttributeError, TypeError):
+        logging.warning("Could not read the pages of the structure file.")
+    return structure
+
+
+def distill_structure(root) -> dict:
+    """Extracts everything split_year and postprocess need from a structure
+    file. If a part can't be read, it is None.
+
+    Args:
+        root (etree): Root of the structure file.
+
+    Returns:
+        dict: See distill_index.
+    """
+    from utility.split_year import index_structure
+
+    return distill_index(index_structure(root), index_page_structure(root))
+
+
+def stream_structure(xml_path: str) -> dict:
+    """Like distill_structure(etree.parse(xml_path).getroot()), but the file
+    is read with iterparse and every element is cleared as soon as it is
+    indexed. Only the IDs, links and the few texts of the indexes are kept,
+    so the memory doesn't grow with the regions, coordinates and texts of
+    large structure files.
+
+    Args:
+        xml_path (str): Path to the structure file.
+
+    Returns:
+        dict: See distill_index.
+    """
+    issues = []
+    unstructured_paths = []
+    # element ID -> [resource-id] of the page it belongs to, the list is
+    # shared by the page and its regions and filled when the resource-id
+    # is read
+    resource_cells = {}
+    links_from = {}
+    resource_paths = {}
+    document_id = []
+    pages = []
+    links_to = {}
+    journals = set()
+    journal_elements = {}
+
+    # one record per open element: tag, ID, type, [resource-id], attrs,
+    # outermost Article ancestor, whether it is in a journal, the IDs of
+    # the child elements (only for issues)
+    stack = []
+    for event, elem in etree.iterparse(xml_path, events=("start", "end")):
+        depth = len(stack) - (event == "end")
+        parent = stack[depth - 1] if depth > 0 else None
+        if event == "start":
+            record = {"tag": elem.tag, "ID": elem.get("ID"),
+                      "type": elem.get("type"), "resource_id": [None],
+                      "has_resource_id": False, "attrs": {}, "article": None,
+                      "journal": False, "children": None}
+            stack.append(record)
+            if depth == 0:
+                continue
+            if parent["journal"]:
+                record["journal"] = True
+                record["article"] = parent["article"]
+                if record["article"] is None and parent["tag"] == "element" \
+                        and parent["type"] == "Article":
+                    record["article"] = parent["ID"]
+            if elem.tag != "element":
+                continue
+            if record["type"] == "Issue":
+                record["children"] = []
+                issues.append(record)
+            if parent["children"] is not None:
+                parent["children"].append(record["ID"])
+            if record["ID"] not in resource_cells:
+                resource_cells[record["ID"]] = record["resource_id"] \
+                    if record["type"] == "Agora:Page" \
+                    else parent["resource_id"]
+            if record["journal"]:
+                journal_elements.setdefault(
+                    record["ID"], (record["type"], record["article"])
+                )
+            elif depth == 2 and parent["tag"] == "element-list" \
+                    and record["type"] == "Journal":
+                record["journal"] = True
+                journals.add(record["ID"])
+            if depth == 3 and record["type"] == "Agora:Page" \
+                    and parent["type"] == "Agora:ImageSet" \
+                    and stack[1]["tag"] == "element-list":
+                pages.append(record)
+            continue
+
+        record = stack.pop()
+        if elem.tag == "resource-id" and parent is not None \
+                and not parent["has_resource_id"]:
+            parent["resource_id"][0] = elem.text
+            parent["has_resource_id"] = True
+        elif elem.tag == "attr" and parent is not None:
+            attr_type = elem.get("type")
+            parent["attrs"].setdefault(attr_type, elem.text)
+            if depth == 3 and parent["tag"] == "resource" \
+                    and stack[1]["tag"] == "resource-list" \
+                    and attr_type == "Agora:Path":
+                unstructured_paths.append(elem.text)
+            if depth == 3 and parent["type"] == "Agora:Document" \
+                    and stack[1]["tag"] == "element-list" \
+                    and attr_type == "Agora:DocumentID" and not document_id:
+                document_id.append(elem.text)
+        elif elem.tag == "link" and depth > 0:
+            links_from.setdefault(elem.get("from"), []).append(elem.get("to"))
+            if depth == 2 and parent["tag"] == "link-list":
+                links_to.setdefault(elem.get("to"), []).append(
+                    elem.get("from"))
+        elif elem.tag == "resource" and depth == 2 \
+                and parent["tag"] == "resource-list" \
+                and "Agora:Path" in record["attrs"]:
+            resource_paths.setdefault(record["ID"],
+                                      record["attrs"]["Agora:Path"])
+
+        # free the parsed element and its already indexed siblings
+        elem.clear()
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+
+    issue_index = {
+        "issues": [
+            (issue["attrs"].get("IssueNumber"),
+             issue["children"] + [issue["ID"]])
+            for issue in issues
+        ],
+        "unstructured_paths": unstructured_paths,
+        "resource_ids": {
+            idx: cell[0] for idx, cell in resource_cells.items()
+        },
+        "links": links_from,
+        "resource_paths": resource_paths,
+    }
+    page_index = {
+        "document_id": document_id[0] if document_id else None,
+        "pages": [
+            (page["ID"], page["attrs"].get("Agora:PhysicalNo"),
+             page["resource_id"][0])
+            for page in pages
+        ],
+        "links": links_to,
+        "journals": journals,
+        "journal_elements": journal_elements,
+        "resource_paths": resource_paths,
+    }
+    return distill_index(issue_index, page_index)
+
+
+def get_cache_path(xml_path: str, cache_dir: str = None) -> str:
+    """Returns the path of the cached structure of a structure file.
+
+    The key is the path from "xml.cache.*" on, so the same file is found in
+    the cache regardless of where the network drive is mounted.
+
+    Args:
+        xml_path (str): Path to the structure file.
+        cache_dir (str, optional): The cache directory. Defaults to None,
+         i.e. CACHE_DIR.
+
+    Returns:
+        str: Path of the gzipped JSON file in the cache directory.
+    """
+    key = get_cache_key(xml_path)
+    digest = hashlib.sha1(key.encode("utf8")).hexdigest()[:12]
+    return "{}/{}.{}{}".format((cache_dir or CACHE_DIR).rstrip("/"),
+                               os.path.basename(xml_path), digest,
+                               CACHE_SUFFIX)
+
+
+def get_cache_key(xml_path: str) -> str:
+    """The path of the structure file from "xml.cache.*" on, or the absolute
+    path for files outside of the cache directories."""
+    xml_path = os.path.abspath(xml_path)
+    position = xml_path.find("xml.cache.")
+    return xml_path[position:] if position >= 0 else xml_path
+
+
+def read_cached_structure(xml_path: str, stat: os.stat_result,
+                          cache_dir: str = None):
+    """Reads the cached structure if it belongs to this version of the
+    structure file.
+
+    Args:
+        xml_path (str): Path to the structure file.
+        stat (os.stat_result): The stat of the structure file.
+        cache_dir (str, optional): The cache directory. Defaults to None,
+         i.e. CACHE_DIR.
+
+    Returns:
+        dict: The cached structure (None if the file couldn't be parsed), or
+         False if there is no valid cache entry.
+    """
+    try:
+        with gzip.open(get_cache_path(xml_path, cache_dir), mode="rt",
+                       encoding="utf8") as inf:
+            cached = json.load(inf)
+    except (OSError, ValueError):
+        return False
+    if cached.get("version") != CACHE_VERSION \
+            or cached.get("source") != get_cache_key(xml_path) \
+            or cached.get("size") != stat.st_size \
+            or cached.get("mtime") != stat.st_mtime_ns:
+        return False
+    structure = cached["structure"]
+    if structure is not None and structure["pages"] is not None:
+        structure["pages"] = {
+            filename: tuple(info)
+            for filename, info in structure["pages"].items()
+        }
+    return structure
+
+
+def write_cached_structure(xml_path: str, stat: os.stat_result,
+                           structure, cache_dir: str = None) -> None:
+    """Saves the distilled structure (None if the file couldn't be parsed).
+
+    Args:
+        xml_path (str): Path to the structure file.
+        stat (os.stat_result): The stat of the structure file when it was
+         parsed.
+        structure (dict): The output of distill_structure or None.
+        cache_dir (str, optional): The cache directory. Defaults to None,
+         i.e. CACHE_DIR.
+    """
+    cache_dir = cache_dir or CACHE_DIR
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        with gzip.open(os.fdopen(fd, mode="wb"), mode="wt",
+                       encoding="utf8") as out:
+            json.dump({
+                "version": CACHE_VERSION,
+                "source": get_cache_key(xml_path),
+                "size": stat.st_size,
+                "mtime": stat.st_mtime_ns,
+                "structure": structure,
+            }, out)
+        os.replace(tmp_path, get_cache_path(xml_path, cache_dir))
+    except OSError:
+        logging.warning("Could not cache the structure of %s.", xml_path)
+
+
+def load_structure(xml_paths: list, cache_dir: str = None):
+    """Returns the distilled structure of the first of the given structure
+    files that can be parsed, from the cache if possible.
+
+    Args:
+        xml_paths (list): Paths to try, e.g. the output of
+         get_structure_paths.
+        cache_dir (str, optional): The cache directory, i.e.
+         PATH_TO_STRUCTURE_CACHE from the conf. Defaults to None, i.e.
+         CACHE_DIR.
+
+    Returns:
+        dict: The output of distill_structure (or stream_structure for large
+         files), or None if none of the files could be parsed.
+    """
+    for xml_path in xml_paths:
+        try:
+            stat = os.stat(xml_path)
+        except OSError:
+            stat = None
+        if stat is not None:
+            structure = read_cached_structure(xml_path, stat, cache_dir)
+            if structure is not False:
+                if structure is not None:
+                    return structure
+                # parsing failed before, try the next path
+                continue
+        if stat is not None and stat.st_size >= STREAM_MIN_SIZE:
+            try:
+                structure = stream_structure(xml_path)
+            except Exception:
+                structure = None
+        else:
+            try:
+                root = etree.parse(xml_path).getroot()
+            except Exception:
+                structure = None
+            else:
+                structure = distill_structure(root)
+                del root
+        if stat is not None:
+            write_cached_structure(xml_path, stat, structure, cache_dir)
+        if structure is not None:
+            return structure
+    return None
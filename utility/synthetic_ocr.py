@@ -0,0 +1,332 @@
+"""
+Generator for synthetic OCR pages in the input format of the pipeline.
+
+Every line of a page is "word x,y,w,h", paragraphs end with "<EOS>" and
+"<EOP>" and the first line is the size of the page. The pages contain
+uppercase headers, words hyphenated at the end of a line with "¬" or "-",
+punctuation, numbers and abbreviations from the abbreviation file. Title
+pages, normal pages and dense pages (e.g. tables of contents) are mixed, so
+the number of tokens per page varies like in the real magazines.
+
+generate_structure_xml writes a matching Agora structure file with issues,
+articles, pages, regions, links and resources like the files in
+xml.cache.prod01.
+
+Run from the repository root:
+    python -m utility.synthetic_ocr --output /tmp/synthetic --pages 5000
+"""
+import argparse
+import os
+import random
+
+from lxml import etree
+
+PAGE_WIDTH = 2200
+PAGE_HEIGHT = 2370
+LINE_HEIGHT = 30
+CHAR_WIDTH = 14
+WORDS_PER_LINE = 8
+
+WORDS = [
+    "der", "die", "das", "und", "in", "zu", "den", "mit", "von", "sich",
+    "nicht", "auf", "für", "ist", "im", "dem", "ein", "eine", "als", "auch",
+    "es", "an", "werden", "aus", "er", "hat", "dass", "sie", "nach", "wird",
+    "bei", "einer", "um", "am", "sind", "noch", "wie", "einem", "über",
+    "so", "zum", "kann", "seit", "wurde", "durch", "unter", "zwischen",
+    "Gemeinde", "Versammlung", "Jahr", "Schule", "Verein", "Kirche", "Haus",
+    "Präsident", "Mitglieder", "Bevölkerung", "Rechnung", "Kommission",
+    "Gemeinderat", "Bürger", "Zeit", "Arbeit", "Geschichte", "Leben",
+    "Generalversammlung", "Verwaltung", "Bezahlung", "Abstimmung", "Kanton",
+    "Landwirtschaft", "Entwicklung", "Zusammenarbeit", "Veranstaltung",
+    "neue", "grosse", "wichtige", "letzten", "ersten", "öffentlichen",
+    "beschlossen", "gewählt", "eröffnet", "durchgeführt", "besprochen",
+    "Hans", "Peter", "Maria", "Anna", "Müller", "Meier", "Schmid", "Keller",
+    "Zürich", "Bern", "Luzern", "Basel", "Oberwil", "Fischli-Boson",
+]
+PUNCTUATION = [",", ",", ".", ".", ":", ";", "!", "?"]
+
+
+def load_abbreviations(abbreviation_file: str) -> list:
+    """Reads the abbreviations, one list of words per abbreviation.
+
+    Args:
+        abbreviation_file (str): Path to the abbreviation file.
+
+    Returns:
+        list: The abbreviations as lists of words.
+    """
+    with open(abbreviation_file, encoding="utf8") as inf:
+        return [line.split() for line in inf if line.strip()]
+
+
+def generate_text(rng: random.Random, abbreviations: list,
+                  word_count: int) -> list:
+    """Generates the words of a page, without coordinates.
+
+    Args:
+        rng (random.Random): The random generator.
+        abbreviations (list): Abbreviations as lists of words.
+        word_count (int): Approximate number of words.
+
+    Returns:
+        list: Paragraphs as lists of words, the first paragraph is an
+         uppercase header.
+    """
+    header = [rng.choice(WORDS).upper() for _ in range(rng.randint(1, 4))]
+    paragraphs = [header]
+    paragraph = []
+    while sum(map(len, paragraphs)) + len(paragraph) < word_count:
+        roll = rng.random()
+        if roll < 0.04 and abbreviations:
+            paragraph.extend(rng.choice(abbreviations))
+        elif roll < 0.08:
+            paragraph.append(str(rng.randint(1, 2020)))
+        elif roll < 0.1:
+            paragraph.append("(" + rng.choice(WORDS) + ")")
+        else:
+            word = rng.choice(WORDS)
+            if not paragraph:
+                word = word[0].upper() + word[1:]
+            if rng.random() < 0.12:
+                word += rng.choice(PUNCTUATION)
+            paragraph.append(word)
+        if len(paragraph) > 20 and rng.random() < 0.05:
+            paragraph[-1] = paragraph[-1].rstrip(",;:") + "."
+            paragraphs.append(paragraph)
+            paragraph = []
+    if paragraph:
+        paragraphs.append(paragraph)
+    return paragraphs
+
+
+def layout_page(rng: random.Random, paragraphs: list) -> str:
+    """Puts the words on lines and adds the coordinates. Long words at the
+    end of a line are hyphenated.
+
+    Args:
+        rng (random.Random): The random generator.
+        paragraphs (list): Paragraphs as lists of words.
+
+    Returns:
+        str: The page in the OCR format.
+    """
+    lines = ["{},{}".format(PAGE_WIDTH, PAGE_HEIGHT)]
+    y = 90
+    for paragraph in paragraphs:
+        height = 55 if paragraph[0].isupper() and len(paragraph) < 5 else 24
+        x = 420
+        words_on_line = 0
+        for word in paragraph:
+            words_on_line += 1
+            end_of_line = words_on_line >= WORDS_PER_LINE
+            if end_of_line and len(word) > 7 and word.isalpha():
+                # hyphenated line break, mostly with ¬ and sometimes with -
+                cut = rng.randint(3, len(word) - 3)
+                mark = "¬" if rng.random() < 0.8 else "-"
+                parts = [word[:cut] + mark, word[cut:]]
+            else:
+                parts = [word]
+            for i, part in enumerate(parts):
+                if i > 0:
+                    # the rest of the word starts the next line
+                    x = 420
+                    y += LINE_HEIGHT
+                    words_on_line = 1
+                width = CHAR_WIDTH * len(part)
+                lines.append("{} {},{},{},{}".format(part, x, y, width,
+                                                     height))
+                x += width + CHAR_WIDTH
+            if end_of_line and len(parts) == 1:
+                x = 420
+                y += LINE_HEIGHT
+                words_on_line = 0
+        y += 2 * LINE_HEIGHT
+        lines.append("<EOS>")
+        lines.append("<EOP>")
+    return "\n".join(lines) + "\n"
+
+
+def generate_page(rng: random.Random, abbreviations: list,
+                  words_per_page: int = 400) -> str:
+    """Generates a single page. About one page in ten is a title page with
+    few words and one in ten is a dense page with three times as many.
+
+    Args:
+        rng (random.Random): The random generator.
+        abbreviations (list): Abbreviations as lists of words.
+        words_per_page (int, optional): Mean number of words of a normal
+         page. Defaults to 400.
+
+    Returns:
+        str: The page in the OCR format.
+    """
+    roll = rng.random()
+    if roll < 0.1:
+        word_count = rng.randint(5, 40)
+    elif roll < 0.2:
+        word_count = 3 * words_per_page
+    else:
+        word_count = int(words_per_page * rng.uniform(0.7, 1.3))
+    return layout_page(rng, generate_text(rng, abbreviations, word_count))
+
+
+def generate_year(outfolder: str,
+                  pages: int,
+                  magazine: str = "syn",
+                  year: str = "2000_000",
+                  words_per_page: int = 400,
+                  seed: int = 0,
+                  abbreviation_file: str = "./src/preprocessing/abbrevs.txt"
+                  ) -> list:
+    """Writes a synthetic year directory outfolder/magazine/year.
+
+    Args:
+        outfolder (str): The input folder to write into.
+        pages (int): Number of pages.
+        magazine (str, optional): Magazine shortname. Defaults to "syn".
+        year (str, optional): Name of the year. Defaults to "2000_000".
+        words_per_page (int, optional): Mean number of words of a normal
+         page. Defaults to 400.
+        seed (int, optional): Seed of the random generator, the same seed
+         gives the same pages. Defaults to 0.
+        abbreviation_file (str, optional): Abbreviations to use in the text.
+         Defaults to "./src/preprocessing/abbrevs.txt".
+
+    Returns:
+        list: Paths to the written pages.
+    """
+    rng = random.Random(seed)
+    abbreviations = load_abbreviations(abbreviation_file)
+    year_directory = os.path.join(outfolder, magazine, year)
+    os.makedirs(year_directory, exist_ok=True)
+    paths = []
+    for number in range(1, pages + 1):
+        path = os.path.join(year_directory, "{}-001_{}_{:04}.txt".format(
+            magazine, year, number
+        ))
+        with open(path, mode="w", encoding="utf8") as out:
+            out.write(generate_page(rng, abbreviations, words_per_page))
+        paths.append(path)
+    return paths
+
+
+def generate_structure_xml(path: str,
+                           pages: int,
+                           magazine: str = "syn",
+                           year: str = "2000_000",
+                           pages_per_issue: int = 50,
+                           pages_per_article: int = 4,
+                           regions_per_page: int = 3,
+                           seed: int = 0) -> None:
+    """Writes a synthetic Agora structure file for the pages of
+    generate_year, with the document, the pages and their regions, the
+    journal with issues, articles and paragraphs, the links and the
+    resources. The articles link to their pages and, like in the real
+    files, sometimes to a region of a page instead; some paragraphs are
+    linked as well.
+
+    Args:
+        path (str): Path of the XML file.
+        pages (int): Number of pages.
+        magazine (str, optional): Magazine shortname. Defaults to "syn".
+        year (str, optional): Name of the year. Defaults to "2000_000".
+        pages_per_issue (int, optional): Number of pages of an issue.
+         Defaults to 50.
+        pages_per_article (int, optional): Maximal number of pages of an
+         article. Defaults to 4.
+        regions_per_page (int, optional): Number of regions of a page, which
+         make up most of the size of real structure files. Defaults to 3.
+        seed (int, optional): Seed of the random generator. Defaults to 0.
+    """
+    rng = random.Random(seed)
+    root = etree.Element("agora")
+    elements = etree.SubElement(root, "element-list")
+    document = etree.SubElement(elements, "element", type="Agora:Document",
+                                ID="d")
+    etree.SubElement(document, "attr", type="Agora:DocumentID").text = \
+        "{}-{}".format(magazine, year)
+    image_set = etree.SubElement(elements, "element", type="Agora:ImageSet",
+                                 ID="s")
+    journal = etree.SubElement(elements, "element", type="Journal", ID="j")
+    links = etree.SubElement(root, "link-list")
+    resources = etree.SubElement(root, "resource-list")
+
+    for number in range(1, pages + 1):
+        resource_id = "r{}".format(number)
+        resource = etree.SubElement(resources, "resource", ID=resource_id)
+        etree.SubElement(resource, "attr", type="Agora:Path").text = \
+            "/data/{0}/{1}/{0}-001_{1}_{2:04}.jpg".format(magazine, year,
+                                                          number)
+        page = etree.SubElement(image_set, "element", type="Agora:Page",
+                                ID="p{}".format(number))
+        etree.SubElement(page, "attr", type="Agora:PhysicalNo").text = \
+            str(number)
+        for region in range(regions_per_page):
+            region = etree.SubElement(page, "element", type="Agora:Region",
+                                      ID="p{}-{}".format(number, region))
+            etree.SubElement(region, "attr", type="Agora:Coordinates").text \
+                = "{},{},{},{}".format(*(rng.randint(0, PAGE_WIDTH)
+                                         for _ in range(4)))
+            etree.SubElement(region, "attr", type="Agora:Text").text = \
+                " ".join(rng.choice(WORDS) for _ in range(20))
+        etree.SubElement(page, "resource-id").text = resource_id
+
+    article_id = 0
+    for first in range(1, pages + 1, pages_per_issue):
+        issue_id = "i{}".format(first)
+        issue = etree.SubElement(journal, "element", type="Issue",
+                                 ID=issue_id)
+        etree.SubElement(issue, "attr", type="IssueNumber").text = \
+            str(first // pages_per_issue + 1)
+        # the first page of the issue, e.g. the cover, is linked by the issue
+        etree.SubElement(links, "link", to="p{}".format(first),
+                         **{"from": issue_id})
+        last = min(first + pages_per_issue, pages + 1)
+        number = first
+        while number < last:
+            article_id += 1
+            article = etree.SubElement(issue, "element", type="Article",
+                                       ID="a{}".format(article_id))
+            paragraph = etree.SubElement(article, "element",
+                                         type="Paragraph",
+                                         ID="a{}-0".format(article_id))
+            length = rng.randint(1, pages_per_article)
+            for page in range(number, min(number + length, last)):
+                if rng.random() < 0.1:
+                    to = "p{}-{}".format(page,
+                                         rng.randrange(regions_per_page))
+                else:
+                    to = "p{}".format(page)
+                etree.SubElement(links, "link", to=to,
+                                 **{"from": article.get("ID")})
+                if rng.random() < 0.2:
+                    etree.SubElement(links, "link", to="p{}".format(page),
+                                     **{"from": paragraph.get("ID")})
+            number += length
+    etree.ElementTree(root).write(path, encoding="utf8",
+                                  xml_declaration=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", type=str, required=True)
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--words_per_page", type=int, default=400)
+    parser.add_argument("--magazine", type=str, default="syn")
+    parser.add_argument("--year", type=str, default="2000_000")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--abbreviations", type=str,
+        default="./src/preprocessing/abbrevs.txt"
+    )
+    args = parser.parse_args()
+
+    paths = generate_year(args.output, args.pages, args.magazine, args.year,
+                          args.words_per_page, args.seed, args.abbreviations)
+    print("Wrote {} pages to {}".format(
+        len(paths), os.path.join(args.output, args.magazine, args.year)
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,8 @@ import os
 import json
 import logging
 
+from utility.sharding import parse_shard
+
 
 def set_default(obj):
     """
@@ -62,6 +64,8 @@ def parse_arguments() -> argparse.Namespace:
         Default is "./configs/configurations.json".
         --eval_level (str): Evaluation level. Default is "ref".
         --fuzzy (str): Whether to use fuzzy matching. Default is True.
+        --shard (str): Only run shard i of N, given as "i/N" (e.g. "0/4").\
+        Default is None, i.e. no sharding.
     """
 
     parser = argparse.ArgumentParser()
@@ -82,6 +86,7 @@ def parse_arguments() -> argparse.Namespace:
             True, False, "True", "False", "true", "false", "1", "0", 1, 0
         ],
     )
+    parser.add_argument("--shard", type=parse_shard, default=None)
 
     args = parser.parse_args()
     return args